@@ -0,0 +1,605 @@
+"""
+Sophnet OpenAI-Compatible API Server - ASGI 模式
+上游使用 httpx 异步客户端，SSE 使用异步生成器，单进程可同时保持大量流式连接
+
+运行方式:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+    python asgi_app.py
+"""
+
+import os
+import json
+import time
+import asyncio
+import contextlib
+from typing import Dict, List, Optional, AsyncGenerator
+
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from main import (
+    logger,
+    SUPPORTED_MODELS,
+    UPSTREAM_POOL_MAXSIZE,
+    UPSTREAM_KEEPALIVE,
+    UPSTREAM_KEEPALIVE_IDLE,
+    AUTH_CHECKOUT_TIMEOUT,
+    AUTH_POOL_ADDRESS,
+    auth_pool,
+    api,
+    response_cache,
+    coalescer,
+    usage_meter,
+    initialize,
+    OpenAIStreamConverter,
+    CompletionBodyWriter,
+    NON_STREAM_BODY,
+    SophnetOpenAIAPI,
+    build_models_list,
+    build_health_status,
+    extract_completion_params,
+    use_passthrough,
+    wants_usage,
+    auth_wait_timeout,
+    error_body,
+    request_log,
+    replay_cached_stream,
+)
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    AUTH_CHECKOUT_WAIT_SECONDS,
+    UPSTREAM_RETRIES_TOTAL,
+    observe_stream,
+    render_metrics,
+)
+from tracing import NOOP_SPAN, NOOP_TRACE, SPAN_KIND_CLIENT, start_trace, atimed_input, atrace_stream
+from response_cache import cache_bypassed, cache_key, is_deterministic
+from coalescing import Flight, FlightFailed, flight_key
+
+# HTTP/2 需要安装 h2（pip install httpx[http2]），未安装时回退到 HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+UPSTREAM_HTTP2 = os.getenv('UPSTREAM_HTTP2', '1') != '0' and HTTP2_AVAILABLE
+
+# 追踪时记录的 httpcore 连接事件 -> span 属性
+TRACED_CONNECTION_EVENTS = {
+    'connection.connect_tcp': 'net.connect_ms',
+    'connection.start_tls': 'net.tls_ms',
+    'http11.receive_response_headers': 'upstream.headers_ms',
+    'http2.receive_response_headers': 'upstream.headers_ms',
+}
+
+
+def connection_trace_hook(span):
+    """httpx 的 trace 扩展回调：把建连、TLS 握手和等待响应头的耗时记到 span 上"""
+    started = {}
+
+    async def hook(event_name: str, info: Dict):
+        name, _, phase = event_name.rpartition('.')
+        attribute = TRACED_CONNECTION_EVENTS.get(name)
+        if attribute is None:
+            return
+        if phase == 'started':
+            started[name] = time.perf_counter()
+        elif name in started:
+            span.add(attribute, round((time.perf_counter() - started.pop(name)) * 1000, 3))
+
+    return hook
+
+
+async def aiter_sse_lines(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+    """按行迭代上游响应的原始 bytes，交给 UpstreamSSEParser 直接解析，省去逐行 decode"""
+    buffer = b''
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r')
+    if buffer:
+        yield buffer
+
+
+class AsyncSophnetClient:
+    """Sophnet 异步上游客户端，复用 SophnetOpenAIAPI 的请求构建逻辑和认证池"""
+
+    def __init__(self, api: SophnetOpenAIAPI, http2: bool = UPSTREAM_HTTP2,
+                 max_connections: int = UPSTREAM_POOL_MAXSIZE):
+        self.api = api
+        self.auth_pool = api.auth_pool
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections if UPSTREAM_KEEPALIVE else 0,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_IDLE
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        self._discarding = set()  # 正在关闭的对冲失败方或已取消请求的响应，持有引用避免任务被回收
+
+    async def call_sophnet_api(self, messages: List[Dict], model: str, stream: bool = False,
+                               auth_timeout: float = AUTH_CHECKOUT_TIMEOUT, trace=NOOP_TRACE,
+                               **kwargs) -> Optional[httpx.Response]:
+        """调用 Sophnet API，返回未读取的流式响应"""
+        max_retries = 3
+
+        for retry_count in range(max_retries):
+            # 本地认证池在事件循环上排队，共享认证池的进程间调用在专用线程池中执行
+            checkout_span = trace.span('auth.checkout', attributes={'attempt': retry_count + 1})
+            checkout_start = time.perf_counter()
+            auth = await self.auth_pool.aget_auth(auth_timeout)
+            AUTH_CHECKOUT_WAIT_SECONDS.observe(time.perf_counter() - checkout_start)
+            checkout_span.end()
+            if not auth:
+                checkout_span.error('no auth available')
+                logger.error("无法从池中获取认证")
+                return None
+            checkout_span.set('auth.id', auth.auth_id)
+            checkout_span.set('auth.use_count', auth.use_count)
+
+            url, headers, payload = self.api.build_upstream_request(auth, messages, model, stream, **kwargs)
+            request_span = trace.span('upstream.request', kind=SPAN_KIND_CLIENT,
+                                      attributes={'attempt': retry_count + 1, 'auth.id': auth.auth_id})
+            extensions = {'trace': connection_trace_hook(request_span)} if request_span.recording else None
+
+            try:
+                sent_at = time.perf_counter()
+                request = self.client.build_request('POST', url, headers=headers, json=payload, extensions=extensions)
+                if self.api.hedger.enabled:
+                    response, auth = await self.hedged_send(request, auth, messages, model, stream, trace, **kwargs)
+                    request_span.set('auth.id', auth.auth_id)
+                else:
+                    response = await self.client.send(request, stream=True)
+            except Exception as e:
+                logger.error(f"请求异常: {e}")
+                request_span.error(str(e))
+                request_span.end()
+                if retry_count < max_retries - 1:
+                    logger.info(f"🔄 请求异常，尝试使用下一个认证...")
+                    UPSTREAM_RETRIES_TOTAL.labels('network').inc()
+                    request_span.set('retry.cause', 'network')
+                    continue
+                return None
+
+            request_span.set('http.status_code', response.status_code)
+            request_span.set('http.version', response.http_version)
+            request_span.end()
+            if response.status_code == 200:
+                request_log.info("✅ API 调用成功 (Auth: %s, %s)", auth.auth_id, response.http_version)
+                response.upstream_started = sent_at  # 供流式生成器统计首字节和总耗时
+                return response
+
+            body = await response.aread()
+            await response.aclose()
+            logger.error("API 调用失败: %s (Auth: %s)", response.status_code, auth.auth_id)
+            logger.error("响应内容: %r", body[:500])
+
+            if response.status_code != 401:
+                # 对于其他错误，不重试直接返回None
+                return None
+
+            cause = 'other'
+            try:
+                if self.api.is_auth_expired_error(json.loads(body)):
+                    logger.warning(f"🔴 认证 {auth.auth_id} 已失效，从认证池中移除")
+                    # 移除认证会写 SQLite（共享池时是进程间调用），放到线程中执行
+                    await asyncio.to_thread(self.auth_pool.remove_auth, auth)
+                    cause = 'auth_expired'
+            except Exception:
+                pass
+
+            if retry_count < max_retries - 1:
+                logger.info(f"🔄 准备使用下一个认证重试...")
+                UPSTREAM_RETRIES_TOTAL.labels(cause).inc()
+                request_span.set('retry.cause', cause)
+
+        logger.error("所有重试都失败了")
+        return None
+
+    async def _timed_send(self, request: httpx.Request, model: str) -> httpx.Response:
+        """发送请求并记录响应头耗时；被取消时记录已等待的时间（下限），避免样本因对冲而偏小"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.send(request, stream=True)
+        except asyncio.CancelledError:
+            self.api.hedger.observe(model, time.perf_counter() - started)
+            raise
+        self.api.hedger.observe(model, time.perf_counter() - started)
+        return response
+
+    async def hedged_send(self, request: httpx.Request, auth, messages: List[Dict], model: str, stream: bool,
+                          trace=NOOP_TRACE, **kwargs):
+        """与 SophnetOpenAIAPI.hedged_post 一致，返回 (response, auth)；输掉竞速时还没有响应头的请求直接取消"""
+        hedger = self.api.hedger
+        hedger.admit()
+        primary = asyncio.ensure_future(self._timed_send(request, model))
+        delay = hedger.delay(model)
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result(), auth
+
+            if not hedger.try_acquire():
+                return await primary, auth
+            # 不等待地取用：已有请求排队等待认证时不插队，放弃对冲
+            hedge_auth = await self.auth_pool.atry_checkout()
+            if not hedge_auth:
+                hedger.refund()
+                return await primary, auth
+
+            request_log.info("⏱️ %.2fs 内没有收到响应，使用认证 %s 发出对冲请求", delay, hedge_auth.auth_id)
+            hedge_span = trace.span('upstream.hedge', kind=SPAN_KIND_CLIENT,
+                                    attributes={'auth.id': hedge_auth.auth_id,
+                                                'hedge.delay_ms': round(delay * 1000, 1)})
+            url, headers, payload = self.api.build_upstream_request(hedge_auth, messages, model, stream, **kwargs)
+            extensions = {'trace': connection_trace_hook(hedge_span)} if hedge_span.recording else None
+            hedge = asyncio.ensure_future(self._timed_send(
+                self.client.build_request('POST', url, headers=headers, json=payload, extensions=extensions), model
+            ))
+            auths = {primary: auth, hedge: hedge_auth}
+
+            winner = None
+            pending = {primary, hedge}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, hedge):
+                    if task in done and task.exception() is None and task.result().status_code == 200:
+                        winner = task
+                        break
+
+            outcome = 'primary_won' if winner is primary else 'hedge_won' if winner is hedge else 'both_failed'
+            hedger.record(outcome)
+            hedge_span.set('hedge.outcome', outcome)
+            hedge_span.end()
+            if winner is None:
+                winner = primary
+            loser = hedge if winner is primary else primary
+            self._discard(loser, auths[loser])
+            return winner.result(), auths[winner]
+        except asyncio.CancelledError:
+            # 客户端断开：两个请求都取消，已经收到的响应关闭
+            self._discard(primary, auth)
+            if hedge is not None:
+                self._discard(hedge, hedge_auth)
+            raise
+
+    def _discard(self, task: asyncio.Future, auth):
+        task.cancel()
+        discard = asyncio.ensure_future(self.discard_response(task, auth))
+        self._discarding.add(discard)
+        discard.add_done_callback(self._discarding.discard)
+
+    async def discard_response(self, task: asyncio.Future, auth):
+        """关闭输掉竞速的上游响应；认证失效时从池中移除"""
+        try:
+            response = await task
+        except BaseException:
+            return
+        try:
+            if response.status_code == 401 and self.api.is_auth_expired_error(json.loads(await response.aread())):
+                logger.warning(f"🔴 认证 {auth.auth_id} 已失效，从认证池中移除")
+                await asyncio.to_thread(self.auth_pool.remove_auth, auth)
+        except Exception:
+            pass
+        finally:
+            await response.aclose()
+
+    async def stream_generator(self, response: httpx.Response, model: str, span=NOOP_SPAN,
+                               cache_key: Optional[str] = None, messages: Optional[List[Dict]] = None,
+                               include_usage: bool = False) -> AsyncGenerator[str, None]:
+        """生成 OpenAI 格式的流式响应；cache_key 不为空时完整结束的响应写入缓存"""
+        usage = self.api.usage_meter.accountant(model, messages or [])
+        converter = OpenAIStreamConverter(model, record=cache_key is not None, usage=usage,
+                                          include_usage=include_usage)
+        first_byte_at = None
+        started = getattr(response, 'upstream_started', None)
+        lines = atimed_input(aiter_sse_lines(response), span, started)
+        try:
+            async for line in lines:
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                for chunk in converter.feed(line):
+                    yield chunk
+                if converter.done:
+                    if cache_key is not None:
+                        # 先写缓存再排空上游，排空失败不影响已完整生成的回答；磁盘缓存层会写 SQLite，放到线程中执行
+                        await asyncio.to_thread(self.api.store_response, cache_key, converter.content,
+                                                converter.reasoning, converter.reasoning_tokens)
+                    # 继续读同一个迭代器直到上游响应结束，让连接回到连接池（响应体已经在读取中，不能再用 aiter_raw）
+                    async for _ in lines:
+                        pass
+                    break
+        finally:
+            await response.aclose()
+            span.set('stream.tokens', converter.tokens)
+            span.set('usage.completion_tokens', usage.result()['completion_tokens'])
+            observe_stream(model, started, first_byte_at, converter.tokens)
+
+    async def passthrough_generator(self, response: httpx.Response, model: str,
+                                    span=NOOP_SPAN) -> AsyncGenerator[bytes, None]:
+        """原样转发上游 SSE 字节"""
+        first_byte_at = None
+        try:
+            async for chunk in atimed_input(response.aiter_bytes(), span, getattr(response, 'upstream_started', None)):
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                yield chunk
+        finally:
+            await response.aclose()
+            observe_stream(model, getattr(response, 'upstream_started', None), first_byte_at)
+
+    async def completion_body(self, response: httpx.Response, writer: CompletionBodyWriter, span=NOOP_SPAN,
+                              cache_key: Optional[str] = None,
+                              flight: Optional[Flight] = None) -> AsyncGenerator[bytes, None]:
+        """读取上游并逐段生成非流式 JSON 响应体（与 SophnetOpenAIAPI.completion_body 一致）"""
+        started = getattr(response, 'upstream_started', None)
+        first_byte_at = None
+        completed = False
+        try:
+            yield writer.start()
+            async for line in atimed_input(aiter_sse_lines(response), span, started):
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                piece = writer.feed(line)
+                if piece:
+                    yield piece
+                if writer.truncated:
+                    logger.warning(f"非流式回复超过 {writer.max_bytes} 字节，已截断")
+                    break
+            yield writer.finish()
+            completed = not writer.truncated
+        finally:
+            await response.aclose()
+            observe_stream(writer.model, started, first_byte_at)
+            if completed and cache_key is not None:
+                await asyncio.to_thread(self.api.store_response, cache_key, writer.content, writer.reasoning,
+                                        writer.reasoning_tokens)
+            if flight:
+                flight.finish(ok=completed, result=(writer.completion(), writer.usage.result()) if completed else None)
+
+    def get_connection_pool_status(self) -> Dict:
+        """获取上游连接池占用情况"""
+        pool = getattr(self.client._transport, '_pool', None)
+        connections = list(getattr(pool, 'connections', None) or [])
+        idle = 0
+        for connection in connections:
+            try:
+                idle += 1 if connection.is_idle() else 0
+            except Exception:
+                pass
+        return {
+            'http2': self.http2,
+            'max_connections': self.max_connections,
+            'connections': len(connections),
+            'in_use': len(connections) - idle,
+            'idle': idle
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+upstream = AsyncSophnetClient(api)
+
+
+async def list_models(request: Request):
+    """列出可用模型"""
+    return JSONResponse(build_models_list())
+
+
+async def chat_completions(request: Request):
+    """聊天完成接口"""
+    trace = start_trace('chat.completions', request.headers.get('traceparent'))
+    trace_headers = {'X-Trace-Id': trace.trace_id} if trace.sampled else None
+    try:
+        data = await request.json()
+        messages = data.get('messages', [])
+        model = data.get('model', 'DeepSeek-V3-Fast')
+        stream = data.get('stream', False)
+        trace.root.set('model', model)
+        trace.root.set('stream', bool(stream))
+
+        if model not in SUPPORTED_MODELS:
+            trace.root.set('http.status_code', 404)
+            trace.finish()
+            return JSONResponse(error_body(f"Model {model} not found", "invalid_request_error", "model_not_found"),
+                                status_code=404)
+
+        params = extract_completion_params(data)
+        passthrough = bool(stream) and use_passthrough(data, model, request.headers.get('X-Passthrough'))
+        include_usage = wants_usage(data)
+        key = None
+        flight = None
+        deterministic = is_deterministic(params)
+        coalesce = coalescer.applies(deterministic)
+        content_key = None
+        if (coalesce or (response_cache and deterministic)) and not cache_bypassed(request.headers.get('Cache-Control')):
+            content_key = cache_key(model, messages, params)
+        if response_cache and content_key and deterministic:
+            key = content_key
+            cached = await asyncio.to_thread(response_cache.get, key)
+            trace.root.set('cache', 'hit' if cached else 'miss')
+            if cached:
+                trace.root.set('http.status_code', 200)
+                trace.finish()
+                if stream:
+                    return StreamingResponse(replay_cached_stream(cached, model, messages, include_usage),
+                                             media_type='text/event-stream',
+                                             headers={'Cache-Control': 'no-cache', 'X-Cache': 'HIT'})
+                # 思考过程和回答分开计数，与实时响应和流式回放的 usage 一致
+                usage = usage_meter.usage_for_text(model, messages, cached.content, cached.reasoning)
+                return JSONResponse(api.format_openai_response(
+                    cached.final_content(), model, messages, reasoning_tokens=cached.reasoning_tokens, usage=usage
+                ), headers={'X-Cache': 'HIT'})
+        cache_headers = {'X-Cache': 'MISS'} if key else {}
+
+        # 相同请求正在进行时订阅它的结果，否则作为 leader 请求上游
+        if content_key and coalesce:
+            flight, leader = coalescer.join(flight_key(content_key, stream, passthrough, include_usage))
+            trace.root.set('coalesced', not leader)
+            if not leader:
+                trace.finish()
+                return await follow_flight(flight, model, messages, stream)
+
+        response = await upstream.call_sophnet_api(
+            messages=messages,
+            model=model,
+            stream=stream,
+            auth_timeout=auth_wait_timeout(request.headers.get('X-Auth-Wait')),
+            trace=trace,
+            **params
+        )
+
+        if not response:
+            if flight:
+                flight.finish(ok=False)
+            trace.root.error('upstream_error')
+            trace.root.set('http.status_code', 500)
+            trace.finish()
+            return JSONResponse(error_body("Failed to get response from Sophnet API", "api_error", "upstream_error"),
+                                status_code=500)
+
+        trace.root.set('http.status_code', 200)
+        if stream:
+            stream_span = trace.span('response.stream')
+            if passthrough:
+                stream_span.set('passthrough', True)
+                generator = upstream.passthrough_generator(response, model, stream_span)
+            else:
+                generator = upstream.stream_generator(response, model, stream_span, cache_key=key, messages=messages,
+                                                      include_usage=include_usage)
+            if flight:
+                # 上游由独立任务读取，leader 的客户端断开后订阅者仍能收到完整输出
+                leader_output = flight.alead()
+                flight.task = asyncio.create_task(flight.pump(generator))
+                generator = leader_output
+            return StreamingResponse(
+                # 流结束（或客户端断开）时结束 span 并导出 trace
+                atrace_stream(generator, trace, stream_span),
+                media_type='text/event-stream',
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no',
+                    **(trace_headers or {}),
+                    **cache_headers
+                }
+            )
+
+        # 上游 delta 直接编码进 JSON 响应体
+        writer = CompletionBodyWriter(model, usage_meter.accountant(model, messages),
+                                      record=key is not None or flight is not None)
+        if NON_STREAM_BODY == 'streamed':
+            span = trace.span('response.aggregate')
+            return StreamingResponse(
+                atrace_stream(upstream.completion_body(response, writer, span, key, flight), trace, span),
+                media_type='application/json',
+                headers={**(trace_headers or {}), **cache_headers}
+            )
+
+        # 收集片段后只拼接一次（BytesIO 写入再 getvalue 会复制两次）
+        with trace.span('response.aggregate') as span:
+            pieces = [piece async for piece in upstream.completion_body(response, writer, span, key, flight)]
+        trace.finish()
+        return Response(b''.join(pieces), media_type='application/json',
+                        headers={**(trace_headers or {}), **cache_headers})
+
+    except Exception as e:
+        logger.error(f"处理请求失败: {e}")
+        if flight:
+            flight.finish(ok=False)
+        trace.root.error(str(e))
+        trace.root.set('http.status_code', 500)
+        trace.finish()
+        return JSONResponse(error_body(str(e), "internal_error", "internal_error"), status_code=500)
+
+
+async def follow_flight(flight: Flight, model: str, messages: List[Dict], stream: bool):
+    """订阅进行中的相同请求（与 main.follow_flight 一致）"""
+    try:
+        if stream:
+            await flight.await_started()
+            return StreamingResponse(flight.asubscribe(), media_type='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+                'X-Coalesced': '1'
+            })
+        result, usage = await flight.await_result()
+    except FlightFailed as e:
+        return JSONResponse(error_body(str(e), "api_error", "upstream_error"), status_code=500)
+    return JSONResponse(api.format_openai_response(
+        result.final_content(), model, messages, reasoning_tokens=result.reasoning_tokens, usage=usage
+    ), headers={'X-Coalesced': '1'})
+
+
+async def health_check(request: Request):
+    """健康检查接口（共享认证池的状态查询是阻塞的进程间调用，放到线程中执行）"""
+    status = await asyncio.to_thread(build_health_status)
+    status["upstream_connections"] = upstream.get_connection_pool_status()
+    return JSONResponse(status)
+
+
+async def readiness_check(request: Request):
+    """就绪探针：预热中返回 503，就绪或降级（仍可服务）返回 200"""
+    readiness = (await asyncio.to_thread(auth_pool.get_pool_status)).get('readiness', 'degraded')
+    return JSONResponse({"readiness": readiness}, status_code=503 if readiness == 'warming' else 200)
+
+
+async def metrics(request: Request):
+    """Prometheus 指标（认证池指标的回调可能有进程间调用，放到线程中执行）"""
+    return Response(await asyncio.to_thread(render_metrics), media_type=METRICS_CONTENT_TYPE)
+
+
+async def pool_status(request: Request):
+    """获取认证池状态"""
+    return JSONResponse(await asyncio.to_thread(auth_pool.get_pool_status))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # 阻塞启动模式下初始化会等待认证池填充，放到线程中执行
+    await asyncio.to_thread(initialize)
+    yield
+    try:
+        # 共享认证池（serve.py）的刷新由认证池进程负责
+        if not AUTH_POOL_ADDRESS:
+            auth_pool.stop_refresh()
+    finally:
+        await upstream.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/v1/models', list_models, methods=['GET']),
+        Route('/v1/chat/completions', chat_completions, methods=['POST']),
+        Route('/health', health_check, methods=['GET']),
+        Route('/ready', readiness_check, methods=['GET']),
+        Route('/pool/status', pool_status, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    logger.info("="*50)
+    logger.info("🚀 Sophnet OpenAI 兼容 API 服务器 (ASGI)")
+    logger.info("📍 访问地址: http://localhost:8080")
+    logger.info(f"🔗 上游 HTTP/2: {'启用' if UPSTREAM_HTTP2 else '未启用'}")
+    logger.info("="*50)
+
+    uvicorn.run(app, host='0.0.0.0', port=8080)
@@ -0,0 +1,855 @@
+"""
+浏览器认证获取：使用 Playwright 打开 Sophnet 页面，拦截 completion 请求获取认证信息
+只有负责采集认证的进程才会导入本模块
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+import asyncio
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any
+from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+import queue
+
+from auth_pool import AuthInfo
+
+logger = logging.getLogger(__name__)
+
+# 认证页面资源拦截：逗号分隔，留空使用默认规则；RESOURCE_BLOCKING=0 关闭拦截
+RESOURCE_BLOCKING = os.getenv('RESOURCE_BLOCKING', '1') != '0'
+BLOCK_RESOURCE_TYPES = os.getenv('BLOCK_RESOURCE_TYPES', '')
+BLOCK_URL_PATTERNS = os.getenv('BLOCK_URL_PATTERNS', '')
+ALLOW_URL_PATTERNS = os.getenv('ALLOW_URL_PATTERNS', '')
+
+# User-Agent 池
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+]
+
+# Chromium 启动参数，配置为完全后台运行模式
+BROWSER_LAUNCH_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--no-sandbox',
+    '--disable-web-security',
+    '--disable-features=IsolateOrigins,site-per-process',
+    '--disable-gpu',  # 禁用GPU加速
+    '--no-first-run',  # 禁用首次运行提示
+    '--disable-background-timer-throttling',
+    '--disable-renderer-backgrounding',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-ipc-flooding-protection',
+    '--disable-default-apps',
+    '--disable-extensions',
+    '--disable-plugins',
+    '--disable-sync',
+    '--disable-translate',
+    '--hide-scrollbars',
+    '--mute-audio',
+    '--no-default-browser-check',
+    '--no-zygote',  # 完全禁用任何UI相关进程
+]
+
+# 浏览器上下文配置
+BROWSER_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'locale': 'zh-CN',
+    'timezone_id': 'Asia/Shanghai'
+}
+
+# 聊天输入框选择器，按优先级排列
+CHAT_INPUT_SELECTORS = [
+    'textarea[placeholder="请输入内容"]',
+    'textarea.el-textarea__inner',
+    'textarea[autofocus]',
+    '.el-textarea textarea'
+]
+
+# 未能获取 project_id 时使用的默认值
+DEFAULT_PROJECT_ID = "Ar79PWUQUAhjJOja2orHs"
+
+# 注入页面的 JavaScript 拦截器（备用方案）
+INTERCEPT_INIT_SCRIPT = """
+    // 拦截 fetch 请求
+    const originalFetch = window.fetch;
+    window.__interceptedRequests = [];
+    
+    window.fetch = async function(...args) {
+        const [url, options] = args;
+        
+        if (url.includes('/chat/completions')) {
+            // 保存请求信息
+            const requestInfo = {
+                url: url,
+                method: options?.method || 'GET',
+                headers: options?.headers || {},
+                body: options?.body || null,
+                timestamp: Date.now()
+            };
+            
+            window.__interceptedRequests.push(requestInfo);
+            console.log('Intercepted request:', requestInfo);
+            
+            // 将信息存储到 localStorage
+            localStorage.setItem('lastInterceptedRequest', JSON.stringify(requestInfo));
+        }
+        
+        return originalFetch.apply(this, args);
+    };
+"""
+
+
+def extract_project_id(url: str) -> Optional[str]:
+    """从 URL 中提取 project ID"""
+    if '/projects/' in url:
+        parts = url.split('/projects/')
+        if len(parts) > 1:
+            return parts[1].split('/')[0]
+    return None
+
+
+def format_cookie_header(cookies: List[Dict]) -> str:
+    """将浏览器 cookies 拼接为 Cookie 请求头"""
+    return '; '.join([f"{c['name']}={c['value']}" for c in cookies])
+
+
+def parse_intercepted_request(request) -> Optional[Dict[str, Any]]:
+    """解析拦截到的 completion API 请求，非目标请求返回 None"""
+    url = request.url
+    if '/chat/completions' not in url:
+        return None
+    
+    # 获取请求头
+    headers = request.headers
+    captured = {
+        'project_id': extract_project_id(url),
+        'auth_headers': {
+            'authorization': headers.get('authorization', ''),
+            'cookie': headers.get('cookie', ''),
+            'user-agent': headers.get('user-agent', ''),
+            'accept': headers.get('accept', ''),
+            'content-type': headers.get('content-type', 'application/json')
+        },
+        'captcha_data': {}
+    }
+    
+    # 获取请求体
+    post_data = request.post_data
+    if post_data:
+        try:
+            body_data = json.loads(post_data)
+            # 提取验证码数据
+            if 'verifyIntelligentCaptchaRequest' in body_data:
+                captured['captcha_data'] = body_data['verifyIntelligentCaptchaRequest']
+            
+            logger.info(f"✅ 成功拦截 API 请求")
+            logger.info(f"   Project ID: {captured['project_id']}")
+        except Exception as e:
+            logger.error(f"解析请求体失败: {e}")
+    
+    return captured
+
+
+def build_auth_info(project_id: Optional[str], auth_headers: Dict[str, str],
+                    captcha_data: Dict[str, Any]) -> Optional[AuthInfo]:
+    """补全默认值并构建最终认证信息"""
+    # 使用默认值作为最后手段
+    if not project_id:
+        logger.warning("⚠️ 未能获取project_id，使用默认值")
+        project_id = DEFAULT_PROJECT_ID
+    
+    # 设置基本的认证头
+    if not auth_headers.get('user-agent'):
+        auth_headers['user-agent'] = random.choice(USER_AGENTS)
+    
+    if not auth_headers.get('accept'):
+        auth_headers['accept'] = 'application/json'
+    
+    # 构建认证信息（即使没有完整信息也尝试构建）
+    if project_id and auth_headers.get('cookie'):
+        auth_info = AuthInfo(
+            project_id=project_id,
+            auth_headers=auth_headers,
+            captcha_data=captcha_data,
+            timestamp=time.time()
+        )
+        
+        logger.info(f"✅ 快速获取认证信息完成!")
+        logger.info(f"   Project ID: {auth_info.project_id}")
+        logger.info(f"   Auth ID: {auth_info.auth_id}")
+        logger.info(f"   有cookies: {bool(auth_info.auth_headers.get('cookie'))}")
+        logger.info(f"   有authorization: {bool(auth_info.auth_headers.get('authorization'))}")
+        
+        return auth_info
+    
+    logger.error("未能获取基本认证信息（project_id或cookies缺失）")
+    return None
+
+
+# 获取认证不需要的资源类型
+DEFAULT_BLOCKED_RESOURCE_TYPES = ['image', 'media', 'font', 'stylesheet', 'texttrack', 'manifest']
+
+# 统计分析、埋点等第三方请求
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    r'google-analytics\.com',
+    r'googletagmanager\.com',
+    r'hm\.baidu\.com',
+    r'cnzz\.com',
+    r'sentry',
+    r'\.(png|jpe?g|gif|webp|svg|ico|woff2?|ttf|otf|mp4|webm|mp3)(\?|$)',
+]
+
+# 永远放行的请求（优先于拦截规则）：验证码和 completion 接口
+DEFAULT_ALLOWED_URL_PATTERNS = [
+    r'/chat/completions',
+    r'captcha',
+]
+
+# 被拦截资源的平均体积估算（字节），用于统计节省的流量
+RESOURCE_SIZE_ESTIMATES = {
+    'image': 30 * 1024,
+    'media': 200 * 1024,
+    'font': 60 * 1024,
+    'stylesheet': 40 * 1024,
+    'script': 80 * 1024,
+}
+DEFAULT_RESOURCE_SIZE_ESTIMATE = 10 * 1024
+
+
+@dataclass
+class TrafficReport:
+    """单次认证获取的网络流量统计"""
+    blocked: int = 0
+    blocked_types: Dict[str, int] = field(default_factory=dict)
+    bytes_loaded: int = 0
+    bytes_saved: int = 0  # 根据 RESOURCE_SIZE_ESTIMATES 估算
+
+
+class ResourceFilter:
+    """认证页面资源过滤器：按资源类型和 URL 规则中止不需要的请求"""
+    
+    def __init__(self, blocked_types: Optional[List[str]] = None,
+                 blocked_url_patterns: Optional[List[str]] = None,
+                 allowed_url_patterns: Optional[List[str]] = None,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.blocked_types = set(DEFAULT_BLOCKED_RESOURCE_TYPES if blocked_types is None else blocked_types)
+        self.blocked_url_re = self._compile(DEFAULT_BLOCKED_URL_PATTERNS if blocked_url_patterns is None
+                                            else blocked_url_patterns)
+        self.allowed_url_re = self._compile(DEFAULT_ALLOWED_URL_PATTERNS if allowed_url_patterns is None
+                                            else allowed_url_patterns)
+        self.lock = threading.Lock()
+        self.stats = {
+            'fetches': 0,
+            'blocked_requests': 0,
+            'bytes_loaded': 0,
+            'bytes_saved_estimate': 0
+        }
+    
+    @staticmethod
+    def _compile(patterns: List[str]):
+        """把多个规则合并为一个正则，空列表返回 None"""
+        patterns = [p for p in patterns if p]
+        return re.compile('|'.join(f'(?:{p})' for p in patterns), re.IGNORECASE) if patterns else None
+    
+    @classmethod
+    def from_config(cls) -> 'ResourceFilter':
+        """根据环境变量配置创建过滤器"""
+        def split(value):
+            return [v.strip() for v in value.split(',') if v.strip()] if value else None
+        
+        return cls(
+            blocked_types=split(BLOCK_RESOURCE_TYPES),
+            blocked_url_patterns=split(BLOCK_URL_PATTERNS),
+            allowed_url_patterns=split(ALLOW_URL_PATTERNS),
+            enabled=RESOURCE_BLOCKING
+        )
+    
+    def should_block(self, resource_type: str, url: str) -> bool:
+        """判断请求是否应被中止"""
+        if not self.enabled:
+            return False
+        if self.allowed_url_re and self.allowed_url_re.search(url):
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        return bool(self.blocked_url_re and self.blocked_url_re.search(url))
+    
+    def record_blocked(self, report: TrafficReport, resource_type: str):
+        """记录一次被中止的请求"""
+        report.blocked += 1
+        report.blocked_types[resource_type] = report.blocked_types.get(resource_type, 0) + 1
+        report.bytes_saved += RESOURCE_SIZE_ESTIMATES.get(resource_type, DEFAULT_RESOURCE_SIZE_ESTIMATE)
+    
+    def record_response(self, report: TrafficReport, response):
+        """根据 content-length 记录实际下载的字节数"""
+        try:
+            report.bytes_loaded += int(response.headers.get('content-length', 0))
+        except (TypeError, ValueError):
+            pass
+    
+    def finish(self, report: TrafficReport):
+        """汇总单次获取的流量统计"""
+        with self.lock:
+            self.stats['fetches'] += 1
+            self.stats['blocked_requests'] += report.blocked
+            self.stats['bytes_loaded'] += report.bytes_loaded
+            self.stats['bytes_saved_estimate'] += report.bytes_saved
+        if report.blocked:
+            logger.info(f"🧹 拦截 {report.blocked} 个资源 {report.blocked_types}，"
+                        f"下载 {report.bytes_loaded / 1024:.1f}KB，约节省 {report.bytes_saved / 1024:.1f}KB")
+    
+    def get_stats(self) -> Dict:
+        """获取累计流量统计"""
+        with self.lock:
+            return {'enabled': self.enabled, **self.stats}
+
+
+class SophnetAuthFetcher:
+    """认证获取器 - 完全使用之前可工作的版本"""
+    
+    def __init__(self, headless: bool = True, persistent_browser: bool = True,
+                 browser_max_fetches: int = 50, resource_filter: Optional[ResourceFilter] = None):
+        self.base_url = "https://www.sophnet.com"
+        self.chat_url = "https://www.sophnet.com/#/playground/chat"
+        self.headless = True  # 强制设置为 True，确保后台运行
+        self.request_queue = queue.Queue()
+        self.resource_filter = resource_filter or ResourceFilter()
+        
+        # 常驻浏览器模式：浏览器进程保持运行，每次获取只新建独立的 BrowserContext
+        # Playwright 同步 API 绑定创建它的线程，因此每个线程持有自己的浏览器
+        self.persistent_browser = persistent_browser
+        self.browser_max_fetches = browser_max_fetches  # 达到次数后重启浏览器，防止内存增长
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'browser_launches': 0,
+            'browser_restarts': 0,
+            'total_fetches': 0
+        }
+        
+        # 记录浏览器配置
+        logger.info(f"SophnetAuthFetcher 初始化 - 无头模式: {self.headless}, 常驻浏览器: {self.persistent_browser}")
+        if not self.headless:
+            logger.warning("⚠️  浏览器将以有界面模式运行！")
+    
+    def _count(self, key: str):
+        """线程安全地累加统计计数"""
+        with self._stats_lock:
+            self.stats[key] += 1
+    
+    def _launch_browser(self, playwright):
+        """启动 Chromium，配置为完全后台运行模式"""
+        self._count('browser_launches')
+        return playwright.chromium.launch(
+            headless=True,  # 强制启用无头模式
+            args=BROWSER_LAUNCH_ARGS
+        )
+    
+    def _is_browser_healthy(self, browser) -> bool:
+        """检查常驻浏览器是否仍然连接"""
+        try:
+            return browser.is_connected()
+        except Exception:
+            return False
+    
+    def _get_browser(self):
+        """获取当前线程的常驻浏览器，崩溃或达到使用上限时自动重启"""
+        state = self._local
+        browser = getattr(state, 'browser', None)
+        
+        if browser is not None:
+            if not self._is_browser_healthy(browser):
+                logger.warning("⚠️ 常驻浏览器已断开，正在重启...")
+                self._count('browser_restarts')
+                self.close()
+            elif state.fetch_count >= self.browser_max_fetches:
+                logger.info(f"♻️ 常驻浏览器已服务 {state.fetch_count} 次，定期重启")
+                self.close()
+        
+        if getattr(state, 'browser', None) is None:
+            if getattr(state, 'playwright', None) is None:
+                state.playwright = sync_playwright().start()
+            state.browser = self._launch_browser(state.playwright)
+            state.fetch_count = 0
+            logger.info("🌐 常驻浏览器已启动")
+        
+        state.fetch_count += 1
+        return state.browser
+    
+    def close(self):
+        """关闭当前线程的常驻浏览器"""
+        state = self._local
+        browser = getattr(state, 'browser', None)
+        playwright = getattr(state, 'playwright', None)
+        state.browser = None
+        state.playwright = None
+        
+        if browser is not None:
+            try:
+                browser.close()
+            except Exception as e:
+                logger.debug(f"关闭浏览器失败: {e}")
+        if playwright is not None:
+            try:
+                playwright.stop()
+            except Exception as e:
+                logger.debug(f"停止 Playwright 失败: {e}")
+        
+    def fetch_auth(self) -> Optional[AuthInfo]:
+        """获取认证信息 - 完全复制之前可工作的方法"""
+        logger.info("正在通过浏览器获取认证信息...")
+        start_time = time.time()
+        self._count('total_fetches')
+        
+        playwright = None
+        browser = None
+        context = None
+        page = None
+        
+        # 每次获取使用独立的局部状态，允许多个线程并行获取
+        project_id = None
+        auth_headers = {}
+        captcha_data = {}
+        traffic = TrafficReport()
+        
+        try:
+            if self.persistent_browser:
+                # 复用常驻浏览器，每次只创建独立的上下文
+                browser = self._get_browser()
+            else:
+                playwright = sync_playwright().start()
+                browser = self._launch_browser(playwright)
+            
+            # 创建浏览器上下文 - 完全复制之前的配置
+            context = browser.new_context(**BROWSER_CONTEXT_OPTIONS)
+            
+            page = context.new_page()
+            
+            # 设置请求拦截器 - 完全复制之前的方法
+            def handle_route(route):
+                """处理拦截的请求"""
+                nonlocal project_id, auth_headers, captcha_data
+                request = route.request
+                
+                # 中止渲染输入框和发送请求不需要的资源
+                if self.resource_filter.should_block(request.resource_type, request.url):
+                    self.resource_filter.record_blocked(traffic, request.resource_type)
+                    route.abort()
+                    return
+                
+                captured = parse_intercepted_request(request)
+                if captured:
+                    project_id = captured['project_id'] or project_id
+                    auth_headers = captured['auth_headers']
+                    captcha_data = captured['captcha_data'] or captcha_data
+                
+                # 继续原始请求
+                route.continue_()
+            
+            # 拦截所有网络请求
+            page.route("**/*", handle_route)
+            page.on("response", lambda response: self.resource_filter.record_response(traffic, response))
+            
+            # 额外注入 JavaScript 拦截器（备用方案）- 完全复制之前的
+            page.add_init_script(INTERCEPT_INIT_SCRIPT)
+            
+            # 快速访问聊天页面，仅等待DOM加载完成
+            logger.info("正在快速加载聊天页面...")
+            page.goto(self.chat_url, wait_until='domcontentloaded')
+            
+            # 立即获取当前cookies
+            logger.info("正在提取初始cookies...")
+            cookies = context.cookies()
+            initial_cookies = format_cookie_header(cookies)
+            if initial_cookies:
+                auth_headers['cookie'] = initial_cookies
+                logger.info(f"✅ 获取到初始cookies: {len(cookies)} 个")
+            
+            # 短暂等待让页面基本渲染完成
+            time.sleep(1)
+            
+            # 尝试找到输入框，但不要求完全加载
+            logger.info("寻找聊天输入框...")
+            input_box = None
+            for selector in CHAT_INPUT_SELECTORS:
+                try:
+                    # 使用较短的超时时间
+                    page.wait_for_selector(selector, timeout=3000)
+                    input_box = page.locator(selector).first
+                    logger.info(f"✅ 找到输入框: {selector}")
+                    break
+                except:
+                    continue
+            
+            # 如果没找到输入框，尝试其他方法获取认证信息
+            if not input_box:
+                logger.warning("⚠️ 未找到输入框，尝试直接从页面获取认证信息...")
+                
+                # 尝试从页面的localStorage或其他地方获取信息
+                try:
+                    # 等待一下让页面JavaScript执行
+                    time.sleep(2)
+                    
+                    # 更新cookies
+                    cookies = context.cookies()
+                    updated_cookies = format_cookie_header(cookies)
+                    if updated_cookies:
+                        auth_headers['cookie'] = updated_cookies
+                        logger.info(f"✅ 更新cookies: {len(cookies)} 个")
+                    
+                    # 尝试从页面获取project_id
+                    try:
+                        url_project_id = extract_project_id(page.url)
+                        if url_project_id:
+                            project_id = url_project_id
+                            logger.info(f"✅ 从URL获取project_id: {project_id}")
+                    except:
+                        pass
+                    
+                except Exception as e:
+                    logger.warning(f"从页面获取认证信息失败: {e}")
+            
+            else:
+                # 如果找到输入框，发送快速测试消息
+                logger.info("发送测试消息...")
+                try:
+                    # 清空并输入消息
+                    input_box.click()
+                    time.sleep(0.3)  # 减少等待时间
+                    input_box.fill("test")
+                    time.sleep(0.3)  # 减少等待时间
+                    
+                    # 按回车发送
+                    input_box.press('Enter')
+                    logger.info("📤 已发送测试消息")
+                    
+                    # 等待请求被拦截，减少等待时间
+                    logger.info("等待拦截请求...")
+                    for i in range(5):  # 减少等待循环次数
+                        if project_id and auth_headers.get('authorization'):
+                            logger.info(f"✅ 成功获取认证信息 (等待 {i+1}秒)")
+                            break
+                        time.sleep(1)
+                        
+                        # 更新cookies
+                        cookies = context.cookies()
+                        updated_cookies = format_cookie_header(cookies)
+                        if updated_cookies:
+                            auth_headers['cookie'] = updated_cookies
+                        
+                except Exception as e:
+                    logger.warning(f"发送测试消息失败: {e}")
+            
+            # 最终检查和构建认证信息
+            logger.info("正在构建最终认证信息...")
+            
+            # 确保有基本的cookies
+            if not auth_headers.get('cookie'):
+                cookies = context.cookies()
+                if cookies:
+                    cookie_str = format_cookie_header(cookies)
+                    auth_headers['cookie'] = cookie_str
+                    logger.info(f"✅ 最终获取到cookies: {len(cookies)} 个")
+            
+            # 尝试从页面获取project_id（如果还没有）
+            if not project_id:
+                try:
+                    # 尝试从当前URL获取
+                    project_id = extract_project_id(page.url)
+                    if project_id:
+                        logger.info(f"✅ 从URL获取project_id: {project_id}")
+                    
+                    # 尝试从localStorage获取
+                    if not project_id:
+                        stored_data = page.evaluate("() => localStorage.getItem('lastInterceptedRequest')")
+                        if stored_data:
+                            data = json.loads(stored_data)
+                            logger.info(f"从localStorage获取到数据: {data.get('url', 'N/A')}")
+                except Exception as e:
+                    logger.warning(f"获取project_id失败: {e}")
+            
+            return build_auth_info(project_id, auth_headers, captcha_data)
+                
+        except Exception as e:
+            logger.error(f"获取认证失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+            
+        finally:
+            # 浏览器崩溃时关闭操作本身也会抛异常，这里全部忽略
+            for closable in (page, context):
+                if closable:
+                    try:
+                        closable.close()
+                    except Exception:
+                        pass
+            if not self.persistent_browser:
+                if browser:
+                    try:
+                        browser.close()
+                    except Exception:
+                        pass
+                if playwright:
+                    playwright.stop()
+            self.resource_filter.finish(traffic)
+            logger.info(f"⏱️ 认证获取耗时: {time.time() - start_time:.2f}秒")
+
+
+class AsyncSophnetAuthFetcher:
+    """异步认证获取器：在专用事件循环上运行 Playwright async API
+    
+    所有获取共享一个常驻浏览器，每次获取使用独立的 BrowserContext，
+    拦截到 authorization 头后立即完成，不再依赖固定的 sleep 轮询。
+    """
+    
+    def __init__(self, max_concurrent_pages: int = 4, intercept_timeout: float = 8.0,
+                 fetch_timeout: float = 45.0, browser_max_fetches: int = 50,
+                 resource_filter: Optional[ResourceFilter] = None):
+        self.base_url = "https://www.sophnet.com"
+        self.chat_url = "https://www.sophnet.com/#/playground/chat"
+        self.headless = True
+        self.max_concurrent_pages = max_concurrent_pages
+        self.intercept_timeout = intercept_timeout  # 发送测试消息后等待拦截的最长时间
+        self.fetch_timeout = fetch_timeout  # 同步调用方等待单次获取的最长时间
+        self.browser_max_fetches = browser_max_fetches
+        self.resource_filter = resource_filter or ResourceFilter()
+        
+        self.loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+        # 以下对象只在事件循环线程中访问
+        self._playwright = None
+        self._browser = None
+        self._browser_lock = None
+        self._page_semaphore = None
+        self._browser_fetches = 0
+        # 每个浏览器实例上进行中的获取数；被替换的旧浏览器等进行中的获取全部结束后再关闭
+        self._browser_users: Dict[Any, int] = {}
+        self.stats = {
+            'browser_launches': 0,
+            'browser_restarts': 0,
+            'total_fetches': 0
+        }
+        
+        logger.info(f"AsyncSophnetAuthFetcher 初始化 - 最大并发页面: {self.max_concurrent_pages}")
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """启动专用事件循环线程（首次调用时）"""
+        with self._loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True,
+                                                     name="auth-fetcher-loop")
+                self._loop_thread.start()
+            return self.loop
+    
+    async def _get_browser(self):
+        """获取常驻浏览器，崩溃或达到使用上限时自动重启"""
+        if self._browser_lock is None:
+            self._browser_lock = asyncio.Lock()
+            self._page_semaphore = asyncio.Semaphore(self.max_concurrent_pages)
+        
+        async with self._browser_lock:
+            if self._browser is not None:
+                if not self._browser.is_connected():
+                    logger.warning("⚠️ 常驻浏览器已断开，正在重启...")
+                    self.stats['browser_restarts'] += 1
+                    await self._retire_browser()
+                elif self._browser_fetches >= self.browser_max_fetches:
+                    logger.info(f"♻️ 常驻浏览器已服务 {self._browser_fetches} 次，定期重启")
+                    await self._retire_browser()
+            
+            if self._browser is None:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(
+                    headless=True,
+                    args=BROWSER_LAUNCH_ARGS
+                )
+                self._browser_fetches = 0
+                self.stats['browser_launches'] += 1
+                logger.info("🌐 常驻浏览器已启动 (async)")
+            
+            self._browser_fetches += 1
+            self._browser_users[self._browser] = self._browser_users.get(self._browser, 0) + 1
+            return self._browser
+    
+    async def _release_browser(self, browser):
+        """一次获取结束；已被替换的旧浏览器在最后一个获取结束时关闭"""
+        users = self._browser_users.get(browser, 0) - 1
+        if users > 0:
+            self._browser_users[browser] = users
+            return
+        self._browser_users.pop(browser, None)
+        if browser is not self._browser:
+            await self._shutdown_browser(browser)
+    
+    async def _retire_browser(self):
+        """新的获取改用新浏览器，旧浏览器上没有进行中的获取时立即关闭，否则由 _release_browser 关闭"""
+        browser, self._browser = self._browser, None
+        if browser is not None and not self._browser_users.get(browser):
+            self._browser_users.pop(browser, None)
+            await self._shutdown_browser(browser)
+    
+    async def _shutdown_browser(self, browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.debug(f"关闭浏览器失败: {e}")
+    
+    async def _close_browser(self):
+        """关闭常驻浏览器和等待关闭的旧浏览器（保留 Playwright 驱动）"""
+        browsers = set(self._browser_users)
+        if self._browser is not None:
+            browsers.add(self._browser)
+        self._browser = None
+        self._browser_users.clear()
+        for browser in browsers:
+            await self._shutdown_browser(browser)
+    
+    async def fetch_auth_async(self) -> Optional[AuthInfo]:
+        """获取认证信息（必须在 self.loop 上运行）"""
+        logger.info("正在通过浏览器获取认证信息 (async)...")
+        start_time = time.time()
+        self.stats['total_fetches'] += 1
+        
+        browser = None
+        context = None
+        project_id = None
+        auth_headers = {}
+        captcha_data = {}
+        traffic = TrafficReport()
+        intercepted = asyncio.get_running_loop().create_future()
+        
+        try:
+            browser = await self._get_browser()
+            
+            async with self._page_semaphore:
+                context = await browser.new_context(**BROWSER_CONTEXT_OPTIONS)
+                page = await context.new_page()
+                
+                async def handle_route(route):
+                    """处理拦截的请求，拿到 authorization 后立即唤醒等待方"""
+                    nonlocal project_id, auth_headers, captcha_data
+                    request = route.request
+                    
+                    if self.resource_filter.should_block(request.resource_type, request.url):
+                        self.resource_filter.record_blocked(traffic, request.resource_type)
+                        await route.abort()
+                        return
+                    
+                    captured = parse_intercepted_request(request)
+                    if captured:
+                        project_id = captured['project_id'] or project_id
+                        auth_headers = captured['auth_headers']
+                        captcha_data = captured['captcha_data'] or captcha_data
+                        if auth_headers.get('authorization') and not intercepted.done():
+                            intercepted.set_result(True)
+                    
+                    await route.continue_()
+                
+                await page.route("**/*", handle_route)
+                page.on("response", lambda response: self.resource_filter.record_response(traffic, response))
+                await page.add_init_script(INTERCEPT_INIT_SCRIPT)
+                
+                logger.info("正在快速加载聊天页面...")
+                await page.goto(self.chat_url, wait_until='domcontentloaded')
+                
+                # 同时等待所有候选选择器，任一出现即可
+                input_box = page.locator(', '.join(CHAT_INPUT_SELECTORS)).first
+                try:
+                    await input_box.wait_for(state='visible', timeout=5000)
+                except Exception:
+                    input_box = None
+                
+                if input_box is None:
+                    logger.warning("⚠️ 未找到输入框，尝试直接从页面获取认证信息...")
+                else:
+                    try:
+                        await input_box.fill("test")
+                        await input_box.press('Enter')
+                        logger.info("📤 已发送测试消息，等待拦截请求...")
+                        await asyncio.wait_for(intercepted, timeout=self.intercept_timeout)
+                        logger.info(f"✅ 成功获取认证信息 (耗时 {time.time() - start_time:.2f}秒)")
+                    except asyncio.TimeoutError:
+                        logger.warning(f"⚠️ {self.intercept_timeout}秒内未拦截到请求")
+                    except Exception as e:
+                        logger.warning(f"发送测试消息失败: {e}")
+                
+                # 拦截到的请求头不含 cookie，统一从上下文读取
+                cookies = await context.cookies()
+                if cookies:
+                    auth_headers['cookie'] = format_cookie_header(cookies)
+                    logger.info(f"✅ 获取到cookies: {len(cookies)} 个")
+                
+                if not project_id:
+                    project_id = extract_project_id(page.url)
+            
+            return build_auth_info(project_id, auth_headers, captcha_data)
+        
+        except Exception as e:
+            logger.error(f"获取认证失败: {e}")
+            return None
+        
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            if browser is not None:
+                await self._release_browser(browser)
+            self.resource_filter.finish(traffic)
+            logger.info(f"⏱️ 认证获取耗时: {time.time() - start_time:.2f}秒")
+    
+    def fetch_auth(self) -> Optional[AuthInfo]:
+        """同步接口：把获取任务投递到事件循环并等待结果，可被多个线程同时调用"""
+        future = asyncio.run_coroutine_threadsafe(self.fetch_auth_async(), self._ensure_loop())
+        try:
+            return future.result(timeout=self.fetch_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            logger.error(f"获取认证超时 ({self.fetch_timeout}秒)")
+            return None
+    
+    def close(self):
+        """关闭浏览器并停止事件循环"""
+        with self._loop_lock:
+            loop = self.loop
+            self.loop = None
+        if loop is None:
+            return
+        
+        async def shutdown():
+            await self._close_browser()
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+            # 锁和信号量绑定旧循环，重新启动时再创建
+            self._browser_lock = None
+            self._page_semaphore = None
+        
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=10)
+        except Exception as e:
+            logger.debug(f"关闭异步获取器失败: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if self._loop_thread:
+            self._loop_thread.join(timeout=5)
+            self._loop_thread = None
+        if not loop.is_running():
+            loop.close()
@@ -0,0 +1,964 @@
+"""
+认证池：认证信息、容量预测、快照存储、池管理和并行采集调度
+不依赖浏览器，纯转发的服务进程只需要这一部分
+"""
+
+import os
+import json
+import time
+import asyncio
+import uuid
+import heapq
+import queue
+import sqlite3
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any
+
+from metrics import AUTH_FETCH_SECONDS
+from log_setup import RequestLog
+
+logger = logging.getLogger(__name__)
+request_log = RequestLog(logger)
+
+# 认证池容量预测参数
+POOL_FORECAST_WINDOW = float(os.getenv('POOL_FORECAST_WINDOW', 60))  # 统计请求速率的时间窗口（秒）
+POOL_SAFETY_FACTOR = float(os.getenv('POOL_SAFETY_FACTOR', 1.5))  # 补充提前量的安全系数
+
+# 认证有效期（秒），上游约 5 分钟后失效
+AUTH_TTL = 300
+
+
+@dataclass
+class AuthInfo:
+    """认证信息数据类，增加使用计数"""
+    project_id: str
+    auth_headers: Dict[str, str]
+    captcha_data: Dict[str, Any]
+    timestamp: float
+    use_count: int = 0
+    max_uses: int = 10
+    auth_id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+    
+    def is_valid(self) -> bool:
+        """检查认证是否仍然可用"""
+        # 检查使用次数
+        if self.use_count >= self.max_uses:
+            return False
+        # 检查时间（超过5分钟也失效）
+        if (time.time() - self.timestamp) > AUTH_TTL:
+            return False
+        return True
+    
+    def use(self):
+        """使用一次认证"""
+        self.use_count += 1
+        request_log.debug("Auth %s 使用次数: %d/%d", self.auth_id, self.use_count, self.max_uses)
+
+
+def auth_heap_key(auth: AuthInfo) -> float:
+    """认证的排序键 (越低越好)
+    
+    评分 = 年龄(分钟) * 0.3 + 使用率 * 0.7。年龄项对所有认证同速增长，不影响相对顺序，
+    去掉与当前时间相关的部分后排序键只在使用次数变化时改变，可以直接放进堆里。
+    """
+    return (auth.use_count / auth.max_uses) * 0.7 - (auth.timestamp / 60) * 0.3
+
+
+class PoolForecaster:
+    """认证池容量预测：根据最近的请求到达率和认证消耗速度，预测池何时耗尽，给出补充目标和采集并发
+    
+    - 每个认证最多使用 max_uses 次，且 AUTH_TTL 秒后失效，两者中先到者决定认证的消耗速度
+    - 补充前置时间 = 单次采集耗时 × 安全系数 + 检查粒度，池中余量至少要覆盖这段时间内的请求
+    - 采集并发按 Little 定律估算：认证消耗速度 × 采集耗时
+    """
+    
+    def __init__(self, min_pool_size: int, max_pool_size: int, window: float = POOL_FORECAST_WINDOW,
+                 safety_factor: float = POOL_SAFETY_FACTOR, default_fetch_seconds: float = 15.0):
+        self.min_pool_size = min_pool_size
+        self.max_pool_size = max_pool_size
+        self.window = window
+        self.safety_factor = safety_factor
+        self.fetch_seconds = default_fetch_seconds  # 采集耗时的指数滑动平均
+        self.arrivals = deque()  # 每秒一个 [秒, 取用次数] 桶，由 arrival_rate 从左侧清理
+        self.arrival_total = 0
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.last_forecast = None
+    
+    def record_checkout(self):
+        """记录一次取用请求（包括池为空导致失败的请求）"""
+        second = int(time.time())
+        with self.lock:
+            if self.arrivals and self.arrivals[-1][0] == second:
+                self.arrivals[-1][1] += 1
+            else:
+                self.arrivals.append([second, 1])
+            self.arrival_total += 1
+    
+    def record_fetch(self, seconds: float, alpha: float = 0.3):
+        """记录一次成功采集的耗时"""
+        self.fetch_seconds = self.fetch_seconds * (1 - alpha) + seconds * alpha
+    
+    def arrival_rate(self, now: Optional[float] = None) -> float:
+        """最近窗口内的请求到达率（次/秒）"""
+        now = now or time.time()
+        cutoff = int(now - self.window)
+        with self.lock:
+            while self.arrivals and self.arrivals[0][0] < cutoff:
+                self.arrival_total -= self.arrivals.popleft()[1]
+            total = self.arrival_total
+        # 启动后不足一个窗口时按实际时长计算，避免低估
+        span = max(1.0, min(self.window, now - self.started))
+        return total / span
+    
+    def forecast(self, auths: List[AuthInfo], in_flight: int = 0, max_concurrency: int = 1,
+                 fetch_seconds: Optional[float] = None) -> Dict:
+        """根据当前有效认证预测耗尽时间、补充目标和采集并发"""
+        now = time.time()
+        rate = self.arrival_rate(now)
+        fetch_seconds = fetch_seconds or self.fetch_seconds
+        # 刷新线程按秒轮询，前置时间额外加上 1 秒的检查粒度
+        lead_time = fetch_seconds * self.safety_factor + 1.0
+        max_uses = auths[0].max_uses if auths else AuthInfo.max_uses
+        
+        # 池中剩余可用次数，以及在耗尽前还能撑多久（按次数用完或全部过期，取较早者）
+        remaining_uses = sum(a.max_uses - a.use_count for a in auths)
+        ttl_left = max((AUTH_TTL - (now - a.timestamp) for a in auths), default=0.0)
+        if rate > 0:
+            seconds_to_empty = min(remaining_uses / rate, ttl_left)
+        else:
+            seconds_to_empty = ttl_left
+        
+        # 目标池大小：最小值之外，再覆盖一个补充前置时间内的用量
+        target_size = self.min_pool_size + int(-(-rate * lead_time // max_uses))
+        target_size = max(self.min_pool_size, min(self.max_pool_size, target_size))
+        
+        # 认证消耗速度（个/秒）：按次数消耗和维持目标池大小的过期损耗，取较大者
+        burn_rate = max(rate / max_uses, target_size / AUTH_TTL)
+        concurrency = int(-(-burn_rate * lead_time // 1))
+        concurrency = max(1, min(max_concurrency, concurrency))
+        
+        # 在途采集也计入供给；临近耗尽（不足一个前置时间）时一次补足
+        deficit = max(0, target_size - len(auths) - in_flight)
+        if seconds_to_empty < lead_time:
+            deficit = max(deficit, concurrency - in_flight)
+        
+        self.last_forecast = {
+            'arrival_rate': round(rate, 3),
+            'burn_rate': round(burn_rate, 4),
+            'remaining_uses': remaining_uses,
+            'seconds_to_empty': round(seconds_to_empty, 1),
+            'fetch_seconds': round(fetch_seconds, 2),
+            'lead_time': round(lead_time, 1),
+            'target_size': target_size,
+            'harvest_concurrency': concurrency,
+            'in_flight': in_flight,
+            'to_fetch': deficit
+        }
+        return self.last_forecast
+
+
+class AuthStore:
+    """认证快照存储（SQLite）
+    
+    新认证加入时立即写入，使用次数由刷新线程定期同步，请求路径上不写盘。
+    多个进程可以共用同一个文件，每个进程只删除自己写入过的认证。
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.owned = set()  # 本进程写入过的 auth_id
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        os.chmod(path, 0o600)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS auths ('
+            'auth_id TEXT PRIMARY KEY, project_id TEXT, auth_headers TEXT, captcha_data TEXT, '
+            'timestamp REAL, use_count INTEGER, max_uses INTEGER)'
+        )
+    
+    def save(self, auths: List[AuthInfo]):
+        """写入或更新认证"""
+        rows = [(a.auth_id, a.project_id, json.dumps(a.auth_headers), json.dumps(a.captcha_data),
+                 a.timestamp, a.use_count, a.max_uses) for a in auths]
+        try:
+            with self.lock:
+                self.conn.executemany('INSERT OR REPLACE INTO auths VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                self.owned.update(a.auth_id for a in auths)
+        except sqlite3.Error as e:
+            logger.warning(f"保存认证快照失败: {e}")
+    
+    def delete(self, auth_ids):
+        """删除认证"""
+        auth_ids = list(auth_ids)
+        if not auth_ids:
+            return
+        try:
+            with self.lock:
+                self.conn.executemany('DELETE FROM auths WHERE auth_id = ?', [(i,) for i in auth_ids])
+                self.owned.difference_update(auth_ids)
+        except sqlite3.Error as e:
+            logger.warning(f"删除认证快照失败: {e}")
+    
+    def sync(self, auths: List[AuthInfo]):
+        """同步池中认证的使用次数，并删除本进程写入过但已不在池中的认证"""
+        current = {a.auth_id for a in auths}
+        self.save(auths)
+        self.delete(self.owned - current)
+    
+    def load_valid(self) -> List[AuthInfo]:
+        """加载仍在有效期内且未用完的认证，同时清理已失效的记录"""
+        try:
+            with self.lock:
+                self.conn.execute('DELETE FROM auths WHERE timestamp < ? OR use_count >= max_uses',
+                                  (time.time() - AUTH_TTL,))
+                rows = self.conn.execute(
+                    'SELECT auth_id, project_id, auth_headers, captcha_data, timestamp, use_count, max_uses '
+                    'FROM auths ORDER BY timestamp'
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"加载认证快照失败: {e}")
+            return []
+        
+        auths = []
+        for auth_id, project_id, auth_headers, captcha_data, timestamp, use_count, max_uses in rows:
+            auths.append(AuthInfo(
+                project_id=project_id,
+                auth_headers=json.loads(auth_headers),
+                captcha_data=json.loads(captcha_data),
+                timestamp=timestamp,
+                use_count=use_count,
+                max_uses=max_uses,
+                auth_id=auth_id
+            ))
+        return [a for a in auths if a.is_valid()]
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class AsyncWaiter:
+    """事件循环上排队等待认证的协程，与 threading.Condition 一样在持有池锁时被 notify()"""
+    __slots__ = ('loop', 'event')
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event = asyncio.Event()
+    
+    def notify(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+
+class AuthPool:
+    """认证信息池管理器 - 增强容错版
+    
+    可用认证按评分放在最小堆中，取用为 O(log n)；失效和被移除的条目在出堆时惰性丢弃，
+    过期认证按加入顺序从队首清理，请求路径上不再整池过滤重建。
+    """
+    
+    def __init__(self, min_pool_size=3, max_pool_size=10, store: Optional[AuthStore] = None):
+        self.min_pool_size = min_pool_size
+        self.max_pool_size = max_pool_size
+        self.pool: Dict[str, AuthInfo] = {}  # auth_id -> 认证，池中的全部认证
+        self._heap = []  # (排序键, 序号, 认证)，可能包含已移除的过期条目
+        self._age_order = deque()  # 按加入顺序排列，用于清理过期认证和淘汰最旧认证
+        self._seq = 0
+        self.lock = threading.Lock()
+        self.refresh_thread = None
+        self.stop_refresh_flag = False
+        self.stats = {
+            'total_created': 0,
+            'total_used': 0,
+            'total_expired': 0,
+            'total_failures': 0,
+            'recovery_attempts': 0,
+            'checkout_waits': 0,
+            'checkout_timeouts': 0
+        }
+        # 新增：失败追踪和自适应策略
+        self.consecutive_failures = 0
+        self.max_consecutive_failures = 5
+        self.backoff_multiplier = 1.0
+        self.last_success_time = time.time()
+        # 并行采集器（可选），为 None 时刷新线程串行获取
+        self.harvester = None
+        # 自适应容量预测
+        self.forecaster = PoolForecaster(min_pool_size, max_pool_size)
+        # 池为空时排队等待的调用方（FIFO），每个等待者一个共享 self.lock 的条件变量
+        self._waiters = deque()
+        # 提前唤醒刷新线程（有请求排队或池跌破目标时）
+        self.refresh_wakeup = threading.Event()
+        # 认证快照存储（可选）
+        self.store = store
+        # 池是否曾经达到最小值，用于区分预热中和降级
+        self.ready_once = False
+        
+    def add_auth(self, auth: AuthInfo):
+        """添加认证到池中 - 增强验证版"""
+        if not auth or not self._validate_auth_info(auth):
+            logger.warning("无效的认证信息，跳过添加")
+            return False
+            
+        with self.lock:
+            # 移除无效的认证
+            self._purge_expired()
+            self.pool[auth.auth_id] = auth
+            self._age_order.append(auth)
+            self._push(auth)
+            # 超出上限时先丢弃失效认证，仍超出再淘汰最旧的认证
+            if len(self.pool) > self.max_pool_size:
+                self.pool = {k: a for k, a in self.pool.items() if a.is_valid()}
+            while len(self.pool) > self.max_pool_size:
+                oldest = self._age_order.popleft()
+                if self.pool.get(oldest.auth_id) is oldest:
+                    del self.pool[oldest.auth_id]
+            self.stats['total_created'] += 1
+            # 唤醒队首的等待者
+            if self._waiters:
+                self._waiters[0].notify()
+            # 重置失败计数
+            self.consecutive_failures = 0
+            self.backoff_multiplier = 1.0
+            self.last_success_time = time.time()
+            current_size = len(self.pool)
+            if current_size >= self.min_pool_size:
+                self.ready_once = True
+        logger.info(f"✅ 添加认证 {auth.auth_id} 到池中，当前池大小: {current_size}")
+        if self.store:
+            self.store.save([auth])
+        return True
+    
+    def load_from_store(self) -> int:
+        """从快照加载仍有效的认证，返回加载数量"""
+        if not self.store:
+            return 0
+        restored = 0
+        for auth in self.store.load_valid()[-self.max_pool_size:]:
+            if self.add_auth(auth):
+                restored += 1
+        if restored:
+            logger.info(f"♻️ 从快照恢复 {restored} 个认证: {self.store.path}")
+        return restored
+    
+    def _push(self, auth: AuthInfo):
+        """将认证按当前排序键放入堆（调用方持有锁）"""
+        self._seq += 1
+        heapq.heappush(self._heap, (auth_heap_key(auth), self._seq, auth))
+    
+    def _purge_expired(self):
+        """从最旧一端清理超时或已移除的认证（调用方持有锁），均摊 O(1)"""
+        while self._age_order:
+            oldest = self._age_order[0]
+            if self.pool.get(oldest.auth_id) is not oldest:
+                self._age_order.popleft()
+            elif not oldest.is_valid():
+                self._age_order.popleft()
+                del self.pool[oldest.auth_id]
+            else:
+                break
+        # 堆中残留条目过多时重建一次
+        if len(self._heap) > 2 * len(self.pool) + 16:
+            self._heap = [entry for entry in self._heap if self.pool.get(entry[2].auth_id) is entry[2]]
+            heapq.heapify(self._heap)
+    
+    def _snapshot(self) -> List[AuthInfo]:
+        """获取当前有效认证的副本列表"""
+        with self.lock:
+            self._purge_expired()
+            auths = list(self.pool.values())
+        return [a for a in auths if a.is_valid()]
+    
+    def _validate_auth_info(self, auth: AuthInfo) -> bool:
+        """验证认证信息的完整性"""
+        if not auth.project_id:
+            logger.warning("认证缺少 project_id")
+            return False
+        
+        if not auth.auth_headers.get('cookie'):
+            logger.warning("认证缺少必要的 cookie")
+            return False
+            
+        # 检查关键 cookies
+        cookie_str = auth.auth_headers.get('cookie', '')
+        essential_cookies = ['sophnet_session', 'auth_token', 'user_id']  # 根据实际情况调整
+        has_essential = any(cookie in cookie_str for cookie in essential_cookies) or len(cookie_str) > 50
+        
+        if not has_essential:
+            logger.warning("认证缺少关键认证信息")
+            return False
+            
+        logger.info(f"认证 {auth.auth_id} 验证通过")
+        return True
+    
+    def remove_auth(self, auth: AuthInfo):
+        """从池中移除指定认证（按 auth_id 匹配，跨进程传回的副本也能移除）"""
+        with self.lock:
+            removed = self.pool.pop(auth.auth_id, None) is not None
+            if removed:
+                self.stats['total_expired'] += 1
+        if self.store:
+            self.store.delete([auth.auth_id])
+        if removed:
+            logger.info(f"移除失效认证 {auth.auth_id}")
+    
+    def get_auth(self, timeout: float = 0) -> Optional[AuthInfo]:
+        """从池中获取一个可用的认证 - 增强容错版
+        
+        timeout > 0 时，池中没有可用认证就按先来先到排队，新认证加入后由队首取用，超过期限返回 None。
+        已有人排队时不插队：timeout 为 0 的调用方直接返回 None。对冲请求使用 try_checkout。
+        """
+        self.forecaster.record_checkout()
+        with self.lock:
+            # 清理无效认证
+            self._purge_expired()
+            
+            # 选择最优认证：优先选择使用次数少且时间较新的；已有人排队时，新的调用方排到队尾
+            best_auth = None if self._waiters else self._select_best_auth()
+            if not best_auth and timeout > 0:
+                best_auth = self._wait_for_auth(time.time() + timeout)
+            checkout = self._checkout(best_auth)
+        
+        # 日志放在锁外，缩短临界区
+        return self._log_checkout(best_auth, *checkout)
+    
+    async def aget_auth(self, timeout: float = 0) -> Optional[AuthInfo]:
+        """get_auth 的协程版本：池中有认证时直接取用，否则在事件循环上排队等待，不占用线程
+        
+        与同步调用方共用同一个 FIFO 队列，新认证加入时由池通过 call_soon_threadsafe 唤醒。
+        """
+        self.forecaster.record_checkout()
+        with self.lock:
+            self._purge_expired()
+            best_auth = None if self._waiters else self._select_best_auth()
+            if best_auth or timeout <= 0:
+                checkout = self._checkout(best_auth)
+                return self._log_checkout(best_auth, *checkout)
+            waiter = AsyncWaiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+            self.stats['checkout_waits'] += 1
+            self.refresh_wakeup.set()
+        
+        deadline = time.time() + timeout
+        try:
+            while True:
+                # 先清除再检查，检查之后到来的唤醒不会丢失
+                waiter.event.clear()
+                with self.lock:
+                    if self._waiters[0] is waiter:
+                        self._purge_expired()
+                        best_auth = self._select_best_auth()
+                        if best_auth:
+                            self._waiters.remove(waiter)
+                            if self._waiters:
+                                self._waiters[0].notify()
+                            checkout = self._checkout(best_auth)
+                            break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    with self.lock:
+                        self.stats['checkout_timeouts'] += 1
+                        self._waiters.remove(waiter)
+                        if self._waiters:
+                            self._waiters[0].notify()
+                        checkout = self._checkout(None)
+                    break
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            # 被取消（客户端断开等）时离开队列
+            with self.lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    if self._waiters:
+                        self._waiters[0].notify()
+            raise
+        return self._log_checkout(best_auth, *checkout)
+    
+    def try_checkout(self) -> Optional[AuthInfo]:
+        """不等待地取用一个认证（对冲请求用）：已有人排队或池为空时返回 None
+        
+        拿不到认证不算一次失败：不计入需求预测和失败统计，也不触发紧急恢复。
+        """
+        with self.lock:
+            self._purge_expired()
+            best_auth = None if self._waiters else self._select_best_auth()
+            if not best_auth:
+                return None
+            checkout = self._checkout(best_auth)
+        return self._log_checkout(best_auth, *checkout)
+    
+    async def atry_checkout(self) -> Optional[AuthInfo]:
+        """try_checkout 的协程版本，与 RemoteAuthPool 接口一致（本地池不会阻塞，直接调用）"""
+        return self.try_checkout()
+    
+    def _checkout(self, best_auth: Optional[AuthInfo]):
+        """记录一次取用并把未达上限的认证放回池中（调用方持有锁），返回日志需要的池状态"""
+        current_size = len(self.pool) + (1 if best_auth else 0)
+        retired = False
+        remaining_after_use = current_size
+        
+        # 如果池为空或过小，发出紧急警告并触发紧急恢复
+        if not best_auth:
+            self.stats['total_failures'] += 1
+            self.consecutive_failures += 1
+            self.refresh_wakeup.set()
+            self._trigger_emergency_recovery()
+        else:
+            if current_size <= 2:
+                self.stats['recovery_attempts'] += 1
+            
+            # 预测池状态变化：达到使用上限的认证不再放回
+            retired = best_auth.use_count >= best_auth.max_uses - 1
+            remaining_after_use = current_size - 1 if retired else current_size
+            best_auth.use_count += 1
+            if retired:
+                self.stats['total_expired'] += 1
+            else:
+                self.pool[best_auth.auth_id] = best_auth
+                self._push(best_auth)
+            self.stats['total_used'] += 1
+        return current_size, retired, remaining_after_use
+    
+    def _log_checkout(self, best_auth: Optional[AuthInfo], current_size: int, retired: bool,
+                      remaining_after_use: int) -> Optional[AuthInfo]:
+        if not best_auth:
+            logger.error("🚨 认证池完全为空！触发紧急恢复")
+            return None
+        if current_size <= 2:
+            logger.warning(f"⚡ 认证池极低 ({current_size} 个)，触发紧急补充")
+        elif current_size < self.min_pool_size:
+            logger.warning(f"📉 认证池低于最小值 ({current_size}/{self.min_pool_size})")
+        if retired:
+            logger.info(f"🗑️ 认证 {best_auth.auth_id} 达到使用上限，从池中移除")
+            # 如果移除后池会变得很小，发出警告
+            if remaining_after_use <= 1:
+                logger.warning(f"🔥 移除后认证池仅剩 {remaining_after_use} 个，需要快速补充！")
+        
+        # 记录使用情况以便监控
+        request_log.info("📊 使用认证 %s (%d/%d), 池剩余: %d",
+                         best_auth.auth_id, best_auth.use_count, best_auth.max_uses, remaining_after_use)
+        
+        return best_auth
+    
+    def _wait_for_auth(self, deadline: float) -> Optional[AuthInfo]:
+        """排队等待可用认证直到期限（调用方持有锁）"""
+        waiter = threading.Condition(self.lock)
+        self._waiters.append(waiter)
+        self.stats['checkout_waits'] += 1
+        self.refresh_wakeup.set()
+        best_auth = None
+        try:
+            while not best_auth:
+                if self._waiters[0] is waiter:
+                    self._purge_expired()
+                    best_auth = self._select_best_auth()
+                    if best_auth:
+                        break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.stats['checkout_timeouts'] += 1
+                    break
+                waiter.wait(remaining)
+        finally:
+            self._waiters.remove(waiter)
+            # 把机会交给下一个等待者（一个认证可以使用多次）
+            if self._waiters:
+                self._waiters[0].notify()
+        return best_auth
+    
+    def waiting_count(self) -> int:
+        """排队等待认证的调用方数量"""
+        return len(self._waiters)
+    
+    def _select_best_auth(self) -> Optional[AuthInfo]:
+        """弹出评分最优的认证并暂时移出池（调用方持有锁），跳过已移除或已失效的条目"""
+        while self._heap:
+            _, _, auth = heapq.heappop(self._heap)
+            if self.pool.get(auth.auth_id) is not auth:
+                continue
+            del self.pool[auth.auth_id]
+            if auth.is_valid():
+                return auth
+        return None
+    
+    def _trigger_emergency_recovery(self):
+        """触发紧急恢复机制"""
+        logger.warning("🚨 触发紧急认证恢复机制")
+        if self.consecutive_failures >= self.max_consecutive_failures:
+            logger.error(f"连续失败次数达到 {self.consecutive_failures}，增加退避时间")
+            self.backoff_multiplier = min(self.backoff_multiplier * 2, 8.0)
+    
+    def readiness(self, pool_size: Optional[int] = None) -> str:
+        """就绪状态：ready 池不低于最小值；warming 启动后尚未填满；degraded 曾经就绪后跌破最小值，或预热期间连续采集失败"""
+        if pool_size is None:
+            pool_size = len(self._snapshot())
+        if pool_size >= self.min_pool_size:
+            return 'ready'
+        if not self.ready_once and self.consecutive_failures < self.max_consecutive_failures:
+            return 'warming'
+        return 'degraded'
+    
+    def get_pool_status(self) -> Dict:
+        """获取池状态"""
+        valid_auths = self._snapshot()
+        now = time.time()
+        return {
+            'pool_size': len(valid_auths),
+            'readiness': self.readiness(len(valid_auths)),
+            'auths': [
+                {
+                    'id': a.auth_id,
+                    'use_count': a.use_count,
+                    'remaining': a.max_uses - a.use_count,
+                    'age': int(now - a.timestamp)
+                }
+                for a in valid_auths
+            ],
+            'stats': dict(self.stats),
+            'waiting': self.waiting_count(),
+            'harvester': self.harvester.get_status() if self.harvester else None,
+            'forecast': self.forecaster.last_forecast
+        }
+    
+    def handle_fetch_result(self, auth: Optional[AuthInfo]) -> bool:
+        """处理一次认证获取结果，更新失败计数和退避策略"""
+        if auth and self.add_auth(auth):
+            logger.info(f"✅ 成功添加认证 {auth.auth_id}")
+            
+            # 成功时重置退避
+            with self.lock:
+                self.consecutive_failures = max(0, self.consecutive_failures - 1)
+                if self.consecutive_failures == 0:
+                    self.backoff_multiplier = 1.0
+            return True
+        
+        logger.error(f"❌ 获取新认证失败")
+        with self.lock:
+            self.consecutive_failures += 1
+            self.stats['total_failures'] += 1
+            if self.consecutive_failures >= 3:
+                self.backoff_multiplier = min(self.backoff_multiplier * 1.5, 8.0)
+                logger.warning(f"连续失败 {self.consecutive_failures} 次，增加退避时间至 {self.backoff_multiplier:.1f}x")
+        return False
+    
+    def start_refresh_thread(self, auth_fetcher, harvester: Optional['AuthHarvester'] = None):
+        """启动自动刷新线程 - 智能容错版
+        
+        提供 harvester 时，补充任务并发派发给采集器，而不是在刷新线程中逐个获取。
+        """
+        self.stop_refresh_flag = False
+        self.harvester = harvester
+        if harvester:
+            harvester.start()
+        # 串行模式单轮最多获取 2 个，并行模式按采集器并发上限补充
+        max_concurrency = harvester.max_concurrency if harvester else 2
+        
+        def refresh_worker():
+            logger.info("🔄 启动认证池自动刷新线程 (智能容错版)")
+            last_plan = None
+            
+            while not self.stop_refresh_flag:
+                try:
+                    self.refresh_wakeup.clear()
+                    # 检查池大小和状态
+                    valid_auths = self._snapshot()
+                    current_size = len(valid_auths)
+                    if self.store:
+                        self.store.sync(valid_auths)
+                    in_flight = harvester.pending_count() if harvester else 0
+                    
+                    # 按最近请求速率预测目标池大小和采集并发
+                    forecast = self.forecaster.forecast(
+                        valid_auths, in_flight, max_concurrency,
+                        harvester.avg_fetch_seconds if harvester else None
+                    )
+                    target_size = forecast['target_size']
+                    fetch_cap = forecast['harvest_concurrency']
+                    lead_time = forecast['lead_time']
+                    
+                    # 计算补充前置时间内会过期的认证数量：剩余有效期不足，或剩余次数撑不过这段时间的平均分摊用量
+                    per_auth_demand = forecast['arrival_rate'] * lead_time / max(current_size, 1)
+                    soon_expire = len([a for a in valid_auths
+                                     if (AUTH_TTL - (time.time() - a.timestamp)) < max(lead_time, 60)
+                                     or (a.max_uses - a.use_count) <= max(per_auth_demand, 3)])
+                    
+                    # 检查是否需要应用退避策略
+                    backoff_delay = self.backoff_multiplier
+                    
+                    # 智能补充策略：根据失败情况调整
+                    need_replenish = False
+                    target_fetch = 0
+                    urgency_level = 0  # 紧急程度：0=正常，1=警告，2=紧急
+                    plan_level = logging.INFO
+                    plan_message = None
+                    
+                    if current_size == 0:
+                        need_replenish = True
+                        target_fetch = target_size
+                        fetch_cap = max_concurrency
+                        urgency_level = 2
+                        plan_level = logging.ERROR
+                        plan_message = f"🚨 认证池完全空，紧急补充 {target_fetch} 个认证"
+                    elif current_size < target_size:
+                        need_replenish = True
+                        target_fetch = min(target_size - current_size, fetch_cap)  # 限制单次获取数量
+                        urgency_level = 2 if current_size <= 1 else 1
+                        plan_message = f"🔥 池大小 ({current_size}) 低于目标 ({target_size})，需要补充 {target_fetch} 个认证"
+                    elif soon_expire > 0 and (current_size - soon_expire) < target_size:
+                        need_replenish = True
+                        target_fetch = min(target_size - (current_size - soon_expire), fetch_cap)  # 预防性补充
+                        urgency_level = 1
+                        plan_message = f"⚠️ 有 {soon_expire} 个认证即将过期，预防性补充认证"
+                    elif forecast['to_fetch'] > 0:
+                        need_replenish = True
+                        target_fetch = min(forecast['to_fetch'] + in_flight, fetch_cap)
+                        urgency_level = 1
+                        plan_message = f"⏳ 预计 {forecast['seconds_to_empty']}秒后耗尽，提前补充认证"
+                    elif current_size < (target_size + 1) and in_flight == 0:
+                        need_replenish = True
+                        target_fetch = 1  # 保持缓冲
+                        urgency_level = 0
+                        plan_message = f"🚀 主动维持认证池缓冲，当前 {current_size} 个"
+                    
+                    # 池低于目标时每秒都会重新预测，补充计划没有变化时只记 debug 日志
+                    plan = (plan_message and plan_message[0], urgency_level, target_size, target_fetch)
+                    if plan_message:
+                        logger.log(plan_level if plan != last_plan else logging.DEBUG, plan_message)
+                    last_plan = plan
+                    
+                    if need_replenish and harvester:
+                        # 扣除已在途的任务，避免重复派发
+                        to_submit = target_fetch - in_flight
+                        if to_submit > 0:
+                            logger.info(f"🏭 派发 {to_submit} 个认证采集任务 (在途 {in_flight})")
+                            harvester.submit(to_submit, self.handle_fetch_result)
+                    elif need_replenish:
+                        success_count = 0
+                        for i in range(target_fetch):
+                            if self.stop_refresh_flag:
+                                break
+                                
+                            logger.info(f"🔄 获取新认证 {i+1}/{target_fetch}...")
+                            
+                            try:
+                                fetch_start = time.time()
+                                auth = auth_fetcher()
+                                fetch_seconds = time.time() - fetch_start
+                                AUTH_FETCH_SECONDS.labels('success' if auth else 'failure').observe(fetch_seconds)
+                                if self.handle_fetch_result(auth):
+                                    self.forecaster.record_fetch(fetch_seconds)
+                                    success_count += 1
+                            except Exception as e:
+                                logger.error(f"获取认证时异常: {e}")
+                                with self.lock:
+                                    self.consecutive_failures += 1
+                                    self.stats['total_failures'] += 1
+                            
+                            # 根据紧急程度调整间隔
+                            if i < target_fetch - 1:
+                                interval = 1.0 if urgency_level >= 2 else (2.0 if urgency_level == 1 else 3.0)
+                                time.sleep(interval * backoff_delay)
+                        
+                        # 记录本轮补充结果
+                        if success_count > 0:
+                            logger.info(f"✅ 本轮成功补充 {success_count}/{target_fetch} 个认证")
+                        else:
+                            logger.warning(f"⚠️ 本轮补充失败，0/{target_fetch} 成功")
+                    
+                    # 根据当前状态调整检查间隔
+                    base_interval = 5  # 基础间隔5秒
+                    if urgency_level >= 2:
+                        check_interval = base_interval // 2  # 紧急情况快速检查
+                    elif urgency_level == 1:
+                        check_interval = base_interval
+                    else:
+                        check_interval = base_interval * 2  # 正常情况慢速检查
+                        
+                    # 应用退避延迟
+                    check_interval = int(check_interval * backoff_delay)
+                    # 预计在下次检查前需要开始补充时提前检查
+                    if forecast['arrival_rate'] > 0:
+                        check_interval = min(check_interval, max(1, int(forecast['seconds_to_empty'] - lead_time)))
+                    
+                    for _ in range(check_interval):
+                        if self.stop_refresh_flag:
+                            break
+                        # 有请求排队等待认证时立即唤醒
+                        if self.refresh_wakeup.wait(1):
+                            break
+                        # 池跌破目标或请求速率明显上升时提前重新预测
+                        if len(self.pool) < target_size or \
+                                self.forecaster.arrival_rate() > forecast['arrival_rate'] * 1.5 + 0.5:
+                            break
+                        
+                except Exception as e:
+                    logger.error(f"刷新线程错误: {e}")
+                    with self.lock:
+                        self.consecutive_failures += 1
+                        self.stats['total_failures'] += 1
+                    # 错误恢复等待时间也应用退避
+                    time.sleep(3 * self.backoff_multiplier)
+            
+            logger.info("🛑 认证池刷新线程已停止")
+        
+        self.refresh_thread = threading.Thread(target=refresh_worker, daemon=True)
+        self.refresh_thread.start()
+    
+    def stop_refresh(self):
+        """停止刷新线程"""
+        self.stop_refresh_flag = True
+        self.refresh_wakeup.set()
+        if self.refresh_thread:
+            self.refresh_thread.join(timeout=5)
+        if self.harvester:
+            self.harvester.stop()
+        if self.store:
+            # 保存最新的使用次数，供下次启动加载
+            self.store.sync(self._snapshot())
+
+
+class AuthHarvester:
+    """并行认证采集器：N 个工作线程各自持有独立浏览器，并发执行补充任务"""
+    
+    def __init__(self, fetch_func, cleanup_func=None, num_workers: int = 2,
+                 max_concurrency: Optional[int] = None,
+                 backoff_base: float = 2.0, backoff_max: float = 60.0, close_func=None):
+        self.fetch_func = fetch_func
+        self.cleanup_func = cleanup_func  # 工作线程退出时调用，释放线程自己的浏览器
+        self.close_func = close_func  # 所有工作线程退出后调用一次，释放线程共享的资源
+        self.num_workers = max(1, num_workers)
+        self.max_concurrency = max(1, max_concurrency or self.num_workers)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        
+        self.jobs = queue.Queue()
+        self.semaphore = threading.BoundedSemaphore(self.max_concurrency)  # 全局并发上限
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0  # 排队中 + 执行中的任务数
+        self.avg_fetch_seconds = None  # 成功采集耗时的指数滑动平均
+        self.workers = []
+        self.stop_flag = False
+        self.stats = {
+            'jobs_submitted': 0,
+            'jobs_succeeded': 0,
+            'jobs_failed': 0,
+            'active': 0
+        }
+    
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        if self.workers:
+            return
+        self.stop_flag = False
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker, args=(i,), daemon=True,
+                                      name=f"auth-harvester-{i}")
+            worker.start()
+            self.workers.append(worker)
+        logger.info(f"🏭 认证采集器已启动: {self.num_workers} 个工作线程，并发上限 {self.max_concurrency}")
+    
+    def submit(self, count: int, callback):
+        """提交 count 个采集任务，每个结果（可能为 None）会传给 callback"""
+        if count <= 0:
+            return
+        with self.lock:
+            self.pending += count
+            self.stats['jobs_submitted'] += count
+        for _ in range(count):
+            self.jobs.put(callback)
+    
+    def pending_count(self) -> int:
+        """排队中和执行中的任务数"""
+        with self.lock:
+            return self.pending
+    
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已提交任务完成"""
+        with self.idle:
+            return self.idle.wait_for(lambda: self.pending == 0, timeout=timeout)
+    
+    def _worker(self, worker_id: int):
+        failures = 0
+        
+        while not self.stop_flag:
+            try:
+                callback = self.jobs.get(timeout=1)
+            except queue.Empty:
+                continue
+            
+            auth = None
+            try:
+                with self.semaphore:
+                    with self.lock:
+                        self.stats['active'] += 1
+                    fetch_start = time.time()
+                    try:
+                        auth = self.fetch_func()
+                    finally:
+                        elapsed = time.time() - fetch_start
+                        AUTH_FETCH_SECONDS.labels('success' if auth else 'failure').observe(elapsed)
+                        with self.lock:
+                            self.stats['active'] -= 1
+                            if auth:
+                                self.avg_fetch_seconds = elapsed if self.avg_fetch_seconds is None \
+                                    else self.avg_fetch_seconds * 0.7 + elapsed * 0.3
+            except Exception as e:
+                logger.error(f"采集线程 {worker_id} 获取认证异常: {e}")
+            
+            try:
+                callback(auth)
+            except Exception as e:
+                logger.error(f"采集线程 {worker_id} 处理结果异常: {e}")
+            finally:
+                with self.lock:
+                    self.pending -= 1
+                    self.stats['jobs_succeeded' if auth else 'jobs_failed'] += 1
+                    self.idle.notify_all()
+            
+            # 单个线程的失败退避，不影响其他线程继续工作
+            if auth:
+                failures = 0
+            else:
+                failures += 1
+                delay = min(self.backoff_base * (2 ** (failures - 1)), self.backoff_max)
+                logger.warning(f"采集线程 {worker_id} 连续失败 {failures} 次，退避 {delay:.1f}秒")
+                deadline = time.time() + delay
+                while not self.stop_flag and time.time() < deadline:
+                    time.sleep(min(1.0, deadline - time.time()))
+        
+        if self.cleanup_func:
+            try:
+                self.cleanup_func()
+            except Exception as e:
+                logger.debug(f"采集线程 {worker_id} 清理失败: {e}")
+    
+    def get_status(self) -> Dict:
+        """获取采集器状态"""
+        with self.lock:
+            return {
+                'workers': self.num_workers,
+                'max_concurrency': self.max_concurrency,
+                'pending': self.pending,
+                'avg_fetch_seconds': round(self.avg_fetch_seconds, 2) if self.avg_fetch_seconds else None,
+                **self.stats
+            }
+    
+    def stop(self):
+        """停止所有工作线程"""
+        self.stop_flag = True
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.workers = []
+        if self.close_func:
+            try:
+                self.close_func()
+            except Exception as e:
+                logger.debug(f"关闭采集器共享资源失败: {e}")
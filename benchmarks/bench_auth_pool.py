@@ -0,0 +1,103 @@
+"""
+认证池取用并发基准：多线程同时 get_auth，对比优化前整池过滤重建 + O(n) min 的实现
+
+用法: python benchmarks/bench_auth_pool.py [线程数] [每线程取用次数] [池大小]
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth_pool import AuthInfo, AuthPool, logger
+
+COOKIE = 'sophnet_session=bench; ' + 'x' * 64
+
+
+class LegacyAuthPool(AuthPool):
+    """优化前的取用路径：每次在全局锁内过滤整个池、重建 deque，再逐个计算评分取最小值"""
+
+    def __init__(self, min_pool_size=3, max_pool_size=10):
+        super().__init__(min_pool_size, max_pool_size)
+        self.pool = deque(maxlen=max_pool_size)
+
+    def add_auth(self, auth: AuthInfo):
+        with self.lock:
+            self.pool = deque([a for a in self.pool if a.is_valid()], maxlen=self.max_pool_size)
+            self.pool.append(auth)
+            self.stats['total_created'] += 1
+            return True
+
+    def get_auth(self):
+        with self.lock:
+            self.pool = deque([a for a in self.pool if a.is_valid()], maxlen=self.max_pool_size)
+            if not self.pool:
+                return None
+
+            def auth_score(auth):
+                age_factor = (time.time() - auth.timestamp) / 60
+                usage_factor = auth.use_count / auth.max_uses
+                return age_factor * 0.3 + usage_factor * 0.7
+
+            best_auth = min(self.pool, key=auth_score)
+            if best_auth.use_count >= best_auth.max_uses - 1:
+                self.pool.remove(best_auth)
+            best_auth.use_count += 1
+            self.stats['total_used'] += 1
+            return best_auth
+
+
+def make_auth() -> AuthInfo:
+    return AuthInfo(project_id='bench', auth_headers={'cookie': COOKIE}, captcha_data={},
+                    timestamp=time.time(), max_uses=10 ** 9)
+
+
+def run(pool: AuthPool, threads: int, per_thread: int) -> float:
+    """所有线程同时开始取用，返回总耗时"""
+    barrier = threading.Barrier(threads + 1)
+    misses = []
+
+    def worker():
+        barrier.wait()
+        for _ in range(per_thread):
+            if pool.get_auth() is None:
+                misses.append(1)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    assert not misses, f"{len(misses)} 次取用失败"
+    return elapsed
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    logger.setLevel(logging.CRITICAL)
+
+    total = threads * per_thread
+    print(f"threads: {threads}, checkouts: {total}, pool size: {size}")
+    results = {}
+    for name, cls in (('legacy (rebuild + min)', LegacyAuthPool), ('heap', AuthPool)):
+        pool = cls(min_pool_size=3, max_pool_size=size)
+        for _ in range(size):
+            pool.add_auth(make_auth())
+        results[name] = min(run(pool, threads, per_thread) for _ in range(3))
+        print(f"{name:<24} {results[name] / total * 1e6:7.2f} µs/checkout  "
+              f"{total / results[name]:10.0f} checkouts/s")
+    legacy, fast = results.values()
+    print(f"加速: {legacy / fast:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+每请求日志开销基准：多线程模拟请求路径上的日志行，对比同步文本输出与队列 + JSON + 限流
+
+用法: python benchmarks/bench_logging.py [线程数] [每线程请求数] [每模板每秒条数]
+日志写入临时文件，输出每请求的日志耗时和实际写出的行数
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_setup
+from log_setup import RequestLog, configure_logging, stop_logging
+
+logger = logging.getLogger('bench')
+
+
+def legacy_request(i: int):
+    """优化前：每请求三行 f-string，INFO 级别同步写出"""
+    auth_id = f"{i:08x}"
+    logger.info(f"📊 使用认证 {auth_id} ({i % 10}/10), 池剩余: {i % 50}")
+    logger.info(f"使用认证 {auth_id} (已用 {i % 10}/10) - 尝试 1/3")
+    logger.info(f"✅ API 调用成功 (Auth: {auth_id})")
+
+
+def make_structured_request(request_log: RequestLog):
+    def structured_request(i: int):
+        auth_id = f"{i:08x}"
+        request_log.info("📊 使用认证 %s (%d/%d), 池剩余: %d", auth_id, i % 10, 10, i % 50)
+        request_log.info("使用认证 %s (已用 %d/%d) - 尝试 %d/%d", auth_id, i % 10, 10, 1, 3)
+        request_log.info("✅ API 调用成功 (Auth: %s)", auth_id)
+    return structured_request
+
+
+def run(request, threads: int, per_thread: int) -> float:
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(per_thread):
+            request(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - start
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rate_limit = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    total = threads * per_thread
+    print(f"threads: {threads}, requests: {total}, rate limit: {rate_limit}/s per message")
+
+    log_setup.LOG_QUEUE_SIZE = total * 3
+    cases = (
+        ('sync text (legacy)', 'text', False, legacy_request),
+        ('queue json, unlimited', 'json', True, make_structured_request(RequestLog(logger, 1.0, 0))),
+        ('queue json, rate limited', 'json', True, make_structured_request(RequestLog(logger, 1.0, rate_limit))),
+    )
+    for name, fmt, use_queue, request in cases:
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as output:
+            configure_logging('INFO', fmt, use_queue, stream=output)
+            elapsed = run(request, threads, per_thread)
+            stop_logging()
+            output.seek(0)
+            lines = sum(1 for _ in output)
+        print(f"{name:<26} {elapsed / total * 1e6:7.2f} µs/request  {lines:8d} lines written")
+
+
+if __name__ == '__main__':
+    main()
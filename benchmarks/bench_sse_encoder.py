@@ -0,0 +1,69 @@
+"""
+SSE chunk 编码微基准：逐 token 构建字典 + json.dumps 与 SSEChunkEncoder 预序列化模板对比
+
+用法: python benchmarks/bench_sse_encoder.py [token 数量]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import SSEChunkEncoder
+
+
+def legacy_chunk(chat_id: str, created: int, model: str, content: str, finish_reason=None) -> str:
+    """优化前的实现：每个 token 构建完整字典并序列化"""
+    openai_chunk = {
+        "id": chat_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": {"content": content},
+                "finish_reason": finish_reason
+            }
+        ]
+    }
+    return f"data: {json.dumps(openai_chunk)}\n\n"
+
+
+def make_tokens(count: int):
+    """生成混合中英文、引号和换行的 token"""
+    vocab = ["思考", "，", "the", " answer", "\"quoted\"", "\n", "数学", " 42", "\\", "步骤"]
+    rng = random.Random(0)
+    return [rng.choice(vocab) for _ in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tokens = make_tokens(count)
+    chat_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    model = "DeepSeek-R1"
+    encoder = SSEChunkEncoder(chat_id, created, model)
+
+    # 输出必须逐字节一致
+    for token in tokens[:200]:
+        assert encoder.encode(token) == legacy_chunk(chat_id, created, model, token)
+    assert encoder.encode("x", "stop") == legacy_chunk(chat_id, created, model, "x", "stop")
+
+    legacy = min(timeit.repeat(lambda: [legacy_chunk(chat_id, created, model, t) for t in tokens],
+                               number=1, repeat=5))
+    fast = min(timeit.repeat(lambda: [encoder.encode(t) for t in tokens], number=1, repeat=5))
+
+    print(f"tokens: {count}")
+    print(f"json.dumps 每 token:   {legacy / count * 1e6:.2f} µs")
+    print(f"SSEChunkEncoder 每 token: {fast / count * 1e6:.2f} µs")
+    print(f"加速: {legacy / fast:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+上游 SSE 解析基准：json.loads / orjson / 定向扫描 三种后端对比
+
+用法:
+    python benchmarks/bench_sse_parser.py                 # 使用生成的 R1 风格流
+    python benchmarks/bench_sse_parser.py capture.sse     # 使用录制的上游原始响应（每行一个 SSE 行）
+"""
+
+import os
+import sys
+import json
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import UpstreamSSEParser, orjson
+
+
+def generate_r1_stream(reasoning_tokens: int = 3000, content_tokens: int = 1000):
+    """生成与 Sophnet R1 上游格式一致的流：思考阶段、回答阶段、usage 帧和 [DONE]"""
+    rng = random.Random(0)
+    vocab = ["首先", "，", "我们", "需要", "考虑", " x", "=", "2", "\n", "\"", "步骤", " the", " answer"]
+    lines = []
+
+    def frame(delta, finish_reason=None):
+        return ("data: " + json.dumps({
+            "id": "chatcmpl-0123456789ab",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "DeepSeek-R1",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }, ensure_ascii=False)).encode('utf-8')
+
+    lines.append(frame({"role": "assistant", "content": ""}))
+    for _ in range(reasoning_tokens):
+        lines.append(frame({"content": None, "reasoning_content": rng.choice(vocab)}))
+    for _ in range(content_tokens):
+        lines.append(frame({"content": rng.choice(vocab)}))
+    lines.append(frame({"content": ""}, "stop"))
+    lines.append(("data: " + json.dumps({
+        "choices": [],
+        "usage": {"prompt_tokens": 12, "completion_tokens": reasoning_tokens + content_tokens,
+                  "completion_tokens_details": {"reasoning_tokens": reasoning_tokens}}
+    })).encode('utf-8'))
+    lines.append(b"data: [DONE]")
+    return lines
+
+
+def generate_nested_frames():
+    """content 键出现在 delta 第一层以外的帧：定向扫描必须与完整解析结果一致"""
+    def frame(choice, **extra):
+        return ("data: " + json.dumps({"id": "chatcmpl-0123456789ab", "choices": [choice], **extra})).encode('utf-8')
+
+    return [
+        # tool_calls 的参数里有 content 键
+        frame({"index": 0, "delta": {"tool_calls": [{"index": 0, "function": {
+            "name": "save", "arguments": "{\"content\": \"x\"}"}}]}, "finish_reason": None}),
+        frame({"index": 0, "delta": {"role": "assistant", "content": None, "tool_calls": [
+            {"index": 0, "function": {"name": "note", "arguments": ""}, "content": "nested"}]}, "finish_reason": None}),
+        # delta 之前的 message 对象和 delta 之后的 logprobs 对象里有 content 键
+        frame({"index": 0, "message": {"content": "message"}, "delta": {"reasoning_content": "r"},
+               "finish_reason": None}),
+        frame({"index": 0, "delta": {"role": "assistant"}, "logprobs": {"content": "logprobs"},
+               "finish_reason": None}),
+        frame({"index": 0, "delta": {"content": "a{b}[c]", "reasoning_content": "d"}, "finish_reason": None}),
+    ]
+
+
+def load_capture(path: str):
+    with open(path, 'rb') as f:
+        return [line.rstrip(b'\r\n') for line in f if line.strip()]
+
+
+def legacy_parse(line: bytes):
+    """优化前的实现：decode 后对每一帧完整 json.loads"""
+    line = line.decode('utf-8')
+    if line.startswith('data: ') and line != 'data: [DONE]':
+        data = json.loads(line[6:])
+        delta = data['choices'][0].get('delta', {}) if data.get('choices') else {}
+        return delta.get('content', ''), delta.get('reasoning_content', '')
+
+
+def main():
+    lines = load_capture(sys.argv[1]) if len(sys.argv) > 1 else generate_r1_stream()
+    print(f"frames: {len(lines)}")
+
+    backends = ['json', 'scan'] + (['orjson'] if orjson is not None else [])
+    parsers = {name: UpstreamSSEParser(name) for name in backends}
+
+    # 各后端解析结果必须一致
+    for frames in (lines, generate_nested_frames()):
+        reference = [parsers['json'].parse(line) for line in frames]
+        for name, parser in parsers.items():
+            assert [parser.parse(line) for line in frames] == reference, name
+
+    legacy = min(timeit.repeat(lambda: [legacy_parse(line) for line in lines], number=1, repeat=15))
+    print(f"{'legacy (decode + json.loads)':<30} {legacy / len(lines) * 1e6:6.2f} µs/frame")
+    for name, parser in parsers.items():
+        parser.stats = {'fast_path': 0, 'full_parse': 0}
+        elapsed = min(timeit.repeat(lambda: [parser.parse(line) for line in lines], number=1, repeat=15))
+        print(f"{name:<30} {elapsed / len(lines) * 1e6:6.2f} µs/frame  "
+              f"({legacy / elapsed:.1f}x, fast path {parser.stats['fast_path'] // 15}/{len(lines)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+端到端压测：模拟上游 + 桩认证获取器 + 真实代理进程，按指定并发发送请求
+
+    python benchmarks/load_test.py --server asgi --concurrency 32 --requests 2000 --token-rate 200
+    python benchmarks/load_test.py --json result.json                     # 保存结果
+    python benchmarks/load_test.py --compare result.json --tolerance 0.1  # 与基线对比，退化时退出码为 1
+    python benchmarks/load_test.py --proxy http://127.0.0.1:8080          # 压测已启动的代理（不统计 CPU）
+
+输出 RPS、首 token 延迟 (TTFT) 的 p50/p95/p99、单流和总体 tokens/s，以及代理进程每千 token 消耗的 CPU 时间。
+客户端只使用标准库；代理进程需要完整的运行依赖（flask / starlette / uvicorn / httpx 等）。
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_upstream import add_mock_arguments, mock_config_from_args, start_mock_upstream
+
+STUB_PROXY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_proxy.py')
+
+# 对比基线时检查的指标：名称 -> 越大越好
+COMPARED_METRICS = {
+    'rps': True,
+    'tokens_per_second': True,
+    'ttft_p50_ms': False,
+    'ttft_p95_ms': False,
+    'cpu_ms_per_1k_tokens': False,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return round(values[index], 1)
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """读取进程及其已退出子进程的 CPU 时间（仅 Linux）"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime, stime, cutime, cstime 为第 14~17 个字段，去掉前两个字段后从下标 11 开始
+    ticks = sum(int(v) for v in fields[11:15])
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+class RequestResult:
+    __slots__ = ('ok', 'ttft', 'duration', 'tokens', 'stream_seconds', 'error')
+
+    def __init__(self):
+        self.ok = False
+        self.ttft = None
+        self.duration = 0.0
+        self.tokens = 0
+        self.stream_seconds = 0.0
+        self.error = None
+
+
+def send_request(conn: http.client.HTTPConnection, body: bytes, stream: bool) -> RequestResult:
+    """发送一次请求；流式请求逐行读取 SSE，记录首个内容 token 的时间"""
+    result = RequestResult()
+    started = time.perf_counter()
+    conn.request('POST', '/v1/chat/completions', body=body, headers={'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    if response.status != 200:
+        result.error = f"HTTP {response.status}"
+        response.read()
+        result.duration = time.perf_counter() - started
+        return result
+
+    if stream:
+        first_token_at = None
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            if not line.startswith(b'data: '):
+                continue
+            payload = line[6:].strip()
+            if payload == b'[DONE]':
+                continue
+            if b'"content"' in payload:
+                result.tokens += 1
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+        finished = time.perf_counter()
+        if first_token_at is not None:
+            result.ttft = first_token_at - started
+            result.stream_seconds = finished - first_token_at
+    else:
+        data = json.loads(response.read())
+        finished = time.perf_counter()
+        result.ttft = finished - started
+        result.tokens = data.get('usage', {}).get('completion_tokens', 0)
+        result.stream_seconds = finished - started
+    result.duration = finished - started
+    result.ok = True
+    return result
+
+
+def run_load(proxy_url: str, concurrency: int, total: int, body: bytes, stream: bool) -> List[RequestResult]:
+    """concurrency 个线程各自保持一个 keep-alive 连接，共发送 total 个请求"""
+    parts = urlsplit(proxy_url)
+    results: List[RequestResult] = []
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            try:
+                result = send_request(conn, body, stream)
+            except Exception as e:
+                result = RequestResult()
+                result.error = f"{type(e).__name__}: {e}"
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+            with lock:
+                results.append(result)
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def wait_ready(proxy_url: str, timeout: float = 60.0) -> bool:
+    parts = urlsplit(proxy_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            conn.request('GET', '/ready')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def summarize(results: List[RequestResult], elapsed: float, cpu_seconds: Optional[float]) -> Dict:
+    ok = [r for r in results if r.ok]
+    ttfts = [r.ttft * 1000 for r in ok if r.ttft is not None]
+    tokens = sum(r.tokens for r in ok)
+    per_stream = [r.tokens / r.stream_seconds for r in ok if r.stream_seconds > 0 and r.tokens > 1]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r.ok:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    return {
+        'requests': len(results),
+        'ok': len(ok),
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'rps': round(len(ok) / elapsed, 2) if elapsed else 0,
+        'ttft_p50_ms': percentile(ttfts, 50),
+        'ttft_p95_ms': percentile(ttfts, 95),
+        'ttft_p99_ms': percentile(ttfts, 99),
+        'tokens': tokens,
+        'tokens_per_second': round(tokens / elapsed, 1) if elapsed else 0,
+        'stream_tokens_per_second_p50': percentile(per_stream, 50),
+        'proxy_cpu_seconds': round(cpu_seconds, 3) if cpu_seconds is not None else None,
+        'cpu_ms_per_1k_tokens': round(cpu_seconds * 1000 / tokens * 1000, 3) if cpu_seconds and tokens else None,
+    }
+
+
+def print_summary(summary: Dict):
+    def ms(value):
+        return f"{value:.1f} ms" if value is not None else '-'
+
+    print(f"requests: {summary['ok']}/{summary['requests']} ok in {summary['elapsed_seconds']}s")
+    if summary['errors']:
+        print(f"errors: {summary['errors']}")
+    print(f"RPS: {summary['rps']}")
+    print(f"TTFT p50 / p95 / p99: {ms(summary['ttft_p50_ms'])} / {ms(summary['ttft_p95_ms'])} / "
+          f"{ms(summary['ttft_p99_ms'])}")
+    print(f"tokens/s: {summary['tokens_per_second']} total, "
+          f"{summary['stream_tokens_per_second_p50'] or '-'} per stream (p50)")
+    if summary['cpu_ms_per_1k_tokens'] is not None:
+        print(f"proxy CPU: {summary['proxy_cpu_seconds']}s, {summary['cpu_ms_per_1k_tokens']} ms / 1k tokens")
+    if 'upstream' in summary:
+        print(f"upstream: {summary['upstream']}")
+
+
+def compare(summary: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """返回超过容差的退化项"""
+    regressions = []
+    for key, higher_is_better in COMPARED_METRICS.items():
+        current, previous = summary.get(key), baseline.get(key)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f"{key}: {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sophnet 代理端到端压测")
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='asgi')
+    parser.add_argument('--proxy', help="压测已启动的代理，不启动模拟上游和代理进程")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--model', default='DeepSeek-V3-Fast')
+    parser.add_argument('--no-stream', action='store_true', help="发送非流式请求")
+    parser.add_argument('--fetch-delay', type=float, default=0.2, help="桩认证获取耗时（秒）")
+    parser.add_argument('--json', help="把结果写入 JSON 文件")
+    parser.add_argument('--compare', help="与之前保存的 JSON 结果对比")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="对比时允许的相对退化")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    stream = not args.no_stream
+    body = json.dumps({'model': args.model, 'stream': stream,
+                       'messages': [{'role': 'user', 'content': '你好'}]}).encode()
+
+    proxy_process = None
+    mock_server = None
+    proxy_url = args.proxy
+    if not proxy_url:
+        mock_config = mock_config_from_args(args)
+        mock_server, upstream_url = start_mock_upstream(mock_config)
+        port = free_port()
+        proxy_url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ, AUTH_POOL_MIN_SIZE=os.getenv('AUTH_POOL_MIN_SIZE', '10'),
+                   AUTH_POOL_MAX_SIZE=os.getenv('AUTH_POOL_MAX_SIZE', '50'))
+        proxy_process = subprocess.Popen(
+            [sys.executable, STUB_PROXY, '--upstream', upstream_url, '--server', args.server,
+             '--port', str(port), '--fetch-delay', str(args.fetch_delay)],
+            env=env
+        )
+        print(f"mock upstream: {upstream_url}  proxy ({args.server}): {proxy_url}")
+
+    try:
+        if not wait_ready(proxy_url):
+            print("代理未就绪")
+            return 2
+        if args.warmup:
+            run_load(proxy_url, min(args.concurrency, args.warmup), args.warmup, body, stream)
+
+        cpu_before = process_cpu_seconds(proxy_process.pid) if proxy_process else None
+        started = time.perf_counter()
+        results = run_load(proxy_url, args.concurrency, args.requests, body, stream)
+        elapsed = time.perf_counter() - started
+        cpu_after = process_cpu_seconds(proxy_process.pid) if proxy_process else None
+    finally:
+        if proxy_process:
+            proxy_process.terminate()
+            proxy_process.wait(timeout=10)
+        if mock_server:
+            mock_server.shutdown()
+
+    cpu_seconds = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    summary = summarize(results, elapsed, cpu_seconds)
+    summary['config'] = {key: value for key, value in vars(args).items() if key not in ('json', 'compare')}
+    if mock_server:
+        summary['upstream'] = mock_server.RequestHandlerClass.stats.snapshot()
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        if regressions:
+            print("⚠️ 性能退化:\n  " + "\n  ".join(regressions))
+            return 1
+        print("✅ 与基线相比没有超过容差的退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
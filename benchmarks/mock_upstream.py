@@ -0,0 +1,170 @@
+"""
+本地模拟 Sophnet 上游：POST /api/open-apis/projects/{id}/chat/completions 返回 SSE 流
+
+可配置输出速率、思考阶段（reasoning_content）长度、401/10025 认证失效比例和响应头前的延迟。
+只依赖标准库，load_test.py 在进程内启动它，也可以单独运行:
+
+    python benchmarks/mock_upstream.py --port 18081 --tokens 200 --reasoning-tokens 100 --token-rate 50
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+PATH_RE = re.compile(r'^/api/open-apis/projects/[^/]+/chat/completions$')
+
+AUTH_EXPIRED_BODY = json.dumps({"status": 10025, "message": "You must log in first"}).encode()
+
+VOCAB = ["首先", "，", "我们", "需要", "考虑", " x", "=", "2", "\n", "\"", "步骤", " the", " answer", "。"]
+
+
+@dataclass
+class MockConfig:
+    content_tokens: int = 200
+    reasoning_tokens: int = 0
+    token_rate: float = 0.0  # 每秒输出的帧数，0 表示不限速
+    latency: float = 0.0  # 返回响应头前的延迟（秒）
+    auth_failure_rate: float = 0.0  # 返回 401 / 10025 的比例
+    seed: int = 0
+
+
+class MockStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'auth_failures': 0, 'completed': 0, 'tokens': 0}
+
+    def add(self, key: str, amount: int = 1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+
+def build_frames(config: MockConfig, rng: random.Random):
+    """生成一次响应的全部 SSE 行（与上游格式一致：思考阶段、回答阶段、usage 帧和 [DONE]）"""
+    frames = []
+    for _ in range(config.reasoning_tokens):
+        delta = {"role": "assistant", "content": None, "reasoning_content": rng.choice(VOCAB)}
+        frames.append({"choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+    for i in range(config.content_tokens):
+        last = i == config.content_tokens - 1
+        delta = {"role": "assistant", "content": rng.choice(VOCAB), "reasoning_content": None}
+        frames.append({"choices": [{"index": 0, "delta": delta, "finish_reason": "stop" if last else None}]})
+    lines = [b'data: ' + json.dumps(f, ensure_ascii=False).encode() + b'\n\n' for f in frames]
+    usage = {"prompt_tokens": 10, "completion_tokens": config.content_tokens + config.reasoning_tokens,
+             "total_tokens": 10 + config.content_tokens + config.reasoning_tokens,
+             "completion_tokens_details": {"reasoning_tokens": config.reasoning_tokens}}
+    lines.append(b'data: ' + json.dumps({"choices": [], "usage": usage}).encode() + b'\n\n')
+    lines.append(b'data: [DONE]\n\n')
+    return lines
+
+
+class MockSophnetHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持 keep-alive，代理的连接池可以复用连接
+    config = MockConfig()
+    stats = MockStats()
+    frames = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if not PATH_RE.match(self.path):
+            self._send_json(404, b'{"message":"not found"}')
+            return
+
+        self.stats.add('requests')
+        config = self.config
+        if config.latency:
+            time.sleep(config.latency)
+        if config.auth_failure_rate and random.random() < config.auth_failure_rate:
+            self.stats.add('auth_failures')
+            self._send_json(401, AUTH_EXPIRED_BODY)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        interval = 1.0 / config.token_rate if config.token_rate > 0 else 0
+        next_at = time.perf_counter()
+        try:
+            for line in self.frames:
+                if interval:
+                    next_at += interval
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return
+        self.stats.add('completed')
+        self.stats.add('tokens', config.content_tokens + config.reasoning_tokens)
+
+
+def start_mock_upstream(config: MockConfig, host: str = '127.0.0.1', port: int = 0):
+    """在后台线程启动模拟上游，返回 (server, base_url)"""
+    handler = type('ConfiguredMockHandler', (MockSophnetHandler,), {
+        'config': config,
+        'stats': MockStats(),
+        'frames': build_frames(config, random.Random(config.seed)),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mock-upstream', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--tokens', type=int, default=200, help="每个响应的回答帧数")
+    parser.add_argument('--reasoning-tokens', type=int, default=0, help="每个响应的思考帧数")
+    parser.add_argument('--token-rate', type=float, default=0.0, help="每秒输出帧数，0 表示不限速")
+    parser.add_argument('--latency', type=float, default=0.0, help="返回响应头前的延迟（秒）")
+    parser.add_argument('--auth-failure-rate', type=float, default=0.0, help="返回 401/10025 的比例")
+
+
+def mock_config_from_args(args) -> MockConfig:
+    return MockConfig(content_tokens=args.tokens, reasoning_tokens=args.reasoning_tokens,
+                      token_rate=args.token_rate, latency=args.latency,
+                      auth_failure_rate=args.auth_failure_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 Sophnet 上游")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18081)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    config = mock_config_from_args(args)
+    server, url = start_mock_upstream(config, args.host, args.port)
+    print(f"mock upstream: {url}  {asdict(config)}")
+    try:
+        while True:
+            time.sleep(5)
+            print(server.RequestHandlerClass.stats.snapshot())
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
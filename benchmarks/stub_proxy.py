@@ -0,0 +1,77 @@
+"""
+压测用代理进程：真实的 main / asgi_app 服务，认证由桩获取器生成，上游指向模拟服务器
+
+    python benchmarks/stub_proxy.py --upstream http://127.0.0.1:18081 --server asgi --port 18080
+
+桩获取器不启动浏览器，只按 --fetch-delay 模拟获取耗时后返回一个格式正确的认证，
+因此认证池的补充、取用、失效移除和排队逻辑都和生产环境一致。
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubAuthFetcher:
+    """桩认证获取器，接口与 auth_fetcher.SophnetAuthFetcher 一致"""
+
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.stats = {'total_attempts': 0, 'successful': 0, 'failed': 0}
+
+    def fetch_auth(self):
+        from auth_pool import AuthInfo
+
+        self.stats['total_attempts'] += 1
+        if self.delay:
+            time.sleep(self.delay)
+        self.stats['successful'] += 1
+        return AuthInfo(
+            project_id='bench',
+            auth_headers={'cookie': f"sophnet_session=stub-{uuid.uuid4().hex}"},
+            captcha_data={},
+            timestamp=time.time()
+        )
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用桩认证获取器运行代理")
+    parser.add_argument('--upstream', required=True, help="模拟上游地址")
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='asgi')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--fetch-delay', type=float, default=0.2, help="桩获取器每次获取的耗时（秒）")
+    args = parser.parse_args()
+
+    # 必须在导入 main 之前设置，main 在导入时读取配置
+    os.environ['SOPHNET_BASE_URL'] = args.upstream
+    os.environ.setdefault('STARTUP_MODE', 'background')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import main
+    from auth_pool import AuthHarvester
+
+    # 预先设置获取器和采集器，init_auth_harvesting() 不会再导入浏览器模块
+    main.auth_fetcher = StubAuthFetcher(args.fetch_delay)
+    main.auth_harvester = AuthHarvester(main.auth_fetcher.fetch_auth,
+                                        num_workers=main.HARVEST_WORKERS,
+                                        max_concurrency=main.HARVEST_MAX_CONCURRENCY)
+
+    if args.server == 'asgi':
+        import uvicorn
+        from asgi_app import app
+        uvicorn.run(app, host=args.host, port=args.port, log_level='warning', access_log=False)
+    else:
+        main.initialize()
+        main.app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
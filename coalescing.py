@@ -0,0 +1,356 @@
+"""
+相同请求合并（single-flight）：同一时刻的重复请求只向上游发送一次
+
+第一个请求作为 leader 调用上游，之后到达的相同请求（模型、消息、采样参数、是否流式都相同）
+订阅 leader 的结果：非流式请求直接使用汇总结果，流式请求先回放已输出的 chunk，再跟随后续输出。
+leader 的客户端提前断开时，只要还有订阅者就继续读完上游。
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# off：关闭；deterministic：只合并 temperature 为 0 的请求；all：合并所有相同请求（重复请求会拿到同一个采样结果）
+REQUEST_COALESCING = os.getenv('REQUEST_COALESCING', 'off').lower()
+COALESCE_WAIT_TIMEOUT = float(os.getenv('COALESCE_WAIT_TIMEOUT', 60))  # 订阅者等待下一个 chunk 的最长时间
+COALESCE_MAX_BUFFER = int(os.getenv('COALESCE_MAX_BUFFER', 4 * 1024 * 1024))  # 缓冲超过该字节数后不再接受新订阅者
+
+
+class FlightFailed(Exception):
+    """leader 的上游请求失败，订阅者按同样的错误返回"""
+
+
+class Flight:
+    """一次进行中的上游请求及其输出缓冲
+
+    流式输出追加到 chunks，读者（订阅者和 ASGI 模式下的 leader）按序号读取；同步读者等待 Condition，
+    异步读者（与 leader 在同一个事件循环中）等待 asyncio.Event。不再接受新订阅者后，
+    所有读者都读过的 chunk 被丢弃，没有读者时不再缓冲。
+    """
+
+    _LEADER = 'leader'
+
+    def __init__(self, key: str, group: 'SingleFlight'):
+        self.key = key
+        self.group = group
+        self.chunks = []
+        self.base = 0  # chunks[0] 的序号
+        self.count = 0  # 已发布的 chunk 数
+        self.size = 0
+        self.released = False
+        self.cursors: Dict[Any, int] = {}  # 读者 → 下一个要读的序号
+        self.unstarted = 0  # 已加入但还没开始读取的订阅者，需要从头回放
+        self.done = False
+        self.ok = False
+        self.result: Any = None
+        self.subscribers = 0  # 还没离开的订阅者
+        self.leader_left = False
+        self.cond = threading.Condition()
+        self._event: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None  # ASGI 模式下读取上游的任务
+
+    def _notify(self):
+        """调用方持有 cond"""
+        self.cond.notify_all()
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+    def _trim(self):
+        """不再接受新订阅者后丢弃所有读者都已读过的 chunk（调用方持有 cond）"""
+        if not self.released or self.unstarted:
+            return
+        low = min(self.cursors.values(), default=self.count)
+        if low > self.base:
+            del self.chunks[:low - self.base]
+            self.base = low
+
+    def publish(self, chunk):
+        with self.cond:
+            self.count += 1
+            self.size += len(chunk)
+            self.chunks.append(chunk)
+            self._trim()
+            self._notify()
+        if self.size > self.group.max_buffer and not self.released:
+            self.group.release(self)
+
+    def _added(self):
+        """join 加入一个订阅者（调用方持有 group.lock）"""
+        with self.cond:
+            self.subscribers += 1
+            self.unstarted += 1
+
+    def _released(self):
+        """group.release 移出登记表后调用"""
+        with self.cond:
+            self.released = True
+            self._trim()
+
+    def _start(self, token) -> Any:
+        """登记一个从头读取的读者"""
+        with self.cond:
+            if token is not self._LEADER:
+                self.unstarted -= 1
+            self.cursors[token] = self.base
+        return token
+
+    def _take(self, token) -> list:
+        """读取一个读者的新 chunk 并前移它的序号（调用方持有 cond）"""
+        chunks = self.chunks[self.cursors[token] - self.base:]
+        self.cursors[token] = self.count
+        self._trim()
+        return chunks
+
+    def _leave(self, token=None):
+        """读者离开；token 为 None 表示订阅者没有开始读取就离开（等待超时、失败或非流式）"""
+        with self.cond:
+            if token is None:
+                self.unstarted -= 1
+            else:
+                self.cursors.pop(token, None)
+            if token is not self._LEADER:
+                self.subscribers -= 1
+            self._trim()
+            abandoned = not self.subscribers and self.leader_left
+        # ASGI 模式下 leader 的客户端已经断开，最后一个订阅者离开时停止读取上游
+        if abandoned and self.task is not None:
+            self.task.cancel()
+
+    def finish(self, ok: bool = True, result: Any = None):
+        """结束这次请求（重复调用无效）；ok 为 False 时订阅者收到 FlightFailed"""
+        self.group.release(self)
+        with self.cond:
+            if self.done:
+                return
+            self.done = True
+            self.ok = ok
+            self.result = result
+            self._notify()
+        if not ok:
+            self.group.stats['failed'] += 1
+
+    def abandon(self):
+        """leader 的响应从未开始输出就被关闭时调用，避免订阅者一直等待"""
+        self.finish(ok=False)
+
+    def wait(self, timeout: float = COALESCE_WAIT_TIMEOUT) -> Any:
+        """等待非流式结果"""
+        try:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.done, timeout):
+                    raise FlightFailed("等待合并请求的结果超时")
+        finally:
+            self._leave()
+        if not self.ok:
+            raise FlightFailed("合并的上游请求失败")
+        return self.result
+
+    def wait_started(self, timeout: float = COALESCE_WAIT_TIMEOUT):
+        """等待流式输出开始（有第一个 chunk 或已结束），上游请求失败时抛出 FlightFailed"""
+        try:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.count or self.done, timeout):
+                    raise FlightFailed("等待合并请求的输出超时")
+                if self.done and not self.ok and not self.count:
+                    raise FlightFailed("合并的上游请求失败")
+        except FlightFailed:
+            self._leave()
+            raise
+
+    def subscribe(self, timeout: float = COALESCE_WAIT_TIMEOUT) -> Iterator:
+        """从头回放已输出的 chunk，然后跟随 leader 的后续输出"""
+        return self._read(self._start(object()), timeout)
+
+    def _read(self, token, timeout: float) -> Iterator:
+        try:
+            while True:
+                with self.cond:
+                    if not self.cond.wait_for(lambda: self.cursors[token] < self.count or self.done, timeout):
+                        logger.warning(f"合并请求 {self.key[:12]} 等待输出超时")
+                        return
+                    chunks = self._take(token)
+                    done = self.done
+                yield from chunks
+                if done:
+                    return
+        finally:
+            self._leave(token)
+
+    async def _changed(self, timeout: float) -> bool:
+        if self._event is None:
+            self._event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def await_result(self, timeout: float = COALESCE_WAIT_TIMEOUT) -> Any:
+        """wait 的异步版本"""
+        deadline = time.monotonic() + timeout
+        try:
+            while not self.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not await self._changed(remaining):
+                    raise FlightFailed("等待合并请求的结果超时")
+        finally:
+            self._leave()
+        if not self.ok:
+            raise FlightFailed("合并的上游请求失败")
+        return self.result
+
+    async def await_started(self, timeout: float = COALESCE_WAIT_TIMEOUT):
+        """wait_started 的异步版本"""
+        deadline = time.monotonic() + timeout
+        try:
+            while not (self.count or self.done):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not await self._changed(remaining):
+                    raise FlightFailed("等待合并请求的输出超时")
+            if self.done and not self.ok and not self.count:
+                raise FlightFailed("合并的上游请求失败")
+        except BaseException:
+            self._leave()
+            raise
+
+    def asubscribe(self, timeout: float = COALESCE_WAIT_TIMEOUT) -> AsyncIterator:
+        """subscribe 的异步版本"""
+        return self._aread(self._start(object()), timeout)
+
+    async def _aread(self, token, timeout: float) -> AsyncIterator:
+        try:
+            while True:
+                with self.cond:
+                    chunks = self._take(token)
+                    done = self.done
+                for chunk in chunks:
+                    yield chunk
+                if done:
+                    return
+                # 刚输出过的话先检查期间是否有新 chunk，再等待
+                if not chunks and not await self._changed(timeout):
+                    logger.warning(f"合并请求 {self.key[:12]} 等待输出超时")
+                    return
+        finally:
+            self._leave(token)
+
+    def lead(self, generator: Iterator) -> Iterator:
+        """包装 leader 的输出生成器：每个 chunk 同时发布给订阅者
+
+        leader 的客户端断开时，如果还有订阅者，继续读取上游，直到读完或最后一个订阅者离开。
+        """
+        completed = False
+        try:
+            for chunk in generator:
+                self.publish(chunk)
+                yield chunk
+            completed = True
+        except GeneratorExit:
+            if self.subscribers:
+                for chunk in generator:
+                    self.publish(chunk)
+                    if not self.subscribers:
+                        break
+                else:
+                    completed = True
+            raise
+        finally:
+            close = getattr(generator, 'close', None)
+            if close:
+                close()
+            self.finish(ok=completed)
+
+    def alead(self, timeout: float = COALESCE_WAIT_TIMEOUT) -> AsyncIterator:
+        """ASGI 模式下 leader 的客户端输出：跟随 pump 任务；客户端提前断开且没有订阅者时停止读取上游
+
+        在 pump 任务发布第一个 chunk 之前调用，leader 从第一个 chunk 开始读取。
+        """
+        return self._alead(self._aread(self._start(self._LEADER), timeout))
+
+    async def _alead(self, reader: AsyncIterator) -> AsyncIterator:
+        completed = False
+        try:
+            async for chunk in reader:
+                yield chunk
+            completed = True
+        finally:
+            await reader.aclose()
+            if not completed:
+                with self.cond:
+                    self.leader_left = True
+                    abandoned = not self.subscribers
+                if abandoned and self.task is not None:
+                    self.task.cancel()
+
+    async def pump(self, generator: AsyncIterator):
+        """ASGI 模式下在独立任务中读取上游并发布，与任何一个客户端的连接无关"""
+        completed = False
+        try:
+            async for chunk in generator:
+                self.publish(chunk)
+            completed = True
+        except Exception as e:
+            logger.error(f"合并请求读取上游失败: {e}")
+        finally:
+            aclose = getattr(generator, 'aclose', None)
+            if aclose:
+                await aclose()
+            self.finish(ok=completed)
+
+
+class SingleFlight:
+    """进行中请求的登记表"""
+
+    def __init__(self, mode: str = REQUEST_COALESCING, max_buffer: int = COALESCE_MAX_BUFFER):
+        self.mode = mode
+        self.max_buffer = max_buffer
+        self.flights: Dict[str, Flight] = {}
+        self.lock = threading.Lock()
+        self.stats = {'leaders': 0, 'followers': 0, 'failed': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ('deterministic', 'all')
+
+    def applies(self, deterministic: bool) -> bool:
+        return self.mode == 'all' or (self.mode == 'deterministic' and deterministic)
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """加入相同 key 的进行中请求；没有时创建一个，返回 (flight, 是否为 leader)"""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight._added()
+                self.stats['followers'] += 1
+                return flight, False
+            flight = Flight(key, self)
+            self.flights[key] = flight
+            self.stats['leaders'] += 1
+            return flight, True
+
+    def release(self, flight: Flight):
+        """不再接受新的订阅者"""
+        with self.lock:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+        flight._released()
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            in_flight = len(self.flights)
+        return {'mode': self.mode, 'in_flight': in_flight, **self.stats}
+
+
+def flight_key(cache_key: str, stream: bool, passthrough: bool, include_usage: bool = False) -> str:
+    """请求内容哈希加上输出形式：流式（转换 / 原样转发，是否带 usage chunk）和非流式的结果不能互相复用"""
+    if not stream:
+        return f"{cache_key}:json"
+    if passthrough:
+        return f"{cache_key}:raw"
+    return f"{cache_key}:{'sse+usage' if include_usage else 'sse'}"
@@ -0,0 +1,140 @@
+"""
+上游请求对冲（hedging）：请求在延迟阈值内没有收到上游响应头时，用另一个认证再发一个相同的请求，先成功的胜出
+
+延迟阈值取该模型最近上游响应头耗时的分位数（HEDGE_PERCENTILE），限制在 [HEDGE_MIN_DELAY, HEDGE_MAX_DELAY]，
+样本不足时使用 HEDGE_MAX_DELAY。对冲受令牌预算限制：每个请求为预算增加 HEDGE_BUDGET_RATIO 个令牌，
+每次对冲消耗 1 个（最多积累 HEDGE_BUDGET_BURST 个），因此对冲最多增加 HEDGE_BUDGET_RATIO 比例的上游负载。
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Dict
+
+from metrics import Counter
+
+UPSTREAM_HEDGING = os.getenv('UPSTREAM_HEDGING', '0') == '1'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.5))
+HEDGE_MAX_DELAY = float(os.getenv('HEDGE_MAX_DELAY', 10))
+HEDGE_BUDGET_RATIO = float(os.getenv('HEDGE_BUDGET_RATIO', 0.1))
+HEDGE_BUDGET_BURST = float(os.getenv('HEDGE_BUDGET_BURST', 10))
+HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', 1000))  # 每个模型保留的响应头耗时样本数
+
+# 样本少于该数量时不按分位数计算阈值
+HEDGE_MIN_SAMPLES = 20
+# 每收到多少个新样本重新计算一次分位数
+HEDGE_RECOMPUTE_EVERY = 16
+
+UPSTREAM_HEDGES_TOTAL = Counter(
+    'sophnet_upstream_hedges_total', '对冲请求的结果', ['outcome']
+)
+
+
+class LatencyWindow:
+    """最近 N 个响应头耗时样本，分位数按批重新计算"""
+
+    def __init__(self, size: int):
+        self.samples = deque(maxlen=size)
+        self.added = 0
+        self.cached = None
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.added += 1
+        if self.added % HEDGE_RECOMPUTE_EVERY == 0:
+            self.cached = None
+
+    def percentile(self, p: float):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        if self.cached is None:
+            ordered = sorted(self.samples)
+            self.cached = ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+        return self.cached
+
+
+class Hedger:
+    """对冲策略：延迟阈值、预算和统计（发送和竞速由各服务模式的上游客户端实现）"""
+
+    def __init__(self, enabled: bool = UPSTREAM_HEDGING, percentile: float = HEDGE_PERCENTILE,
+                 min_delay: float = HEDGE_MIN_DELAY, max_delay: float = HEDGE_MAX_DELAY,
+                 budget_ratio: float = HEDGE_BUDGET_RATIO, budget_burst: float = HEDGE_BUDGET_BURST,
+                 window: int = HEDGE_WINDOW):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.window = window
+        self.windows: Dict[str, LatencyWindow] = {}
+        self.tokens = 0.0
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_won': 0,
+            'primary_won': 0,
+            'both_failed': 0,
+            'budget_exhausted': 0,
+            'no_auth': 0,
+        }
+
+    def delay(self, model: str) -> float:
+        """发出对冲请求前等待的秒数"""
+        with self.lock:
+            window = self.windows.get(model)
+            value = window.percentile(self.percentile) if window else None
+        if value is None:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def observe(self, model: str, seconds: float):
+        """记录一次上游响应头耗时（包括输掉竞速的请求，样本不因对冲而偏小）"""
+        with self.lock:
+            window = self.windows.get(model)
+            if window is None:
+                window = self.windows[model] = LatencyWindow(self.window)
+            window.add(seconds)
+
+    def admit(self):
+        """每个可对冲的上游请求为预算增加令牌"""
+        with self.lock:
+            self.stats['requests'] += 1
+            self.tokens = min(self.budget_burst, self.tokens + self.budget_ratio)
+
+    def try_acquire(self) -> bool:
+        """消耗一个令牌发出对冲请求，预算不足时返回 False"""
+        with self.lock:
+            if self.tokens < 1:
+                self.stats['budget_exhausted'] += 1
+                return False
+            self.tokens -= 1
+            self.stats['hedged'] += 1
+            return True
+
+    def refund(self):
+        """取不到第二个认证、没有发出对冲请求时退回令牌"""
+        with self.lock:
+            self.tokens = min(self.budget_burst, self.tokens + 1)
+            self.stats['hedged'] -= 1
+            self.stats['no_auth'] += 1
+
+    def record(self, outcome: str):
+        """记录竞速结果：hedge_won / primary_won / both_failed"""
+        with self.lock:
+            self.stats[outcome] += 1
+        UPSTREAM_HEDGES_TOTAL.labels(outcome).inc()
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+            tokens = self.tokens
+            models = list(self.windows)
+        return {
+            'enabled': self.enabled,
+            'budget_tokens': round(tokens, 2),
+            'delays': {model: round(self.delay(model), 3) for model in models},
+            **stats,
+        }
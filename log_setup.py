@@ -0,0 +1,167 @@
+"""
+日志配置：文本或 JSON 格式、队列异步输出、每请求日志的采样与限流
+
+LOG_FORMAT=json 输出每行一个 JSON 对象；LOG_ASYNC=1 时请求线程只把日志记录放入队列，
+格式化和写出由后台线程完成。每请求的日志行通过 RequestLog 输出，按消息模板采样和限流，
+被丢弃的日志不会创建记录也不会格式化参数，日志量不随请求量增长。
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text 或 json
+LOG_ASYNC = os.getenv('LOG_ASYNC', '0') == '1'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # 队列满时丢弃新日志，不阻塞请求线程
+
+# 每请求日志：保留比例，以及每个消息模板每秒最多输出的条数（0 表示不限）
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 0))
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# LogRecord 自带的属性，JSON 输出时其余属性视为 extra 字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行 JSON，extra 传入的字段原样附加"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """只把记录放入队列；消息格式化推迟到输出线程（标准 QueueHandler 会在调用线程里格式化）"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DeferredQueueHandler] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, use_queue: bool = LOG_ASYNC,
+                      stream=None):
+    """配置根日志器（重复调用会替换之前的配置）"""
+    global _listener, _queue_handler
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if use_queue:
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        root.addHandler(_queue_handler)
+    else:
+        root.addHandler(output)
+
+
+def stop_logging():
+    """停止后台输出线程，写完队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_log_count() -> int:
+    """队列满而丢弃的日志条数"""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+atexit.register(stop_logging)
+
+
+class RequestLog:
+    """每请求日志：按消息模板采样和限流，判定在创建记录之前进行
+
+    消息使用 % 占位符延迟格式化，例如 request_log.info("使用认证 %s", auth.auth_id)。
+    被限流丢弃的条数会附在该模板下一条输出日志的 suppressed 字段中。
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = LOG_SAMPLE_RATE,
+                 rate_limit: int = LOG_RATE_LIMIT):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self._windows: Dict[str, list] = {}  # 模板 -> [窗口开始秒, 本窗口已输出, 已丢弃]
+        self._lock = threading.Lock()
+
+    def _admit(self, msg: str) -> Optional[int]:
+        """决定是否输出，返回需要附带的丢弃计数；不输出时返回 None"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        if not self.rate_limit:
+            return 0
+        second = int(time.monotonic())
+        with self._lock:
+            window = self._windows.get(msg)
+            if window is None or window[0] != second:
+                suppressed = window[2] if window else 0
+                self._windows[msg] = [second, 1, 0]
+                return suppressed
+            if window[1] >= self.rate_limit:
+                window[2] += 1
+                return None
+            window[1] += 1
+            return 0
+
+    def log(self, level: int, msg: str, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._admit(msg)
+        if suppressed is None:
+            return
+        extra = {}
+        if self.sample_rate < 1.0:
+            extra['sample_rate'] = self.sample_rate
+        if suppressed:
+            extra['suppressed'] = suppressed
+        self.logger.log(level, msg, *args, extra=extra or None, stacklevel=3)
+
+    def debug(self, msg: str, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg: str, *args):
+        self.log(logging.INFO, msg, *args)
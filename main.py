@@ -1,28 +1,114 @@
 """
 Sophnet OpenAI-Compatible API Server
 优化版：验证信息池管理、自动刷新、随机Headers
+
+浏览器相关代码在 auth_fetcher.py，只在本进程负责采集认证时才导入；
+使用共享认证池的服务进程不会加载 Playwright。
 """
 
-import json
 import time
+_import_started = time.perf_counter()  # 启动耗时分析的起点，见 --profile-startup
+
+import os
+import re
+import sys
+import json
 import uuid
-import random
 import logging
-import threading
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Generator
-from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Generator, NamedTuple, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 from flask import Flask, request, Response, jsonify, stream_with_context
 from flask_cors import CORS
+import socket
 import requests
-from playwright.sync_api import sync_playwright
-import queue
-from collections import deque
-import hashlib
+from requests.adapters import HTTPAdapter
+from json.encoder import encode_basestring_ascii  # C 实现，转义结果与 json.dumps 一致
+from json.decoder import scanstring
+
+from auth_pool import AuthInfo, AuthPool, AuthStore, AuthHarvester
+from log_setup import RequestLog, configure_logging
+from tracing import NOOP_SPAN, NOOP_TRACE, SPAN_KIND_CLIENT, start_trace, timed_input, trace_stream
+from tracing import exporter as trace_exporter
+from response_cache import (
+    CachedCompletion,
+    ResponseCache,
+    cache_bypassed,
+    cache_key,
+    create_response_cache,
+    is_deterministic,
+    replay_pieces,
+)
+from coalescing import Flight, FlightFailed, SingleFlight, flight_key
+from usage import UsageAccountant, UsageMeter
+from hedging import Hedger
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    AUTH_CHECKOUT_WAIT_SECONDS,
+    UPSTREAM_RETRIES_TOTAL,
+    AUTH_POOL_SIZE,
+    AUTH_CHECKOUT_WAITING,
+    observe_stream,
+    render_metrics,
+)
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# 可选的更快 JSON 后端
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 配置日志（LOG_FORMAT / LOG_ASYNC / LOG_SAMPLE_RATE / LOG_RATE_LIMIT，见 log_setup.py）
+configure_logging()
 logger = logging.getLogger(__name__)
+request_log = RequestLog(logger)  # 每请求的日志行，按配置采样和限流
+
+# 并行认证采集配置：工作线程数（每个线程一个浏览器）与全局并发上限
+HARVEST_WORKERS = int(os.getenv('HARVEST_WORKERS', min(os.cpu_count() or 1, 4)))
+HARVEST_MAX_CONCURRENCY = int(os.getenv('HARVEST_MAX_CONCURRENCY', HARVEST_WORKERS))
+
+# 认证获取器实现：sync（每线程一个浏览器）或 async（专用事件循环，共享浏览器）
+AUTH_FETCHER_MODE = os.getenv('AUTH_FETCHER_MODE', 'sync').lower()
+
+# 上游 HTTP 连接池：缓存的主机连接池数量、每个主机的最大连接数、连接用尽时是否阻塞等待
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', 4))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv('UPSTREAM_POOL_MAXSIZE', 32))
+UPSTREAM_POOL_BLOCK = os.getenv('UPSTREAM_POOL_BLOCK', '0') == '1'
+# 连接复用与 TCP keep-alive 探测（空闲秒数）
+UPSTREAM_KEEPALIVE = os.getenv('UPSTREAM_KEEPALIVE', '1') != '0'
+UPSTREAM_KEEPALIVE_IDLE = int(os.getenv('UPSTREAM_KEEPALIVE_IDLE', 60))
+
+# 上游 SSE 解析后端：auto / scan（定向扫描）/ orjson / json
+SSE_PARSER_BACKEND = os.getenv('SSE_PARSER', 'auto').lower()
+
+# 流式请求原样转发上游字节的模型（逗号分隔），适用于不输出 reasoning_content 的模型
+PASSTHROUGH_MODELS = {m.strip() for m in os.getenv('PASSTHROUGH_MODELS', '').split(',') if m.strip()}
+
+# 非流式响应体：buffered 读完上游后一次返回（上游失败时返回 500）；streamed 边读上游边把 JSON 写给客户端，
+# 不必在内存中保留完整回复，但响应头已经发出，上游中途失败时客户端只会收到不完整的 JSON
+NON_STREAM_BODY = os.getenv('NON_STREAM_BODY', 'buffered').lower()
+# 非流式回复内容的字节数上限（JSON 转义后），超过时截断并以 finish_reason=length 结束
+MAX_RESPONSE_BYTES = int(os.getenv('MAX_RESPONSE_BYTES', 16 * 1024 * 1024))
+
+# 认证池容量：自适应目标在 [最小值, 最大值] 之间，按最近请求速率和采集耗时预测
+AUTH_POOL_MIN_SIZE = int(os.getenv('AUTH_POOL_MIN_SIZE', 3))
+AUTH_POOL_MAX_SIZE = int(os.getenv('AUTH_POOL_MAX_SIZE', 10))
+# 认证池为空时请求排队等待新认证的默认秒数（0 表示立即失败），请求可用 X-Auth-Wait 头调整，上限为最大值
+AUTH_CHECKOUT_TIMEOUT = float(os.getenv('AUTH_CHECKOUT_TIMEOUT', 10))
+AUTH_CHECKOUT_MAX_WAIT = float(os.getenv('AUTH_CHECKOUT_MAX_WAIT', 60))
+
+# 启动方式：blocking 等待认证池初始填充后再开始服务；background 立即开始服务，由刷新线程在后台并发填充
+STARTUP_MODE = os.getenv('STARTUP_MODE', 'blocking').lower()
+
+# 认证快照文件（SQLite），重启时立即加载仍有效的认证；留空则不持久化。文件包含 Cookie，权限设为 0600
+AUTH_STORE_PATH = os.getenv('AUTH_STORE_PATH', '')
+
+# 多进程部署时共享认证池的地址（Unix 套接字路径或 host:port），留空则使用进程内认证池
+AUTH_POOL_ADDRESS = os.getenv('AUTH_POOL_ADDRESS', '')
+AUTH_POOL_AUTHKEY = os.getenv('AUTH_POOL_AUTHKEY', 'sophnet2api')
+
+# 上游地址（压测时指向 benchmarks/mock_upstream.py）
+SOPHNET_BASE_URL = os.getenv('SOPHNET_BASE_URL', 'https://www.sophnet.com').rstrip('/')
 
 # 支持的模型列表
 SUPPORTED_MODELS = [
@@ -53,739 +139,587 @@ SUPPORTED_MODELS = [
     "Qwen2-VL-7B-Instruct"
 ]
 
-# User-Agent 池
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
-]
 
-@dataclass
-class AuthInfo:
-    """认证信息数据类，增加使用计数"""
-    project_id: str
-    auth_headers: Dict[str, str]
-    captcha_data: Dict[str, Any]
-    timestamp: float
-    use_count: int = 0
-    max_uses: int = 10
-    auth_id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
-    
-    def is_valid(self) -> bool:
-        """检查认证是否仍然可用"""
-        # 检查使用次数
-        if self.use_count >= self.max_uses:
-            return False
-        # 检查时间（超过5分钟也失效）
-        if (time.time() - self.timestamp) > 300:
-            return False
-        return True
-    
-    def use(self):
-        """使用一次认证"""
-        self.use_count += 1
-        logger.info(f"Auth {self.auth_id} 使用次数: {self.use_count}/{self.max_uses}")
 
+class SSEDelta(NamedTuple):
+    """上游 SSE 帧中需要的字段"""
+    content: str
+    reasoning: str
+    finish_reason: Optional[str]
+    usage: Optional[Dict]
+
+
+# [DONE] 帧
+SSE_DONE = SSEDelta('', '', None, None)
 
-class AuthPool:
-    """认证信息池管理器 - 增强容错版"""
+
+class UpstreamSSEParser:
+    """直接处理 bytes 的上游 SSE 解析器
     
-    def __init__(self, min_pool_size=3, max_pool_size=10):
-        self.min_pool_size = min_pool_size
-        self.max_pool_size = max_pool_size
-        self.pool = deque(maxlen=max_pool_size)
-        self.lock = threading.Lock()
-        self.refresh_thread = None
-        self.stop_refresh = False
-        self.stats = {
-            'total_created': 0,
-            'total_used': 0,
-            'total_expired': 0,
-            'total_failures': 0,
-            'recovery_attempts': 0
-        }
-        # 新增：失败追踪和自适应策略
-        self.consecutive_failures = 0
-        self.max_consecutive_failures = 5
-        self.backoff_multiplier = 1.0
-        self.last_success_time = time.time()
-        
-    def add_auth(self, auth: AuthInfo):
-        """添加认证到池中 - 增强验证版"""
-        if not auth or not self._validate_auth_info(auth):
-            logger.warning("无效的认证信息，跳过添加")
-            return False
-            
-        with self.lock:
-            # 移除无效的认证
-            self.pool = deque([a for a in self.pool if a.is_valid()], maxlen=self.max_pool_size)
-            self.pool.append(auth)
-            self.stats['total_created'] += 1
-            # 重置失败计数
-            self.consecutive_failures = 0
-            self.backoff_multiplier = 1.0
-            self.last_success_time = time.time()
-            logger.info(f"✅ 添加认证 {auth.auth_id} 到池中，当前池大小: {len(self.pool)}")
-            return True
+    backend:
+        orjson  每帧用 orjson 完整解析（直接接受 bytes）
+        scan    普通 content / reasoning_content 帧用定向扫描提取字段，
+                usage、finish_reason、错误等少见帧回退到完整解析
+        json    每帧用标准库 json 完整解析
+        auto    安装了 orjson 时使用 orjson，否则使用 scan
+    """
+    
+    # 字段值为 null 或字符串，字符串部分允许转义
+    _CONTENT_RE = re.compile(rb'"content":\s*(?:null|"((?:[^"\\]|\\.)*)")')
+    _REASONING_RE = re.compile(rb'"reasoning_content":\s*(?:null|"((?:[^"\\]|\\.)*)")')
+    _DELTA_RE = re.compile(rb'"delta":\s*\{')
+    # usage 帧，以及 delta 中有嵌套对象（定向扫描无法区分层级）的帧
+    _FULL_PARSE_RE = re.compile(rb'"(?:usage|tool_calls|function_call)"')
+    _BRACKET_RE = re.compile(rb'[{}\[]')
     
-    def _validate_auth_info(self, auth: AuthInfo) -> bool:
-        """验证认证信息的完整性"""
-        if not auth.project_id:
-            logger.warning("认证缺少 project_id")
-            return False
+    def __init__(self, backend: str = 'auto'):
+        if backend == 'orjson' and orjson is None:
+            logger.warning("未安装 orjson，SSE 解析回退到 json")
+            backend = 'json'
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'scan'
+        self.backend = backend
+        self.loads = orjson.loads if orjson is not None else json.loads
+        if backend == 'json':
+            self.loads = json.loads
+        self.stats = {'fast_path': 0, 'full_parse': 0}
+    
+    def parse(self, line) -> Optional[SSEDelta]:
+        """解析一行上游数据，非 data 行返回 None，[DONE] 返回 SSE_DONE；JSON 无效时抛出 ValueError"""
+        if not line:
+            return None
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        if not line.startswith(b'data: '):
+            return None
+        payload = line[6:]
+        if payload == b'[DONE]':
+            return SSE_DONE
         
-        if not auth.auth_headers.get('cookie'):
-            logger.warning("认证缺少必要的 cookie")
-            return False
-            
-        # 检查关键 cookies
-        cookie_str = auth.auth_headers.get('cookie', '')
-        essential_cookies = ['sophnet_session', 'auth_token', 'user_id']  # 根据实际情况调整
-        has_essential = any(cookie in cookie_str for cookie in essential_cookies) or len(cookie_str) > 50
+        if self.backend == 'scan':
+            delta = self._scan(payload)
+            if delta is not None:
+                self.stats['fast_path'] += 1
+                return delta
         
-        if not has_essential:
-            logger.warning("认证缺少关键认证信息")
-            return False
-            
-        logger.info(f"认证 {auth.auth_id} 验证通过")
-        return True
+        self.stats['full_parse'] += 1
+        return self._parse_full(payload)
     
-    def remove_auth(self, auth: AuthInfo):
-        """从池中移除指定认证"""
-        with self.lock:
-            try:
-                self.pool.remove(auth)
-                self.stats['total_expired'] += 1
-                logger.info(f"移除失效认证 {auth.auth_id}")
-            except ValueError:
-                pass
+    def _parse_full(self, payload: bytes) -> SSEDelta:
+        data = self.loads(payload)
+        content = ''
+        reasoning = ''
+        finish_reason = None
+        choices = data.get('choices')
+        if choices:
+            choice = choices[0]
+            delta = choice.get('delta') or {}
+            content = delta.get('content') or ''
+            reasoning = delta.get('reasoning_content') or ''
+            finish_reason = choice.get('finish_reason')
+        return SSEDelta(content, reasoning, finish_reason, data.get('usage'))
     
-    def get_auth(self) -> Optional[AuthInfo]:
-        """从池中获取一个可用的认证 - 增强容错版"""
-        with self.lock:
-            # 清理无效认证
-            valid_auths = [a for a in self.pool if a.is_valid()]
-            self.pool = deque(valid_auths, maxlen=self.max_pool_size)
-            
-            current_size = len(self.pool)
-            
-            # 如果池为空或过小，发出紧急警告并触发紧急恢复
-            if not self.pool:
-                logger.error("🚨 认证池完全为空！触发紧急恢复")
-                self.stats['total_failures'] += 1
-                self.consecutive_failures += 1
-                self._trigger_emergency_recovery()
-                return None
-            elif current_size <= 2:
-                logger.warning(f"⚡ 认证池极低 ({current_size} 个)，触发紧急补充")
-                self.stats['recovery_attempts'] += 1
-            elif current_size < self.min_pool_size:
-                logger.warning(f"📉 认证池低于最小值 ({current_size}/{self.min_pool_size})")
-            
-            # 选择最优认证：优先选择使用次数少且时间较新的
-            best_auth = self._select_best_auth()
-            if not best_auth:
-                logger.error("未找到可用的认证")
-                return None
-            
-            # 预测池状态变化
-            remaining_after_use = current_size
-            if best_auth.use_count >= best_auth.max_uses - 1:
-                remaining_after_use -= 1
-                self.pool.remove(best_auth)
-                self.stats['total_expired'] += 1
-                logger.info(f"🗑️ 认证 {best_auth.auth_id} 达到使用上限，从池中移除")
-                
-                # 如果移除后池会变得很小，发出警告
-                if remaining_after_use <= 1:
-                    logger.warning(f"🔥 移除后认证池仅剩 {remaining_after_use} 个，需要快速补充！")
-            
-            best_auth.use()
-            self.stats['total_used'] += 1
-            
-            # 记录使用情况以便监控
-            logger.info(f"📊 使用认证 {best_auth.auth_id} ({best_auth.use_count}/{best_auth.max_uses}), 池剩余: {remaining_after_use}")
-            
-            return best_auth
-    
-    def _select_best_auth(self) -> Optional[AuthInfo]:
-        """选择最优认证：综合考虑使用次数和时间"""
-        if not self.pool:
+    def _scan(self, payload: bytes) -> Optional[SSEDelta]:
+        """定向扫描普通 delta 帧，无法确定时返回 None 交给完整解析"""
+        # 没有 delta（错误帧等）、带 usage、嵌套对象或 finish_reason 非空时走完整解析
+        delta = self._DELTA_RE.search(payload)
+        if delta is None or self._FULL_PARSE_RE.search(payload):
+            return None
+        i = payload.find(b'"finish_reason":')
+        if i >= 0 and not payload[i + 16:i + 22].lstrip().startswith(b'null'):
             return None
-            
-        # 计算每个认证的评分 (越低越好)
-        def auth_score(auth):
-            age_factor = (time.time() - auth.timestamp) / 60  # 年龄因子(分钟)
-            usage_factor = auth.use_count / auth.max_uses  # 使用率因子
-            return age_factor * 0.3 + usage_factor * 0.7
         
-        return min(self.pool, key=auth_score)
+        start = delta.end()
+        content = self._field(self._CONTENT_RE, payload, start)
+        reasoning = self._field(self._REASONING_RE, payload, start)
+        if content is None or reasoning is None:
+            return None
+        return SSEDelta(content, reasoning, None, None)
     
-    def _trigger_emergency_recovery(self):
-        """触发紧急恢复机制"""
-        logger.warning("🚨 触发紧急认证恢复机制")
-        if self.consecutive_failures >= self.max_consecutive_failures:
-            logger.error(f"连续失败次数达到 {self.consecutive_failures}，增加退避时间")
-            self.backoff_multiplier = min(self.backoff_multiplier * 2, 8.0)
+    @classmethod
+    def _field(cls, regex, payload: bytes, start: int) -> Optional[str]:
+        """从 delta 对象开头查找字段；匹配到的字段不在 delta 第一层时返回 None"""
+        match = regex.search(payload, start)
+        if match is None:
+            return ''
+        # delta 开头到字段之间出现括号，说明字段在嵌套对象里或在 delta 之后
+        if cls._BRACKET_RE.search(payload, start, match.start()):
+            return None
+        return cls._decode(match)
     
-    def get_pool_status(self) -> Dict:
-        """获取池状态"""
-        with self.lock:
-            valid_auths = [a for a in self.pool if a.is_valid()]
-            return {
-                'pool_size': len(valid_auths),
-                'auths': [
-                    {
-                        'id': a.auth_id,
-                        'use_count': a.use_count,
-                        'remaining': a.max_uses - a.use_count,
-                        'age': int(time.time() - a.timestamp)
-                    }
-                    for a in valid_auths
-                ],
-                'stats': self.stats
-            }
+    @staticmethod
+    def _decode(match) -> str:
+        """解码匹配到的 JSON 字符串内容，字段不存在或为 null 时返回 ''"""
+        if match is None:
+            return ''
+        raw = match.group(1)
+        if not raw:
+            return ''
+        if b'\\' in raw:
+            return scanstring(raw.decode('utf-8') + '"', 0)[0]
+        return raw.decode('utf-8')
+
+
+sse_parser = UpstreamSSEParser(SSE_PARSER_BACKEND)
+
+
+class SSEChunkEncoder:
+    """预先序列化 chunk 中不变的 JSON 前后缀，每个 token 只转义并拼接 delta 文本
     
-    def start_refresh_thread(self, auth_fetcher):
-        """启动自动刷新线程 - 智能容错版"""
-        self.stop_refresh_flag = False
-        
-        def refresh_worker():
-            logger.info("🔄 启动认证池自动刷新线程 (智能容错版)")
-            
-            while not self.stop_refresh_flag:
-                try:
-                    # 检查池大小和状态
-                    with self.lock:
-                        valid_auths = [a for a in self.pool if a.is_valid()]
-                        current_size = len(valid_auths)
-                        
-                        # 计算即将过期的认证数量 (使用次数超过7次或时间超过4分钟)
-                        soon_expire = len([a for a in valid_auths
-                                         if a.use_count >= 7 or (time.time() - a.timestamp) > 240])
-                        
-                        # 检查是否需要应用退避策略
-                        backoff_delay = self.backoff_multiplier
-                    
-                    # 智能补充策略：根据失败情况调整
-                    need_replenish = False
-                    target_fetch = 0
-                    urgency_level = 0  # 紧急程度：0=正常，1=警告，2=紧急
-                    
-                    if current_size == 0:
-                        need_replenish = True
-                        target_fetch = self.min_pool_size
-                        urgency_level = 2
-                        logger.error(f"🚨 认证池完全空，紧急补充 {target_fetch} 个认证")
-                    elif current_size < self.min_pool_size:
-                        need_replenish = True
-                        target_fetch = min(self.min_pool_size - current_size, 2)  # 限制单次获取数量
-                        urgency_level = 2 if current_size <= 1 else 1
-                        logger.info(f"🔥 池大小 ({current_size}) 低于最小值 ({self.min_pool_size})，需要补充 {target_fetch} 个认证")
-                    elif soon_expire > 0 and (current_size - soon_expire) < self.min_pool_size:
-                        need_replenish = True
-                        target_fetch = 1  # 预防性补充
-                        urgency_level = 1
-                        logger.info(f"⚠️ 有 {soon_expire} 个认证即将过期，预防性补充认证")
-                    elif current_size < (self.min_pool_size + 1):
-                        need_replenish = True
-                        target_fetch = 1  # 保持缓冲
-                        urgency_level = 0
-                        logger.info(f"🚀 主动维持认证池缓冲，当前 {current_size} 个")
-                    
-                    if need_replenish:
-                        success_count = 0
-                        for i in range(target_fetch):
-                            if self.stop_refresh_flag:
-                                break
-                                
-                            logger.info(f"🔄 获取新认证 {i+1}/{target_fetch}...")
-                            
-                            try:
-                                auth = auth_fetcher()
-                                if auth and self.add_auth(auth):
-                                    success_count += 1
-                                    logger.info(f"✅ 成功添加认证 {auth.auth_id}")
-                                    
-                                    # 成功时重置退避
-                                    with self.lock:
-                                        self.consecutive_failures = max(0, self.consecutive_failures - 1)
-                                        if self.consecutive_failures == 0:
-                                            self.backoff_multiplier = 1.0
-                                else:
-                                    logger.error(f"❌ 获取新认证失败")
-                                    with self.lock:
-                                        self.consecutive_failures += 1
-                                        self.stats['total_failures'] += 1
-                                        if self.consecutive_failures >= 3:
-                                            self.backoff_multiplier = min(self.backoff_multiplier * 1.5, 8.0)
-                                            logger.warning(f"连续失败 {self.consecutive_failures} 次，增加退避时间至 {self.backoff_multiplier:.1f}x")
-                                            
-                            except Exception as e:
-                                logger.error(f"获取认证时异常: {e}")
-                                with self.lock:
-                                    self.consecutive_failures += 1
-                                    self.stats['total_failures'] += 1
-                            
-                            # 根据紧急程度调整间隔
-                            if i < target_fetch - 1:
-                                interval = 1.0 if urgency_level >= 2 else (2.0 if urgency_level == 1 else 3.0)
-                                time.sleep(interval * backoff_delay)
-                        
-                        # 记录本轮补充结果
-                        if success_count > 0:
-                            logger.info(f"✅ 本轮成功补充 {success_count}/{target_fetch} 个认证")
-                        else:
-                            logger.warning(f"⚠️ 本轮补充失败，0/{target_fetch} 成功")
-                    
-                    # 根据当前状态调整检查间隔
-                    base_interval = 5  # 基础间隔5秒
-                    if urgency_level >= 2:
-                        check_interval = base_interval // 2  # 紧急情况快速检查
-                    elif urgency_level == 1:
-                        check_interval = base_interval
-                    else:
-                        check_interval = base_interval * 2  # 正常情况慢速检查
-                        
-                    # 应用退避延迟
-                    check_interval = int(check_interval * backoff_delay)
-                    
-                    for _ in range(check_interval):
-                        if self.stop_refresh_flag:
-                            break
-                        time.sleep(1)
-                        
-                except Exception as e:
-                    logger.error(f"刷新线程错误: {e}")
-                    with self.lock:
-                        self.consecutive_failures += 1
-                        self.stats['total_failures'] += 1
-                    # 错误恢复等待时间也应用退避
-                    time.sleep(3 * self.backoff_multiplier)
-            
-            logger.info("🛑 认证池刷新线程已停止")
-        
-        self.refresh_thread = threading.Thread(target=refresh_worker, daemon=True)
-        self.refresh_thread.start()
+    输出与 json.dumps 整个 chunk 字典的结果逐字节一致。
+    """
+    
+    # 模型名和 id 中不会出现 \x00，用它在渲染结果中定位 content 的位置
+    _SENTINEL = '\x00'
+    _ENCODED_SENTINEL = encode_basestring_ascii(_SENTINEL)
+    
+    def __init__(self, chat_id: str, created: int, model: str, include_usage: bool = False):
+        self.chat_id = chat_id
+        self.created = created
+        self.model = model
+        self.include_usage = include_usage
+        self.prefix, suffix = self._render(None).split(self._ENCODED_SENTINEL)
+        self._suffixes = {None: suffix}
     
-    def stop_refresh(self):
-        """停止刷新线程"""
-        self.stop_refresh_flag = True
-        if self.refresh_thread:
-            self.refresh_thread.join(timeout=5)
+    def _render(self, finish_reason: Optional[str]) -> str:
+        openai_chunk = {
+            "id": self.chat_id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": self._SENTINEL},
+                    "finish_reason": finish_reason
+                }
+            ]
+        }
+        if self.include_usage:
+            # 请求了 stream_options.include_usage 时，每个 chunk 都带 usage 字段，只有最后的 usage chunk 不为 null
+            openai_chunk["usage"] = None
+        return f"data: {json.dumps(openai_chunk)}\n\n"
+    
+    def encode(self, content: str, finish_reason: Optional[str] = None) -> str:
+        """编码一个 content delta 为完整的 SSE 事件"""
+        suffix = self._suffixes.get(finish_reason)
+        if suffix is None:
+            suffix = self._render(finish_reason).split(self._ENCODED_SENTINEL)[1]
+            self._suffixes[finish_reason] = suffix
+        return self.prefix + encode_basestring_ascii(content) + suffix
+    
+    def encode_usage(self, usage: Dict) -> str:
+        """编码 [DONE] 之前的 usage chunk（choices 为空）"""
+        openai_chunk = {
+            "id": self.chat_id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [],
+            "usage": usage
+        }
+        return f"data: {json.dumps(openai_chunk)}\n\n"
 
 
-class SophnetAuthFetcher:
-    """认证获取器 - 完全使用之前可工作的版本"""
+class OpenAIStreamConverter:
+    """把上游 SSE 行转换为 OpenAI chunk，reasoning_content 包装在 <think> 标签中"""
     
-    def __init__(self, headless: bool = True):
-        self.base_url = "https://www.sophnet.com"
-        self.chat_url = "https://www.sophnet.com/#/playground/chat"
-        self.headless = True  # 强制设置为 True，确保后台运行
-        self.project_id = None
-        self.auth_headers = {}
-        self.captcha_data = {}
-        self.request_queue = queue.Queue()
+    def __init__(self, model: str, parser: Optional[UpstreamSSEParser] = None, record: bool = False,
+                 usage: Optional[UsageAccountant] = None, include_usage: bool = False):
+        self.parser = parser or sse_parser
+        self.chat_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        self.created = int(time.time())
+        self.model = model
         
-        # 记录浏览器配置
-        logger.info(f"SophnetAuthFetcher 初始化 - 无头模式: {self.headless}")
-        if not self.headless:
-            logger.warning("⚠️  浏览器将以有界面模式运行！")
+        # usage 不为空时边转发边计数；include_usage 为 True 时在 [DONE] 之前输出 usage chunk
+        self.usage = usage
+        self.include_usage = include_usage and usage is not None
+        self.encoder = SSEChunkEncoder(self.chat_id, self.created, model, self.include_usage)
+        self._chunk = self.encoder.encode
         
-    def fetch_auth(self) -> Optional[AuthInfo]:
-        """获取认证信息 - 完全复制之前可工作的方法"""
-        logger.info("正在通过浏览器获取认证信息...")
+        self.think_tag_sent = False
+        self.think_close_tag_sent = False
+        self.has_reasoning = False
+        self.done = False
+        self.tokens = 0  # 收到的内容帧数（含思考过程），用于统计输出速度
         
-        playwright = None
-        browser = None
-        page = None
+        # record 为 True 时保留完整文本，用于写入响应缓存
+        self.record = record
+        self.content: List[str] = []
+        self.reasoning: List[str] = []
+        self.reasoning_tokens = 0
+    
+    def feed(self, line) -> List[str]:
+        """处理一行上游数据（bytes 或 str），返回需要发送给客户端的 SSE 事件"""
+        try:
+            delta = self.parser.parse(line)
+        except Exception as e:
+            logger.error(f"解析流式响应失败: {e}")
+            return []
+        if delta is None:
+            return []
+        out = []
         
-        # 重置实例变量
-        self.project_id = None
-        self.auth_headers = {}
-        self.captcha_data = {}
+        if delta is SSE_DONE:
+            if self.has_reasoning and not self.think_close_tag_sent:
+                out.append(self._chunk("</think>\n\n"))
+            if self.include_usage:
+                out.append(self.encoder.encode_usage(self.usage.result()))
+            out.append("data: [DONE]\n\n")
+            self.done = True
+            return out
         
-        try:
-            playwright = sync_playwright().start()
-            
-            # 使用 Chromium，配置为完全后台运行模式
-            browser = playwright.chromium.launch(
-                headless=True,  # 强制启用无头模式
-                args=[
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-dev-shm-usage',
-                    '--no-sandbox',
-                    '--disable-web-security',
-                    '--disable-features=IsolateOrigins,site-per-process',
-                    '--disable-gpu',  # 禁用GPU加速
-                    '--no-first-run',  # 禁用首次运行提示
-                    '--disable-background-timer-throttling',
-                    '--disable-renderer-backgrounding',
-                    '--disable-backgrounding-occluded-windows',
-                    '--disable-ipc-flooding-protection',
-                    '--disable-default-apps',
-                    '--disable-extensions',
-                    '--disable-plugins',
-                    '--disable-sync',
-                    '--disable-translate',
-                    '--hide-scrollbars',
-                    '--mute-audio',
-                    '--no-default-browser-check',
-                    '--no-zygote'  # 完全禁用任何UI相关进程
-                ]
-            )
-            
-            # 创建浏览器上下文 - 完全复制之前的配置
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                locale='zh-CN',
-                timezone_id='Asia/Shanghai'
-            )
-            
-            page = context.new_page()
-            
-            # 设置请求拦截器 - 完全复制之前的方法
-            def handle_route(route):
-                """处理拦截的请求"""
-                request = route.request
-                url = request.url
-                
-                # 拦截 completion API 请求
-                if '/chat/completions' in url:
-                    # 提取 project ID
-                    if '/projects/' in url:
-                        parts = url.split('/projects/')
-                        if len(parts) > 1:
-                            project_part = parts[1].split('/')[0]
-                            self.project_id = project_part
-                    
-                    # 获取请求头
-                    headers = request.headers
-                    self.auth_headers = {
-                        'authorization': headers.get('authorization', ''),
-                        'cookie': headers.get('cookie', ''),
-                        'user-agent': headers.get('user-agent', ''),
-                        'accept': headers.get('accept', ''),
-                        'content-type': headers.get('content-type', 'application/json')
-                    }
-                    
-                    # 获取请求体
-                    post_data = request.post_data
-                    if post_data:
-                        try:
-                            body_data = json.loads(post_data)
-                            # 提取验证码数据
-                            if 'verifyIntelligentCaptchaRequest' in body_data:
-                                self.captcha_data = body_data['verifyIntelligentCaptchaRequest']
-                            
-                            logger.info(f"✅ 成功拦截 API 请求")
-                            logger.info(f"   Project ID: {self.project_id}")
-                        except Exception as e:
-                            logger.error(f"解析请求体失败: {e}")
-                
-                # 继续原始请求
-                route.continue_()
-            
-            # 拦截所有网络请求
-            page.route("**/*", handle_route)
-            
-            # 额外注入 JavaScript 拦截器（备用方案）- 完全复制之前的
-            page.add_init_script("""
-                // 拦截 fetch 请求
-                const originalFetch = window.fetch;
-                window.__interceptedRequests = [];
-                
-                window.fetch = async function(...args) {
-                    const [url, options] = args;
-                    
-                    if (url.includes('/chat/completions')) {
-                        // 保存请求信息
-                        const requestInfo = {
-                            url: url,
-                            method: options?.method || 'GET',
-                            headers: options?.headers || {},
-                            body: options?.body || null,
-                            timestamp: Date.now()
-                        };
-                        
-                        window.__interceptedRequests.push(requestInfo);
-                        console.log('Intercepted request:', requestInfo);
-                        
-                        // 将信息存储到 localStorage
-                        localStorage.setItem('lastInterceptedRequest', JSON.stringify(requestInfo));
-                    }
-                    
-                    return originalFetch.apply(this, args);
-                };
-            """)
-            
-            # 快速访问聊天页面，仅等待DOM加载完成
-            logger.info("正在快速加载聊天页面...")
-            page.goto(self.chat_url, wait_until='domcontentloaded')
-            
-            # 立即获取当前cookies
-            logger.info("正在提取初始cookies...")
-            cookies = context.cookies()
-            initial_cookies = '; '.join([f"{c['name']}={c['value']}" for c in cookies])
-            if initial_cookies:
-                self.auth_headers['cookie'] = initial_cookies
-                logger.info(f"✅ 获取到初始cookies: {len(cookies)} 个")
-            
-            # 短暂等待让页面基本渲染完成
-            time.sleep(1)
-            
-            # 尝试找到输入框，但不要求完全加载
-            logger.info("寻找聊天输入框...")
-            input_selectors = [
-                'textarea[placeholder="请输入内容"]',
-                'textarea.el-textarea__inner',
-                'textarea[autofocus]',
-                '.el-textarea textarea'
-            ]
-            
-            input_box = None
-            for selector in input_selectors:
-                try:
-                    # 使用较短的超时时间
-                    page.wait_for_selector(selector, timeout=3000)
-                    input_box = page.locator(selector).first
-                    logger.info(f"✅ 找到输入框: {selector}")
-                    break
-                except:
-                    continue
-            
-            # 如果没找到输入框，尝试其他方法获取认证信息
-            if not input_box:
-                logger.warning("⚠️ 未找到输入框，尝试直接从页面获取认证信息...")
-                
-                # 尝试从页面的localStorage或其他地方获取信息
-                try:
-                    # 等待一下让页面JavaScript执行
-                    time.sleep(2)
-                    
-                    # 更新cookies
-                    cookies = context.cookies()
-                    updated_cookies = '; '.join([f"{c['name']}={c['value']}" for c in cookies])
-                    if updated_cookies:
-                        self.auth_headers['cookie'] = updated_cookies
-                        logger.info(f"✅ 更新cookies: {len(cookies)} 个")
-                    
-                    # 尝试从页面获取project_id
-                    try:
-                        current_url = page.url
-                        if '/projects/' in current_url:
-                            parts = current_url.split('/projects/')
-                            if len(parts) > 1:
-                                project_part = parts[1].split('/')[0]
-                                self.project_id = project_part
-                                logger.info(f"✅ 从URL获取project_id: {self.project_id}")
-                    except:
-                        pass
-                    
-                except Exception as e:
-                    logger.warning(f"从页面获取认证信息失败: {e}")
-            
-            else:
-                # 如果找到输入框，发送快速测试消息
-                logger.info("发送测试消息...")
-                try:
-                    # 清空并输入消息
-                    input_box.click()
-                    time.sleep(0.3)  # 减少等待时间
-                    input_box.fill("test")
-                    time.sleep(0.3)  # 减少等待时间
-                    
-                    # 按回车发送
-                    input_box.press('Enter')
-                    logger.info("📤 已发送测试消息")
-                    
-                    # 等待请求被拦截，减少等待时间
-                    logger.info("等待拦截请求...")
-                    for i in range(5):  # 减少等待循环次数
-                        if self.project_id and self.auth_headers.get('authorization'):
-                            logger.info(f"✅ 成功获取认证信息 (等待 {i+1}秒)")
-                            break
-                        time.sleep(1)
-                        
-                        # 更新cookies
-                        cookies = context.cookies()
-                        updated_cookies = '; '.join([f"{c['name']}={c['value']}" for c in cookies])
-                        if updated_cookies:
-                            self.auth_headers['cookie'] = updated_cookies
-                        
-                except Exception as e:
-                    logger.warning(f"发送测试消息失败: {e}")
-            
-            # 最终检查和构建认证信息
-            logger.info("正在构建最终认证信息...")
-            
-            # 确保有基本的cookies
-            if not self.auth_headers.get('cookie'):
-                cookies = context.cookies()
-                if cookies:
-                    cookie_str = '; '.join([f"{c['name']}={c['value']}" for c in cookies])
-                    self.auth_headers['cookie'] = cookie_str
-                    logger.info(f"✅ 最终获取到cookies: {len(cookies)} 个")
-            
-            # 尝试从页面获取project_id（如果还没有）
-            if not self.project_id:
-                try:
-                    # 尝试从当前URL获取
-                    current_url = page.url
-                    if '/projects/' in current_url:
-                        parts = current_url.split('/projects/')
-                        if len(parts) > 1:
-                            project_part = parts[1].split('/')[0]
-                            self.project_id = project_part
-                            logger.info(f"✅ 从URL获取project_id: {self.project_id}")
-                    
-                    # 尝试从localStorage获取
-                    if not self.project_id:
-                        stored_data = page.evaluate("() => localStorage.getItem('lastInterceptedRequest')")
-                        if stored_data:
-                            data = json.loads(stored_data)
-                            logger.info(f"从localStorage获取到数据: {data.get('url', 'N/A')}")
-                except Exception as e:
-                    logger.warning(f"获取project_id失败: {e}")
-                
-                # 使用默认值作为最后手段
-                if not self.project_id:
-                    logger.warning("⚠️ 未能获取project_id，使用默认值")
-                    self.project_id = "Ar79PWUQUAhjJOja2orHs"
-            
-            # 设置基本的认证头
-            if not self.auth_headers.get('user-agent'):
-                self.auth_headers['user-agent'] = random.choice(USER_AGENTS)
+        if delta.reasoning or delta.content:
+            self.tokens += 1
+            if self.usage is not None:
+                self.usage.feed(delta.content, delta.reasoning)
+        if delta.usage and self.usage is not None:
+            self.usage.observe(delta.usage)
+        
+        if self.record:
+            if delta.reasoning:
+                self.reasoning.append(delta.reasoning)
+            if delta.content:
+                self.content.append(delta.content)
+            if delta.usage and 'completion_tokens_details' in delta.usage:
+                self.reasoning_tokens = delta.usage['completion_tokens_details'].get('reasoning_tokens', 0)
+        
+        if delta.reasoning:
+            self.has_reasoning = True
             
-            if not self.auth_headers.get('accept'):
-                self.auth_headers['accept'] = 'application/json'
+            if not self.think_tag_sent:
+                out.append(self._chunk("<think>"))
+                self.think_tag_sent = True
             
-            # 构建认证信息（即使没有完整信息也尝试构建）
-            if self.project_id and self.auth_headers.get('cookie'):
-                auth_info = AuthInfo(
-                    project_id=self.project_id,
-                    auth_headers=self.auth_headers,
-                    captcha_data=self.captcha_data,
-                    timestamp=time.time()
-                )
-                
-                logger.info(f"✅ 快速获取认证信息完成!")
-                logger.info(f"   Project ID: {auth_info.project_id}")
-                logger.info(f"   Auth ID: {auth_info.auth_id}")
-                logger.info(f"   有cookies: {bool(auth_info.auth_headers.get('cookie'))}")
-                logger.info(f"   有authorization: {bool(auth_info.auth_headers.get('authorization'))}")
-                
-                return auth_info
-            else:
-                logger.error("未能获取基本认证信息（project_id或cookies缺失）")
-                return None
-                
-        except Exception as e:
-            logger.error(f"获取认证失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+            out.append(self._chunk(delta.reasoning))
+        
+        if delta.content:
+            if self.has_reasoning and not self.think_close_tag_sent:
+                out.append(self._chunk("</think>\n\n"))
+                self.think_close_tag_sent = True
             
-        finally:
-            if page:
-                page.close()
-            if browser:
-                browser.close()
-            if playwright:
-                playwright.stop()
+            out.append(self._chunk(delta.content, delta.finish_reason))
+        
+        return out
+
+
+class CompletionBodyWriter:
+    """把上游 SSE 流直接编码为非流式响应的 JSON 响应体
+    
+    delta 到达时只转义为 JSON 字符串片段并交给调用方写出，不保留 delta 列表，也不再拼接 <think> 块、
+    构建响应字典和整体序列化，内存中最多只有一份编码后的回复。字段与 format_openai_response 一致，
+    思考过程放在 <think> 标签中；回复超过 max_bytes 时截断，finish_reason 为 length。
+    """
+    
+    # 与 SSEChunkEncoder 相同：用 \x00 在渲染结果中定位 content 的位置
+    _SENTINEL = '\x00'
+    _ENCODED_SENTINEL = encode_basestring_ascii(_SENTINEL)[1:-1]
+    
+    def __init__(self, model: str, usage: UsageAccountant, max_bytes: int = MAX_RESPONSE_BYTES,
+                 parser: Optional[UpstreamSSEParser] = None, record: bool = False):
+        self.parser = parser or sse_parser
+        self.model = model
+        self.usage = usage
+        self.max_bytes = max_bytes
+        self.chat_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        self.created = int(time.time())
+        self.fingerprint = f"fp_{uuid.uuid4().hex[:6]}"
+        
+        self.size = 0  # 已写出的回复字节数（转义后）
+        self.truncated = False
+        self.finish_reason = None
+        self.has_reasoning = False
+        self.think_close_tag_sent = False
+        
+        # record 为 True 时保留原文，用于写入响应缓存和交给合并请求的订阅者
+        self.record = record
+        self.content: List[str] = []
+        self.reasoning: List[str] = []
+        self.reasoning_tokens = 0
+    
+    def _render(self, usage: Optional[Dict], finish_reason: Optional[str]) -> List[str]:
+        body = {
+            "id": self.chat_id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": self._SENTINEL,
+                        "refusal": None
+                    },
+                    "finish_reason": finish_reason
+                }
+            ],
+            "usage": usage,
+            "system_fingerprint": self.fingerprint
+        }
+        return json.dumps(body).split(self._ENCODED_SENTINEL)
+    
+    def start(self) -> bytes:
+        """响应体开头（到 content 字符串的开引号为止）"""
+        return self._render(None, None)[0].encode('ascii')
+    
+    def _write(self, text: str) -> str:
+        if self.truncated:
+            return ''
+        encoded = encode_basestring_ascii(text)[1:-1]
+        if self.size + len(encoded) > self.max_bytes:
+            self.truncated = True
+            return ''
+        self.size += len(encoded)
+        return encoded
+    
+    def feed(self, line) -> bytes:
+        """处理一行上游数据（bytes 或 str），返回需要写出的响应体片段"""
+        if self.truncated:
+            return b''
+        try:
+            delta = self.parser.parse(line)
+        except Exception:
+            return b''
+        if delta is None or delta is SSE_DONE:
+            return b''
+        
+        if delta.finish_reason:
+            self.finish_reason = delta.finish_reason
+        usage = delta.usage
+        if usage:
+            self.usage.observe(usage)
+            if 'completion_tokens_details' in usage:
+                self.reasoning_tokens = usage['completion_tokens_details'].get('reasoning_tokens', 0)
+        if not (delta.reasoning or delta.content):
+            return b''
+        self.usage.feed(delta.content, delta.reasoning)
+        
+        out = ''
+        if delta.reasoning:
+            if not self.has_reasoning:
+                out += self._write('<think>')
+                self.has_reasoning = True
+            out += self._write(delta.reasoning)
+            if self.record:
+                self.reasoning.append(delta.reasoning)
+        if delta.content:
+            if self.has_reasoning and not self.think_close_tag_sent:
+                out += self._write('</think>\n\n')
+                self.think_close_tag_sent = True
+            out += self._write(delta.content)
+            if self.record:
+                self.content.append(delta.content)
+        return out.encode('ascii')
+    
+    def finish(self) -> bytes:
+        """响应体结尾：关闭 <think> 标签（不计入上限），写入 finish_reason 和 usage"""
+        out = ''
+        if self.has_reasoning and not self.think_close_tag_sent:
+            out = encode_basestring_ascii('</think>\n\n')[1:-1]
+        finish_reason = 'length' if self.truncated else (self.finish_reason or 'stop')
+        return (out + self._render(self.usage.result(), finish_reason)[1]).encode('ascii')
+    
+    def completion(self) -> CachedCompletion:
+        """record 为 True 时记录的完整回复"""
+        return CachedCompletion(''.join(self.content), ''.join(self.reasoning), self.reasoning_tokens, time.time())
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """为连接池中的套接字开启 TCP keep-alive，避免空闲连接被中间设备静默断开"""
+    
+    def __init__(self, keepalive_idle: int = 60, **kwargs):
+        self.keepalive_idle = keepalive_idle
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                   (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_idle))
+        kwargs['socket_options'] = options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def create_upstream_session(pool_connections: int = UPSTREAM_POOL_CONNECTIONS,
+                            pool_maxsize: int = UPSTREAM_POOL_MAXSIZE,
+                            pool_block: bool = UPSTREAM_POOL_BLOCK,
+                            keepalive: bool = UPSTREAM_KEEPALIVE,
+                            keepalive_idle: int = UPSTREAM_KEEPALIVE_IDLE) -> requests.Session:
+    """创建复用 TCP/TLS 连接的上游会话"""
+    session = requests.Session()
+    adapter = KeepAliveAdapter(
+        keepalive_idle=keepalive_idle,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=0  # 重试由 call_sophnet_api 按认证切换处理
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keepalive:
+        session.headers['connection'] = 'close'
+    return session
 
 
 class SophnetOpenAIAPI:
     """Sophnet OpenAI 兼容 API"""
     
-    def __init__(self, auth_pool: AuthPool):
+    def __init__(self, auth_pool: AuthPool, session: Optional[requests.Session] = None,
+                 response_cache: Optional[ResponseCache] = None, usage_meter: Optional[UsageMeter] = None,
+                 hedger: Optional[Hedger] = None):
         self.auth_pool = auth_pool
-        self.base_url = "https://www.sophnet.com"
+        self.base_url = SOPHNET_BASE_URL
+        # 所有上游请求共享连接池，避免每次请求重新握手
+        self.session = session or create_upstream_session()
+        self.response_cache = response_cache
+        self.usage_meter = usage_meter or UsageMeter()
+        # 开启对冲时上游请求在线程池中发送，请求线程可以在等待响应头超时后发出第二个请求
+        self.hedger = hedger or Hedger()
+        self.hedge_executor = ThreadPoolExecutor(max_workers=UPSTREAM_POOL_MAXSIZE * 4,
+                                                 thread_name_prefix='upstream-hedge') if self.hedger.enabled else None
+    
+    def get_connection_pool_status(self) -> Dict:
+        """获取上游连接池占用情况"""
+        adapter = self.session.get_adapter(self.base_url)
+        pools = []
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            # 队列中剩余的是空闲连接和未创建连接的空位，其余即为正在使用的连接
+            available = pool.pool.qsize() if pool.pool is not None else 0
+            pools.append({
+                'host': f"{pool.scheme}://{pool.host}:{pool.port}",
+                'maxsize': pool.pool.maxsize if pool.pool is not None else 0,
+                'in_use': (pool.pool.maxsize - available) if pool.pool is not None else 0,
+                'connections_created': pool.num_connections,
+                'requests': pool.num_requests
+            })
+        return {
+            'pool_connections': adapter._pool_connections,
+            'pool_maxsize': adapter._pool_maxsize,
+            'pool_block': adapter._pool_block,
+            'pools': pools
+        }
         
+    def build_upstream_request(self, auth: AuthInfo, messages: List[Dict], model: str,
+                               stream: bool = False, **kwargs):
+        """构建上游请求的 URL、请求头和请求体"""
+        # 构建 URL
+        url = f"{self.base_url}/api/open-apis/projects/{auth.project_id}/chat/completions"
+        
+        # 构建请求头 - 保持原有格式
+        headers = {
+            'accept': 'text/event-stream' if stream else 'application/json',
+            'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8',
+            'content-type': 'application/json',
+            'origin': self.base_url,
+            'referer': f"{self.base_url}/#/playground/chat",
+            'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
+            'sec-ch-ua-mobile': '?0',
+            'sec-ch-ua-platform': '"Windows"',
+            'sec-fetch-dest': 'empty',
+            'sec-fetch-mode': 'cors',
+            'sec-fetch-site': 'same-origin'
+        }
+        
+        # 更新认证头
+        headers.update(auth.auth_headers)
+        
+        # 构建请求体
+        payload = {
+            "model_id": model,
+            "messages": messages,
+            "stream": str(stream).lower(),
+            "temperature": kwargs.get('temperature', 1.0),
+            "top_p": kwargs.get('top_p', 1.0),
+            "max_tokens": kwargs.get('max_tokens', 2048),
+            "frequency_penalty": kwargs.get('frequency_penalty', 0),
+            "presence_penalty": kwargs.get('presence_penalty', 0),
+            "webSearchEnable": False,
+            "stop": kwargs.get('stop', [])
+        }
+        
+        # 添加验证码
+        if auth.captcha_data:
+            payload['verifyIntelligentCaptchaRequest'] = auth.captcha_data
+        
+        return url, headers, payload
+    
+    @staticmethod
+    def is_auth_expired_error(error_data: Dict) -> bool:
+        """判断 401 响应是否表示认证已失效"""
+        return error_data.get("message") == "You must log in first" or error_data.get("status") == 10025
+    
     def call_sophnet_api(self, messages: List[Dict], model: str, stream: bool = False,
+                         auth_timeout: float = AUTH_CHECKOUT_TIMEOUT, trace=NOOP_TRACE,
                          **kwargs) -> Optional[requests.Response]:
-        """调用 Sophnet API"""
+        """调用 Sophnet API，认证池为空时最多排队等待 auth_timeout 秒
+        
+        trace 为本次请求的追踪（tracing.start_trace），记录每次取用认证和上游请求的 span。
+        """
         
         max_retries = 3  # 最多重试3次
         
         for retry_count in range(max_retries):
             # 从池中获取认证
-            auth = self.auth_pool.get_auth()
+            checkout_span = trace.span('auth.checkout', attributes={'attempt': retry_count + 1})
+            checkout_start = time.perf_counter()
+            auth = self.auth_pool.get_auth(auth_timeout)
+            AUTH_CHECKOUT_WAIT_SECONDS.observe(time.perf_counter() - checkout_start)
+            checkout_span.end()
             if not auth:
+                checkout_span.error('no auth available')
                 logger.error("无法从池中获取认证")
                 return None
+            checkout_span.set('auth.id', auth.auth_id)
+            checkout_span.set('auth.use_count', auth.use_count)
             
-            logger.info(f"使用认证 {auth.auth_id} (已用 {auth.use_count}/{auth.max_uses}) - 尝试 {retry_count + 1}/{max_retries}")
+            request_log.info("使用认证 %s (已用 %d/%d) - 尝试 %d/%d",
+                             auth.auth_id, auth.use_count, auth.max_uses, retry_count + 1, max_retries)
             
-            # 构建 URL
-            url = f"{self.base_url}/api/open-apis/projects/{auth.project_id}/chat/completions"
-            
-            # 构建请求头 - 保持原有格式
-            headers = {
-                'accept': 'text/event-stream' if stream else 'application/json',
-                'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                'content-type': 'application/json',
-                'origin': self.base_url,
-                'referer': f"{self.base_url}/#/playground/chat",
-                'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
-                'sec-ch-ua-mobile': '?0',
-                'sec-ch-ua-platform': '"Windows"',
-                'sec-fetch-dest': 'empty',
-                'sec-fetch-mode': 'cors',
-                'sec-fetch-site': 'same-origin'
-            }
-            
-            # 更新认证头
-            headers.update(auth.auth_headers)
-            
-            # 构建请求体
-            payload = {
-                "model_id": model,
-                "messages": messages,
-                "stream": str(stream).lower(),
-                "temperature": kwargs.get('temperature', 1.0),
-                "top_p": kwargs.get('top_p', 1.0),
-                "max_tokens": kwargs.get('max_tokens', 2048),
-                "frequency_penalty": kwargs.get('frequency_penalty', 0),
-                "presence_penalty": kwargs.get('presence_penalty', 0),
-                "webSearchEnable": False,
-                "stop": kwargs.get('stop', [])
-            }
-            
-            # 添加验证码
-            if auth.captcha_data:
-                payload['verifyIntelligentCaptchaRequest'] = auth.captcha_data
+            url, headers, payload = self.build_upstream_request(auth, messages, model, stream, **kwargs)
+            request_span = trace.span('upstream.request', kind=SPAN_KIND_CLIENT,
+                                      attributes={'attempt': retry_count + 1, 'auth.id': auth.auth_id})
             
             try:
-                logger.info(f"发送请求到: {url}")
-                response = requests.post(
-                    url,
-                    headers=headers,
-                    json=payload,
-                    stream=stream,
-                    timeout=60
-                )
+                request_log.debug("发送请求到: %s", url)
+                sent_at = time.perf_counter()
+                if self.hedge_executor is not None:
+                    response, auth = self.hedged_post(url, headers, payload, auth, messages, model, stream, trace,
+                                                      **kwargs)
+                    request_span.set('auth.id', auth.auth_id)
+                else:
+                    response = self.session.post(
+                        url,
+                        headers=headers,
+                        json=payload,
+                        stream=True,  # 非流式请求上游同样按流式读取，边读边编码响应体
+                        timeout=60
+                    )
+                request_span.set('http.status_code', response.status_code)
                 
                 if response.status_code == 200:
-                    logger.info(f"✅ API 调用成功 (Auth: {auth.auth_id})")
+                    request_log.info("✅ API 调用成功 (Auth: %s)", auth.auth_id)
+                    response.upstream_started = sent_at  # 供 stream_generator 统计首字节和总耗时
                     return response
                 elif response.status_code == 401:
-                    logger.error(f"API 调用失败: {response.status_code} (Auth: {auth.auth_id})")
-                    logger.error(f"响应内容: {response.text}")
+                    logger.error("API 调用失败: %s (Auth: %s)", response.status_code, auth.auth_id)
+                    logger.error("响应内容: %.500s", response.text)
                     
                     # 检查是否是认证失效的错误
                     try:
                         error_data = response.json()
-                        if error_data.get("message") == "You must log in first" or error_data.get("status") == 10025:
+                        if self.is_auth_expired_error(error_data):
                             logger.warning(f"🔴 认证 {auth.auth_id} 已失效，从认证池中移除")
                             # 从认证池中移除失效的认证
                             self.auth_pool.remove_auth(auth)
                             # 如果还有重试次数，继续尝试下一个认证
                             if retry_count < max_retries - 1:
                                 logger.info(f"🔄 准备使用下一个认证重试...")
+                                UPSTREAM_RETRIES_TOTAL.labels('auth_expired').inc()
+                                request_span.set('retry.cause', 'auth_expired')
                                 continue
                     except:
                         pass
@@ -795,35 +729,120 @@ class SophnetOpenAIAPI:
                         logger.error(f"已达到最大重试次数，认证失败")
                         return None
                     else:
+                        UPSTREAM_RETRIES_TOTAL.labels('other').inc()
+                        request_span.set('retry.cause', 'other')
                         continue
                 else:
-                    logger.error(f"API 调用失败: {response.status_code} (Auth: {auth.auth_id})")
-                    logger.error(f"响应内容: {response.text}")
+                    logger.error("API 调用失败: %s (Auth: %s)", response.status_code, auth.auth_id)
+                    logger.error("响应内容: %.500s", response.text)
                     # 对于其他错误，不重试直接返回None
                     return None
                     
             except Exception as e:
                 logger.error(f"请求异常: {e}")
+                request_span.error(str(e))
                 # 对于网络异常等，如果还有重试次数，可以尝试下一个认证
                 if retry_count < max_retries - 1:
                     logger.info(f"🔄 请求异常，尝试使用下一个认证...")
+                    UPSTREAM_RETRIES_TOTAL.labels('network').inc()
+                    request_span.set('retry.cause', 'network')
                     continue
                 return None
+            finally:
+                request_span.end()
         
         # 如果所有重试都失败了
         logger.error("所有重试都失败了")
         return None
     
+    def _submit_post(self, url: str, headers: Dict, payload: Dict, model: str) -> Future:
+        """在线程池中发送上游请求（stream=True，收到响应头即返回），完成时记录响应头耗时"""
+        started = time.perf_counter()
+        future = self.hedge_executor.submit(self.session.post, url, headers=headers, json=payload,
+                                            stream=True, timeout=60)
+        
+        def observe(f: Future):
+            if f.exception() is None:
+                self.hedger.observe(model, time.perf_counter() - started)
+        
+        future.add_done_callback(observe)
+        return future
+    
+    def hedged_post(self, url: str, headers: Dict, payload: Dict, auth: AuthInfo, messages: List[Dict],
+                    model: str, stream: bool, trace=NOOP_TRACE, **kwargs) -> Tuple[requests.Response, AuthInfo]:
+        """发送上游请求；超过对冲阈值还没有响应头时用另一个认证再发一个，返回先成功的 (response, auth)
+        
+        都失败时返回第一个请求的结果，由调用方按原来的逻辑重试。输掉竞速的请求收到响应后直接关闭
+        （认证的使用次数在取用时已经计入），认证失效时从池中移除。
+        """
+        hedger = self.hedger
+        hedger.admit()
+        primary = self._submit_post(url, headers, payload, model)
+        delay = hedger.delay(model)
+        try:
+            return primary.result(timeout=delay), auth
+        except FutureTimeout:
+            pass
+        
+        if not hedger.try_acquire():
+            return primary.result(), auth
+        # 不等待地取用：已有请求排队等待认证时不插队，放弃对冲
+        hedge_auth = self.auth_pool.try_checkout()
+        if not hedge_auth:
+            hedger.refund()
+            return primary.result(), auth
+        
+        request_log.info("⏱️ %.2fs 内没有收到响应，使用认证 %s 发出对冲请求", delay, hedge_auth.auth_id)
+        hedge_span = trace.span('upstream.hedge', kind=SPAN_KIND_CLIENT,
+                                attributes={'auth.id': hedge_auth.auth_id, 'hedge.delay_ms': round(delay * 1000, 1)})
+        hedge_url, hedge_headers, hedge_payload = self.build_upstream_request(hedge_auth, messages, model, stream,
+                                                                              **kwargs)
+        hedge = self._submit_post(hedge_url, hedge_headers, hedge_payload, model)
+        auths = {primary: auth, hedge: hedge_auth}
+        
+        winner = None
+        pending = {primary, hedge}
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (primary, hedge):
+                if future in done and future.exception() is None and future.result().status_code == 200:
+                    winner = future
+                    break
+        
+        outcome = 'primary_won' if winner is primary else 'hedge_won' if winner is hedge else 'both_failed'
+        hedger.record(outcome)
+        hedge_span.set('hedge.outcome', outcome)
+        hedge_span.end()
+        if winner is None:
+            winner = primary
+        loser = hedge if winner is primary else primary
+        loser.add_done_callback(lambda f: self.discard_response(f, auths[loser]))
+        return winner.result(), auths[winner]
+    
+    def discard_response(self, future: Future, auth: AuthInfo):
+        """关闭输掉竞速的上游响应（未读完的流式响应会断开连接，上游随之停止生成）；认证失效时从池中移除"""
+        if future.exception() is not None:
+            return
+        response = future.result()
+        try:
+            if response.status_code == 401 and self.is_auth_expired_error(response.json()):
+                logger.warning(f"🔴 认证 {auth.auth_id} 已失效，从认证池中移除")
+                self.auth_pool.remove_auth(auth)
+        except Exception:
+            pass
+        finally:
+            response.close()
+    
     def format_openai_response(self, sophnet_response: str, model: str, 
                               messages: List[Dict], stream: bool = False,
-                              reasoning_tokens: int = 0) -> Dict:
-        """将 Sophnet 响应格式化为 OpenAI 格式"""
+                              reasoning_tokens: int = 0, usage: Optional[Dict] = None) -> Dict:
+        """将 Sophnet 响应格式化为 OpenAI 格式；没有传入 usage 时用本地分词器计算"""
         
         if stream:
             return None
         
-        prompt_tokens = sum(len(m.get('content', '')) for m in messages) // 4
-        completion_tokens = len(sophnet_response) // 4
+        if usage is None:
+            usage = self.usage_meter.usage_for_text(model, messages, sophnet_response)
         
         response = {
             "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
@@ -841,152 +860,172 @@ class SophnetOpenAIAPI:
                     "finish_reason": "stop"
                 }
             ],
-            "usage": {
-                "prompt_tokens": prompt_tokens,
-                "completion_tokens": completion_tokens,
-                "total_tokens": prompt_tokens + completion_tokens
-            },
+            "usage": dict(usage),
             "system_fingerprint": f"fp_{uuid.uuid4().hex[:6]}"
         }
         
-        if reasoning_tokens > 0:
+        if reasoning_tokens > 0 and "completion_tokens_details" not in usage:
             response["usage"]["completion_tokens_details"] = {
                 "reasoning_tokens": reasoning_tokens
             }
         
         return response
     
-    def stream_generator(self, response: requests.Response, model: str) -> Generator:
-        """生成 OpenAI 格式的流式响应，支持 reasoning_content"""
-        
-        chat_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
-        created = int(time.time())
+    def release_response(self, response: requests.Response):
+        """读完剩余数据后归还连接；未读完就关闭会导致连接被丢弃而无法复用"""
+        try:
+            for _ in response.iter_content(chunk_size=8192):
+                pass
+        except Exception:
+            pass
+        finally:
+            response.close()
+    
+    def store_response(self, key: Optional[str], content: List[str], reasoning: List[str],
+                       reasoning_tokens: int = 0):
+        """把完整的响应写入缓存（key 为 None 或没有回答内容时不写入）"""
+        if key is None or self.response_cache is None or not content:
+            return
+        self.response_cache.put(key, ''.join(content), ''.join(reasoning), reasoning_tokens)
+    
+    def stream_generator(self, response: requests.Response, model: str, span=NOOP_SPAN,
+                         cache_key: Optional[str] = None, messages: Optional[List[Dict]] = None,
+                         include_usage: bool = False) -> Generator:
+        """生成 OpenAI 格式的流式响应，支持 reasoning_content；cache_key 不为空时完整结束的响应写入缓存
         
-        think_tag_sent = False
-        think_close_tag_sent = False
-        has_reasoning = False
+        边转发边统计用量，流结束（包括客户端提前断开）时计入 usage 统计。
+        """
+        usage = self.usage_meter.accountant(model, messages or [])
+        converter = OpenAIStreamConverter(model, record=cache_key is not None, usage=usage,
+                                          include_usage=include_usage)
+        first_byte_at = None
+        started = getattr(response, 'upstream_started', None)
         
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    data = line[6:]
-                    
-                    if data == '[DONE]':
-                        if has_reasoning and not think_close_tag_sent:
-                            openai_chunk = {
-                                "id": chat_id,
-                                "object": "chat.completion.chunk",
-                                "created": created,
-                                "model": model,
-                                "choices": [
-                                    {
-                                        "index": 0,
-                                        "delta": {"content": "</think>\n\n"},
-                                        "finish_reason": None
-                                    }
-                                ]
-                            }
-                            yield f"data: {json.dumps(openai_chunk)}\n\n"
-                        
-                        yield f"data: [DONE]\n\n"
-                        break
-                    
-                    try:
-                        sophnet_data = json.loads(data)
-                        if 'choices' in sophnet_data and len(sophnet_data['choices']) > 0:
-                            choice = sophnet_data['choices'][0]
-                            delta = choice.get('delta', {})
-                            
-                            content = delta.get('content', '')
-                            reasoning_content = delta.get('reasoning_content', '')
-                            finish_reason = choice.get('finish_reason')
-                            
-                            if reasoning_content:
-                                has_reasoning = True
-                                
-                                if not think_tag_sent:
-                                    openai_chunk = {
-                                        "id": chat_id,
-                                        "object": "chat.completion.chunk",
-                                        "created": created,
-                                        "model": model,
-                                        "choices": [
-                                            {
-                                                "index": 0,
-                                                "delta": {"content": "<think>"},
-                                                "finish_reason": None
-                                            }
-                                        ]
-                                    }
-                                    yield f"data: {json.dumps(openai_chunk)}\n\n"
-                                    think_tag_sent = True
-                                
-                                openai_chunk = {
-                                    "id": chat_id,
-                                    "object": "chat.completion.chunk",
-                                    "created": created,
-                                    "model": model,
-                                    "choices": [
-                                        {
-                                            "index": 0,
-                                            "delta": {"content": reasoning_content},
-                                            "finish_reason": None
-                                        }
-                                    ]
-                                }
-                                yield f"data: {json.dumps(openai_chunk)}\n\n"
-                            
-                            if content:
-                                if has_reasoning and not think_close_tag_sent:
-                                    openai_chunk = {
-                                        "id": chat_id,
-                                        "object": "chat.completion.chunk",
-                                        "created": created,
-                                        "model": model,
-                                        "choices": [
-                                            {
-                                                "index": 0,
-                                                "delta": {"content": "</think>\n\n"},
-                                                "finish_reason": None
-                                            }
-                                        ]
-                                    }
-                                    yield f"data: {json.dumps(openai_chunk)}\n\n"
-                                    think_close_tag_sent = True
-                                
-                                openai_chunk = {
-                                    "id": chat_id,
-                                    "object": "chat.completion.chunk",
-                                    "created": created,
-                                    "model": model,
-                                    "choices": [
-                                        {
-                                            "index": 0,
-                                            "delta": {"content": content},
-                                            "finish_reason": finish_reason
-                                        }
-                                    ]
-                                }
-                                yield f"data: {json.dumps(openai_chunk)}\n\n"
-                        
-                    except Exception as e:
-                        logger.error(f"解析流式响应失败: {e}")
+        try:
+            for line in timed_input(response.iter_lines(), span, started):
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                for chunk in converter.feed(line):
+                    yield chunk
+                if converter.done:
+                    self.release_response(response)
+                    self.store_response(cache_key, converter.content, converter.reasoning,
+                                        converter.reasoning_tokens)
+                    break
+        finally:
+            span.set('stream.tokens', converter.tokens)
+            span.set('usage.completion_tokens', usage.result()['completion_tokens'])
+            observe_stream(model, started, first_byte_at, converter.tokens)
+    
+    def completion_body(self, response: requests.Response, writer: CompletionBodyWriter, span=NOOP_SPAN,
+                        cache_key: Optional[str] = None, flight: Optional[Flight] = None) -> Generator:
+        """读取上游并逐段生成非流式 JSON 响应体；完整结束后写入缓存，并把结果交给合并请求的订阅者"""
+        started = getattr(response, 'upstream_started', None)
+        first_byte_at = None
+        completed = False
+        try:
+            yield writer.start()
+            for line in timed_input(response.iter_lines(), span, started):
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                piece = writer.feed(line)
+                if piece:
+                    yield piece
+                if writer.truncated:
+                    logger.warning(f"非流式回复超过 {writer.max_bytes} 字节，已截断")
+                    break
+            yield writer.finish()
+            completed = not writer.truncated
+        finally:
+            response.close()
+            observe_stream(writer.model, started, first_byte_at)
+            if completed:
+                self.store_response(cache_key, writer.content, writer.reasoning, writer.reasoning_tokens)
+            if flight:
+                flight.finish(ok=completed, result=(writer.completion(), writer.usage.result()) if completed else None)
+    
+    def passthrough_generator(self, response: requests.Response, model: str, span=NOOP_SPAN) -> Generator:
+        """原样转发上游 SSE 字节，不解析也不重新编码（reasoning_content 不会转换为 <think> 标签）"""
+        first_byte_at = None
+        try:
+            for chunk in timed_input(response.iter_content(chunk_size=None), span,
+                                     getattr(response, 'upstream_started', None)):
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                if chunk:
+                    yield chunk
+        finally:
+            response.close()
+            observe_stream(model, getattr(response, 'upstream_started', None), first_byte_at)
+
+
+def replay_cached_stream(entry: CachedCompletion, model: str, messages: Optional[List[Dict]] = None,
+                         include_usage: bool = False) -> Generator:
+    """把缓存的响应回放为 OpenAI 格式的 SSE 流"""
+    encoder = SSEChunkEncoder(f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()), model, include_usage)
+    pieces = replay_pieces(entry)
+    for i, piece in enumerate(pieces):
+        yield encoder.encode(piece, 'stop' if i == len(pieces) - 1 else None)
+    if include_usage:
+        yield encoder.encode_usage(usage_meter.usage_for_text(model, messages or [], entry.content, entry.reasoning))
+    yield "data: [DONE]\n\n"
 
 
 # 创建全局对象
-auth_pool = AuthPool(min_pool_size=3, max_pool_size=10)
-auth_fetcher = SophnetAuthFetcher(headless=True)  # 调试时使用 headless=False
-api = SophnetOpenAIAPI(auth_pool)
+if AUTH_POOL_ADDRESS:
+    # 服务进程：认证由独立的认证池进程采集和管理
+    from pool_server import RemoteAuthPool
+    auth_pool = RemoteAuthPool(AUTH_POOL_ADDRESS, AUTH_POOL_AUTHKEY)
+else:
+    auth_pool = AuthPool(min_pool_size=AUTH_POOL_MIN_SIZE, max_pool_size=AUTH_POOL_MAX_SIZE,
+                         store=AuthStore(AUTH_STORE_PATH) if AUTH_STORE_PATH else None)
+response_cache = create_response_cache()
+coalescer = SingleFlight()
+usage_meter = UsageMeter()
+api = SophnetOpenAIAPI(auth_pool, response_cache=response_cache, usage_meter=usage_meter)
 
-# 创建 Flask 应用
-app = Flask(__name__)
-CORS(app)
+# 认证池指标在抓取时读取
+AUTH_POOL_SIZE.set_function(lambda: auth_pool.get_pool_status()['pool_size'])
+AUTH_CHECKOUT_WAITING.set_function(lambda: auth_pool.get_pool_status().get('waiting', 0))
 
+# 浏览器相关对象在 init_auth_harvesting() 中按需创建
+resource_filter = None
+auth_fetcher = None
+auth_harvester = None
 
-@app.route('/v1/models', methods=['GET'])
-def list_models():
-    """列出可用模型"""
+# 启动各阶段耗时（秒），--profile-startup 时输出
+STARTUP_TIMINGS = {}
+
+
+def init_auth_harvesting() -> AuthHarvester:
+    """导入浏览器模块并创建认证获取器和采集器（只在本进程负责采集认证时调用）"""
+    global resource_filter, auth_fetcher, auth_harvester
+    if auth_harvester:
+        return auth_harvester
+    
+    started = time.perf_counter()
+    from auth_fetcher import ResourceFilter, SophnetAuthFetcher, AsyncSophnetAuthFetcher
+    STARTUP_TIMINGS['import_auth_fetcher'] = time.perf_counter() - started
+    
+    resource_filter = ResourceFilter.from_config()
+    if AUTH_FETCHER_MODE == 'async':
+        auth_fetcher = AsyncSophnetAuthFetcher(max_concurrent_pages=HARVEST_MAX_CONCURRENCY,
+                                               resource_filter=resource_filter)
+    else:
+        auth_fetcher = SophnetAuthFetcher(headless=True, resource_filter=resource_filter)  # 调试时使用 headless=False
+    auth_harvester = AuthHarvester(
+        auth_fetcher.fetch_auth,
+        # async 获取器由所有采集线程共享，不能在单个线程退出时关闭，在采集器停止时关闭
+        cleanup_func=auth_fetcher.close if AUTH_FETCHER_MODE != 'async' else None,
+        num_workers=HARVEST_WORKERS,
+        max_concurrency=HARVEST_MAX_CONCURRENCY,
+        close_func=auth_fetcher.close if AUTH_FETCHER_MODE == 'async' else None
+    )
+    return auth_harvester
+
+
+def build_models_list() -> Dict:
+    """构建 /v1/models 响应"""
     models = []
     for model_id in SUPPORTED_MODELS:
         models.append({
@@ -999,121 +1038,267 @@ def list_models():
             "parent": None
         })
     
-    return jsonify({"object": "list", "data": models})
+    return {"object": "list", "data": models}
+
+
+def extract_completion_params(data: Dict) -> Dict:
+    """从客户端请求中提取转发给上游的采样参数"""
+    return {
+        'temperature': data.get('temperature', 1.0),
+        'top_p': data.get('top_p', 1.0),
+        'max_tokens': data.get('max_tokens', 2048),
+        'frequency_penalty': data.get('frequency_penalty', 0),
+        'presence_penalty': data.get('presence_penalty', 0),
+        'stop': data.get('stop', [])
+    }
+
+
+def wants_usage(data: Dict) -> bool:
+    """流式请求是否带 stream_options.include_usage"""
+    stream_options = data.get('stream_options')
+    return bool(data.get('stream')) and isinstance(stream_options, dict) and bool(stream_options.get('include_usage'))
+
+
+def use_passthrough(data: Dict, model: str, header_value: Optional[str] = None) -> bool:
+    """流式请求是否原样转发上游字节：请求体 passthrough 字段或 X-Passthrough 头优先，其次按模型配置"""
+    if 'passthrough' in data:
+        return bool(data['passthrough'])
+    if header_value is not None:
+        return header_value.strip().lower() in ('1', 'true', 'yes')
+    return model in PASSTHROUGH_MODELS
+
+
+def auth_wait_timeout(header_value: Optional[str] = None) -> float:
+    """请求愿意排队等待认证的秒数：X-Auth-Wait 头，缺省为 AUTH_CHECKOUT_TIMEOUT，不超过 AUTH_CHECKOUT_MAX_WAIT"""
+    if header_value is None:
+        return AUTH_CHECKOUT_TIMEOUT
+    try:
+        return max(0.0, min(float(header_value), AUTH_CHECKOUT_MAX_WAIT))
+    except ValueError:
+        return AUTH_CHECKOUT_TIMEOUT
+
+
+def error_body(message: str, error_type: str, code: str) -> Dict:
+    """构建 OpenAI 格式的错误响应"""
+    return {
+        "error": {
+            "message": message,
+            "type": error_type,
+            "code": code
+        }
+    }
+
+
+def build_health_status() -> Dict:
+    """构建健康检查响应（不含上游连接池，由各服务模式自行补充）
+    
+    status 表示进程存活；readiness 为 warming / ready / degraded，就绪探针请使用 /ready。
+    """
+    pool_status = auth_pool.get_pool_status()
+    return {
+        "status": "healthy",
+        "readiness": pool_status.get('readiness', 'degraded'),
+        "timestamp": int(time.time()),
+        "pool_status": pool_status,
+        "fetcher_stats": auth_fetcher.stats if auth_fetcher else None,
+        "resource_filter": resource_filter.get_stats() if resource_filter else None,
+        "tracing": trace_exporter.get_status(),
+        "response_cache": response_cache.get_status() if response_cache else {"enabled": False},
+        "coalescing": coalescer.get_status(),
+        "usage": usage_meter.get_status(),
+        "hedging": api.hedger.get_status()
+    }
+
+
+# 创建 Flask 应用
+app = Flask(__name__)
+CORS(app)
+
+
+@app.route('/v1/models', methods=['GET'])
+def list_models():
+    """列出可用模型"""
+    return jsonify(build_models_list())
 
 
 @app.route('/v1/chat/completions', methods=['POST'])
 def chat_completions():
     """聊天完成接口"""
+    trace = start_trace('chat.completions', request.headers.get('traceparent'))
     try:
         data = request.get_json()
         messages = data.get('messages', [])
         model = data.get('model', 'DeepSeek-V3-Fast')
         stream = data.get('stream', False)
+        trace.root.set('model', model)
+        trace.root.set('stream', bool(stream))
         
         if model not in SUPPORTED_MODELS:
-            return jsonify({
-                "error": {
-                    "message": f"Model {model} not found",
-                    "type": "invalid_request_error",
-                    "code": "model_not_found"
-                }
-            }), 404
+            trace.root.set('http.status_code', 404)
+            trace.finish()
+            return jsonify(error_body(f"Model {model} not found", "invalid_request_error", "model_not_found")), 404
+        
+        params = extract_completion_params(data)
+        passthrough = bool(stream) and use_passthrough(data, model, request.headers.get('X-Passthrough'))
+        include_usage = wants_usage(data)
+        key = None
+        flight = None
+        deterministic = is_deterministic(params)
+        coalesce = coalescer.applies(deterministic)
+        content_key = None
+        if (coalesce or (response_cache and deterministic)) and not cache_bypassed(request.headers.get('Cache-Control')):
+            content_key = cache_key(model, messages, params)
+        if response_cache and content_key and deterministic:
+            key = content_key
+            cached = response_cache.get(key)
+            trace.root.set('cache', 'hit' if cached else 'miss')
+            if cached:
+                trace.root.set('http.status_code', 200)
+                trace.finish()
+                if stream:
+                    return Response(replay_cached_stream(cached, model, messages, include_usage),
+                                    content_type='text/event-stream',
+                                    headers={'Cache-Control': 'no-cache', 'X-Cache': 'HIT'})
+                # 思考过程和回答分开计数，与实时响应和流式回放的 usage 一致
+                usage = usage_meter.usage_for_text(model, messages, cached.content, cached.reasoning)
+                flask_response = jsonify(api.format_openai_response(
+                    cached.final_content(), model, messages, reasoning_tokens=cached.reasoning_tokens, usage=usage))
+                flask_response.headers['X-Cache'] = 'HIT'
+                return flask_response
+        
+        # 相同请求正在进行时订阅它的结果，否则作为 leader 请求上游
+        if content_key and coalesce:
+            flight, leader = coalescer.join(flight_key(content_key, stream, passthrough, include_usage))
+            trace.root.set('coalesced', not leader)
+            if not leader:
+                trace.finish()
+                return follow_flight(flight, model, messages, stream)
         
         # 调用 API
         response = api.call_sophnet_api(
             messages=messages,
             model=model,
             stream=stream,
-            temperature=data.get('temperature', 1.0),
-            top_p=data.get('top_p', 1.0),
-            max_tokens=data.get('max_tokens', 2048),
-            frequency_penalty=data.get('frequency_penalty', 0),
-            presence_penalty=data.get('presence_penalty', 0),
-            stop=data.get('stop', [])
+            auth_timeout=auth_wait_timeout(request.headers.get('X-Auth-Wait')),
+            trace=trace,
+            **params
         )
         
         if not response:
-            return jsonify({
-                "error": {
-                    "message": "Failed to get response from Sophnet API",
-                    "type": "api_error",
-                    "code": "upstream_error"
-                }
-            }), 500
+            if flight:
+                flight.finish(ok=False)
+            trace.root.error('upstream_error')
+            trace.root.set('http.status_code', 500)
+            trace.finish()
+            return jsonify(error_body("Failed to get response from Sophnet API", "api_error", "upstream_error")), 500
         
+        trace.root.set('http.status_code', 200)
         if stream:
-            return Response(
-                stream_with_context(api.stream_generator(response, model)),
+            stream_span = trace.span('response.stream')
+            if passthrough:
+                stream_span.set('passthrough', True)
+                generator = api.passthrough_generator(response, model, stream_span)
+            else:
+                generator = api.stream_generator(response, model, stream_span, cache_key=key, messages=messages,
+                                                 include_usage=include_usage)
+            headers = {
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+            if trace.sampled:
+                headers['X-Trace-Id'] = trace.trace_id
+            if key:
+                headers['X-Cache'] = 'MISS'
+            if flight:
+                generator = flight.lead(generator)
+            flask_response = Response(
+                # 流结束（或客户端断开）时结束 span 并导出 trace
+                stream_with_context(trace_stream(generator, trace, stream_span)),
                 content_type='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'X-Accel-Buffering': 'no'
-                }
+                headers=headers
             )
+            # 客户端提前断开时关闭上游响应，释放连接池占用
+            flask_response.call_on_close(response.close)
+            if flight:
+                flask_response.call_on_close(flight.abandon)
+            return flask_response
         else:
-            # 非流式响应处理
-            full_response = []
-            reasoning_content = []
-            reasoning_tokens = 0
-            
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: ') and line != 'data: [DONE]':
-                        try:
-                            data = json.loads(line[6:])
-                            if 'choices' in data and len(data['choices']) > 0:
-                                delta = data['choices'][0].get('delta', {})
-                                
-                                content = delta.get('content', '')
-                                if content:
-                                    full_response.append(content)
-                                
-                                reasoning = delta.get('reasoning_content', '')
-                                if reasoning:
-                                    reasoning_content.append(reasoning)
-                            
-                            if 'usage' in data:
-                                usage = data['usage']
-                                if 'completion_tokens_details' in usage:
-                                    reasoning_tokens = usage['completion_tokens_details'].get('reasoning_tokens', 0)
-                                    
-                        except:
-                            pass
+            # 非流式响应处理：上游 delta 直接编码进 JSON 响应体
+            writer = CompletionBodyWriter(model, usage_meter.accountant(model, messages),
+                                          record=key is not None or flight is not None)
+            headers = {}
+            if trace.sampled:
+                headers['X-Trace-Id'] = trace.trace_id
+            if key:
+                headers['X-Cache'] = 'MISS'
             
-            final_content = ''
-            if reasoning_content:
-                final_content = '<think>' + ''.join(reasoning_content) + '</think>\n\n'
-            final_content += ''.join(full_response)
+            if NON_STREAM_BODY == 'streamed':
+                span = trace.span('response.aggregate')
+                flask_response = Response(
+                    stream_with_context(trace_stream(api.completion_body(response, writer, span, key, flight),
+                                                     trace, span)),
+                    content_type='application/json',
+                    headers=headers
+                )
+                flask_response.call_on_close(response.close)
+                if flight:
+                    flask_response.call_on_close(flight.abandon)
+                return flask_response
             
-            return jsonify(api.format_openai_response(
-                final_content, 
-                model, 
-                messages,
-                reasoning_tokens=reasoning_tokens
-            ))
+            # 片段列表直接交给 Response，不再拼接成一份完整副本（Content-Length 由 werkzeug 按片段计算）
+            with trace.span('response.aggregate') as span:
+                pieces = list(api.completion_body(response, writer, span, key, flight))
+            trace.finish()
+            return Response(pieces, content_type='application/json', headers=headers)
     
     except Exception as e:
         logger.error(f"处理请求失败: {e}")
-        return jsonify({
-            "error": {
-                "message": str(e),
-                "type": "internal_error",
-                "code": "internal_error"
-            }
-        }), 500
+        if flight:
+            flight.finish(ok=False)
+        trace.root.error(str(e))
+        trace.root.set('http.status_code', 500)
+        trace.finish()
+        return jsonify(error_body(str(e), "internal_error", "internal_error")), 500
+
+
+def follow_flight(flight: Flight, model: str, messages: List[Dict], stream: bool):
+    """订阅进行中的相同请求：流式回放并跟随 leader 的输出，非流式使用 leader 的汇总结果"""
+    try:
+        if stream:
+            flight.wait_started()
+            return Response(flight.subscribe(), content_type='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+                'X-Coalesced': '1'
+            })
+        result, usage = flight.wait()
+    except FlightFailed as e:
+        return jsonify(error_body(str(e), "api_error", "upstream_error")), 500
+    flask_response = jsonify(api.format_openai_response(
+        result.final_content(), model, messages, reasoning_tokens=result.reasoning_tokens, usage=usage))
+    flask_response.headers['X-Coalesced'] = '1'
+    return flask_response
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    pool_status = auth_pool.get_pool_status()
-    return jsonify({
-        "status": "healthy",
-        "timestamp": int(time.time()),
-        "pool_status": pool_status
-    })
+    status = build_health_status()
+    status["upstream_connections"] = api.get_connection_pool_status()
+    return jsonify(status)
+
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """就绪探针：预热中返回 503，就绪或降级（仍可服务）返回 200"""
+    readiness = auth_pool.get_pool_status().get('readiness', 'degraded')
+    return jsonify({"readiness": readiness}), 503 if readiness == 'warming' else 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 指标"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 
 
 @app.route('/pool/status', methods=['GET'])
@@ -1122,36 +1307,79 @@ def pool_status():
     return jsonify(auth_pool.get_pool_status())
 
 
-def initialize():
-    """初始化：填充认证池并启动刷新线程"""
+def initialize(background: Optional[bool] = None):
+    """初始化：填充认证池并启动刷新线程
+    
+    background 为 True（或 STARTUP_MODE=background）时不等待初始填充，立即返回，
+    由刷新线程按空池的紧急策略并发派发采集任务，就绪状态通过 /health 和 /ready 查看。
+    """
+    started = time.perf_counter()
+    try:
+        _initialize(STARTUP_MODE == 'background' if background is None else background)
+    finally:
+        STARTUP_TIMINGS['initialize'] = time.perf_counter() - started
+
+
+def _initialize(background: bool):
     logger.info("🚀 正在初始化服务...")
     
-    # 初始填充认证池
-    logger.info(f"正在填充认证池 (目标: {auth_pool.min_pool_size} 个认证)...")
+    if AUTH_POOL_ADDRESS:
+        # 认证池由独立进程负责，这里只需确认可以连接，不导入浏览器模块
+        logger.info(f"使用共享认证池: {AUTH_POOL_ADDRESS}")
+        auth_pool.wait_until_ready()
+        return
     
-    for i in range(auth_pool.min_pool_size):
-        logger.info(f"获取认证 {i+1}/{auth_pool.min_pool_size}...")
-        auth = auth_fetcher.fetch_auth()
-        if auth:
-            auth_pool.add_auth(auth)
-        else:
-            logger.warning(f"获取认证 {i+1} 失败")
-        
-        # 避免过快请求
-        if i < auth_pool.min_pool_size - 1:
-            time.sleep(2)
+    init_auth_harvesting()
+    
+    # 先从快照恢复仍有效的认证，已有可用认证时不再等待初始填充
+    restored = auth_pool.load_from_store()
+    missing = max(0, auth_pool.min_pool_size - restored)
+    
+    if background:
+        auth_pool.start_refresh_thread(auth_fetcher.fetch_auth, harvester=auth_harvester)
+        logger.info(f"🌱 后台填充认证池 (已恢复 {restored} 个，缺少 {missing} 个)，服务立即启动")
+        return
+    
+    # 初始填充认证池：并发派发给采集器
+    logger.info(f"正在填充认证池 (目标: {auth_pool.min_pool_size} 个认证，已恢复 {restored} 个，{auth_harvester.num_workers} 个并行采集线程)...")
+    auth_harvester.start()
+    auth_harvester.submit(missing, auth_pool.handle_fetch_result)
+    if restored:
+        logger.info(f"♻️ 使用恢复的认证立即提供服务，剩余 {missing} 个在后台采集")
+    elif not auth_harvester.wait_idle(timeout=120):
+        logger.warning("⚠️ 初始填充超时，剩余任务将在后台继续")
     
     # 启动自动刷新线程
-    auth_pool.start_refresh_thread(auth_fetcher.fetch_auth)
+    auth_pool.start_refresh_thread(auth_fetcher.fetch_auth, harvester=auth_harvester)
     
     pool_status = auth_pool.get_pool_status()
     logger.info(f"✅ 初始化完成! 认证池状态: {pool_status['pool_size']} 个可用认证")
 
 
+def format_startup_profile() -> str:
+    """启动耗时报告：模块导入、浏览器模块导入（如有）和初始化"""
+    rows = [(name, STARTUP_TIMINGS[name]) for name in ('import_main', 'import_auth_fetcher', 'initialize')
+            if name in STARTUP_TIMINGS]
+    lines = [f"   {name:<22} {seconds * 1000:9.1f} ms" for name, seconds in rows]
+    lines.append(f"   {'playwright loaded':<22} {'yes' if 'playwright' in sys.modules else 'no'}")
+    lines.append(f"   {'modules loaded':<22} {len(sys.modules)}")
+    return '\n'.join(lines)
+
+
+STARTUP_TIMINGS['import_main'] = time.perf_counter() - _import_started
+
+
 if __name__ == '__main__':
     # 初始化
     initialize()
     
+    if '--profile-startup' in sys.argv:
+        # 只输出启动耗时，不启动服务器
+        logger.info("⏱️ 启动耗时:\n" + format_startup_profile())
+        if not AUTH_POOL_ADDRESS:
+            auth_pool.stop_refresh()
+        sys.exit(0)
+    
     # 启动服务器
     logger.info("="*50)
     logger.info("🚀 Sophnet OpenAI 兼容 API 服务器")
@@ -1161,7 +1389,9 @@ if __name__ == '__main__':
     logger.info("   GET  /v1/models          - 列出可用模型")
     logger.info("   POST /v1/chat/completions - 聊天完成")
     logger.info("   GET  /health             - 健康检查和池状态")
+    logger.info("   GET  /ready              - 就绪探针")
     logger.info("   GET  /pool/status        - 详细认证池状态")
+    logger.info("   GET  /metrics            - Prometheus 指标")
     logger.info("="*50)
     logger.info("✨ 特性:")
     logger.info("   - 认证池自动管理")
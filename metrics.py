@@ -0,0 +1,202 @@
+"""
+Prometheus 文本格式指标（不依赖 prometheus_client）
+更新时每个标签组合只持有一把小锁做几次加法，不分配对象也不格式化字符串；格式化只在抓取 /metrics 时进行
+"""
+
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+REGISTRY: List['Metric'] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """指标基类：按标签值缓存子指标"""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """获取指定标签值的子指标（首次创建时加锁，之后只是一次字典查找）"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """抓取时调用回调取值的仪表"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def render(self) -> List[str]:
+        if self.function is None:
+            return []
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(value)}"]
+
+
+def render_metrics() -> str:
+    """输出所有指标（Prometheus 文本格式 0.0.4）"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+AUTH_FETCH_SECONDS = Histogram(
+    'sophnet_auth_fetch_seconds', '浏览器获取一个认证的耗时', ['result'],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120)
+)
+AUTH_CHECKOUT_WAIT_SECONDS = Histogram(
+    'sophnet_auth_checkout_wait_seconds', '从认证池取用认证的耗时（包括排队等待和共享池的进程间调用）',
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 2.5, 5, 10, 30, 60)
+)
+UPSTREAM_TTFB_SECONDS = Histogram(
+    'sophnet_upstream_ttfb_seconds', '流式请求从发送到收到上游第一行数据的耗时', ['model']
+)
+UPSTREAM_DURATION_SECONDS = Histogram(
+    'sophnet_upstream_duration_seconds', '从发送上游请求到读完响应的总耗时', ['model'],
+    buckets=(.1, .25, .5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+STREAM_TOKENS_PER_SECOND = Histogram(
+    'sophnet_stream_tokens_per_second', '流式响应的输出速度（上游内容帧数 / 首帧到结束的秒数）', ['model'],
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+)
+UPSTREAM_RETRIES_TOTAL = Counter(
+    'sophnet_upstream_retries_total', '换用下一个认证重试上游请求的次数', ['cause']
+)
+AUTH_POOL_SIZE = Gauge('sophnet_auth_pool_size', '当前可用认证数')
+AUTH_CHECKOUT_WAITING = Gauge('sophnet_auth_checkout_waiting', '正在排队等待认证的请求数')
+
+
+def observe_stream(model: str, started: Optional[float], first_byte_at: Optional[float], tokens: int = 0):
+    """记录一次上游响应的首字节耗时、总耗时和输出速度（时间均为 time.perf_counter()）"""
+    now = time.perf_counter()
+    if started is not None:
+        UPSTREAM_DURATION_SECONDS.labels(model).observe(now - started)
+        if first_byte_at is not None:
+            UPSTREAM_TTFB_SECONDS.labels(model).observe(first_byte_at - started)
+    if tokens and first_byte_at is not None and now > first_byte_at:
+        STREAM_TOKENS_PER_SECOND.labels(model).observe(tokens / (now - first_byte_at))
@@ -0,0 +1,134 @@
+"""
+共享认证池进程
+一个进程负责采集和管理认证，多个服务进程通过本地套接字获取认证，避免每个进程各自启动浏览器
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Union
+from multiprocessing.managers import BaseManager
+
+logger = logging.getLogger(__name__)
+
+POOL_METHODS = ('get_auth', 'try_checkout', 'remove_auth', 'get_pool_status')
+# ASGI 服务进程中同时排队等待共享认证池的请求数上限（每个占用一个专用线程）
+AUTH_CHECKOUT_THREADS = int(os.getenv('AUTH_CHECKOUT_THREADS', 64))
+
+
+class PoolManager(BaseManager):
+    """通过 multiprocessing.managers 暴露认证池"""
+
+
+PoolManager.register('get_pool', exposed=POOL_METHODS)
+
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """host:port 解析为 TCP 地址，其余视为 Unix 套接字路径"""
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address
+
+
+class RemoteAuthPool:
+    """共享认证池客户端，提供与 AuthPool 相同的接口"""
+
+    def __init__(self, address: str, authkey: str):
+        self.address = parse_address(address)
+        self.authkey = authkey.encode()
+        self._local = threading.local()  # 每个线程使用独立连接
+        self._checkout_executor = None
+
+    def _pool(self):
+        proxy = getattr(self._local, 'proxy', None)
+        if proxy is None:
+            manager = PoolManager(address=self.address, authkey=self.authkey)
+            manager.connect()
+            proxy = manager.get_pool()
+            self._local.proxy = proxy
+        return proxy
+
+    def _call(self, method: str, *args):
+        """调用远程方法，连接断开时重连一次"""
+        for attempt in range(2):
+            connected = getattr(self._local, 'proxy', None) is not None
+            try:
+                return getattr(self._pool(), method)(*args)
+            except (ConnectionError, EOFError, OSError) as e:
+                self._local.proxy = None
+                if attempt == 1 or not connected:
+                    raise
+                logger.warning(f"共享认证池连接断开，正在重连: {e}")
+
+    def get_auth(self, timeout: float = 0):
+        try:
+            return self._call('get_auth', timeout)
+        except Exception as e:
+            logger.error(f"从共享认证池获取认证失败: {e}")
+            return None
+
+    async def aget_auth(self, timeout: float = 0):
+        """协程版本：阻塞的进程间调用放到专用线程池，排队等待不占用事件循环的默认线程池"""
+        return await self._run_checkout(self.get_auth, timeout)
+
+    def try_checkout(self):
+        try:
+            return self._call('try_checkout')
+        except Exception as e:
+            logger.error(f"从共享认证池获取认证失败: {e}")
+            return None
+
+    async def atry_checkout(self):
+        return await self._run_checkout(self.try_checkout)
+
+    async def _run_checkout(self, func, *args):
+        if self._checkout_executor is None:
+            self._checkout_executor = ThreadPoolExecutor(AUTH_CHECKOUT_THREADS, thread_name_prefix='auth-checkout')
+        return await asyncio.get_running_loop().run_in_executor(self._checkout_executor, func, *args)
+
+    def remove_auth(self, auth):
+        try:
+            self._call('remove_auth', auth)
+        except Exception as e:
+            logger.error(f"从共享认证池移除认证失败: {e}")
+
+    def get_pool_status(self) -> Dict:
+        try:
+            status = self._call('get_pool_status')
+        except Exception as e:
+            return {'pool_size': 0, 'auths': [], 'stats': {}, 'error': str(e)}
+        status['shared'] = True
+        return status
+
+    def wait_until_ready(self, timeout: float = 180.0) -> bool:
+        """等待认证池进程可以连接"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                self._call('get_pool_status')
+                return True
+            except Exception:
+                time.sleep(1)
+        logger.error(f"等待共享认证池超时 ({timeout}秒)")
+        return False
+
+
+def run_pool_server(address: str, authkey: str):
+    """认证池进程入口：填充认证池、启动刷新，然后对外提供服务"""
+    import main
+
+    main.initialize()
+
+    parsed = parse_address(address)
+    if isinstance(parsed, str) and os.path.exists(parsed):
+        os.unlink(parsed)  # 清理上次运行遗留的套接字文件
+
+    PoolManager.register('get_pool', callable=lambda: main.auth_pool, exposed=POOL_METHODS)
+    manager = PoolManager(address=parsed, authkey=authkey.encode())
+    server = manager.get_server()
+    logger.info(f"🔗 共享认证池已就绪: {address}")
+    server.serve_forever()
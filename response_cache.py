@@ -0,0 +1,235 @@
+"""
+确定性请求的响应缓存：内存 LRU（条数和字节数上限、TTL），可选 SQLite 磁盘层
+
+只缓存 temperature 为 0 的请求（RESPONSE_CACHE=1 时启用），命中时不占用认证也不请求上游，
+可以回放为非流式 JSON 或合成的 SSE 流。磁盘层可以由多个服务进程共用。
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', '0') == '1'
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', '')  # 磁盘层 SQLite 文件，留空则只用内存
+RESPONSE_CACHE_DISK_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_DISK_MAX_ENTRIES', 100000))
+
+# 回放 SSE 时每个 chunk 的字符数
+REPLAY_CHUNK_CHARS = 64
+
+
+class CachedCompletion(NamedTuple):
+    """缓存的完整响应"""
+    content: str
+    reasoning: str
+    reasoning_tokens: int
+    created: float
+
+    @property
+    def size(self) -> int:
+        return len(self.content.encode('utf-8')) + len(self.reasoning.encode('utf-8')) + 64
+
+    def final_content(self) -> str:
+        """与非流式响应的 content 格式一致（思考过程放在 <think> 标签中）"""
+        if self.reasoning:
+            return '<think>' + self.reasoning + '</think>\n\n' + self.content
+        return self.content
+
+
+def is_deterministic(params: Dict) -> bool:
+    """temperature 为 0 的请求结果是确定的"""
+    try:
+        return float(params.get('temperature', 1.0)) == 0
+    except (TypeError, ValueError):
+        return False
+
+
+def cache_bypassed(cache_control: Optional[str]) -> bool:
+    """客户端通过 Cache-Control: no-cache / no-store 要求不使用缓存（也不合并请求）"""
+    return bool(cache_control) and ('no-cache' in cache_control or 'no-store' in cache_control)
+
+
+def cache_key(model: str, messages: List[Dict], params: Dict) -> str:
+    """模型、消息和采样参数的规范化哈希"""
+    canonical = json.dumps({'model': model, 'messages': messages, 'params': params},
+                           sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def replay_pieces(entry: CachedCompletion, chunk_chars: int = REPLAY_CHUNK_CHARS) -> List[str]:
+    """把缓存的响应切成 SSE delta 文本，思考过程包装在 <think> 标签中（与 OpenAIStreamConverter 一致）"""
+    pieces = []
+    if entry.reasoning:
+        pieces.append('<think>')
+        pieces.extend(entry.reasoning[i:i + chunk_chars] for i in range(0, len(entry.reasoning), chunk_chars))
+        pieces.append('</think>\n\n')
+    pieces.extend(entry.content[i:i + chunk_chars] for i in range(0, len(entry.content), chunk_chars))
+    return pieces
+
+
+class DiskCache:
+    """SQLite 磁盘层，按最近使用时间淘汰"""
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        os.chmod(path, 0o600)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, content TEXT, reasoning TEXT, reasoning_tokens INTEGER, '
+            'created REAL, last_used REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+
+    def get(self, key: str) -> Optional[CachedCompletion]:
+        now = time.time()
+        try:
+            with self.lock:
+                row = self.conn.execute(
+                    'SELECT content, reasoning, reasoning_tokens, created FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[3] > self.ttl:
+                    self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    return None
+                self.conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"读取响应缓存失败: {e}")
+            return None
+        return CachedCompletion(*row)
+
+    def put(self, key: str, entry: CachedCompletion):
+        try:
+            with self.lock:
+                self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                                  (key, entry.content, entry.reasoning, entry.reasoning_tokens,
+                                   entry.created, time.time()))
+                count = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+                if count > self.max_entries:
+                    self.conn.execute(
+                        'DELETE FROM responses WHERE key IN '
+                        '(SELECT key FROM responses ORDER BY last_used LIMIT ?)', (count - self.max_entries,)
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"写入响应缓存失败: {e}")
+
+    def count(self) -> int:
+        try:
+            with self.lock:
+                return self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ResponseCache:
+    """内存 LRU + 可选磁盘层"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: float = RESPONSE_CACHE_TTL, disk: Optional[DiskCache] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = disk
+        self.entries: 'OrderedDict[str, CachedCompletion]' = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expired': 0,
+        }
+
+    def get(self, key: str) -> Optional[CachedCompletion]:
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if now - entry.created <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry
+                self._discard(key)
+                self.stats['expired'] += 1
+
+        entry = self.disk.get(key) if self.disk else None
+        with self.lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, content: str, reasoning: str = '', reasoning_tokens: int = 0):
+        entry = CachedCompletion(content, reasoning, reasoning_tokens, time.time())
+        if entry.size > self.max_bytes:
+            return
+        with self.lock:
+            self._insert(key, entry)
+            self.stats['stores'] += 1
+        if self.disk:
+            self.disk.put(key, entry)
+
+    def _insert(self, key: str, entry: CachedCompletion):
+        """调用方持有锁"""
+        self._discard(key)
+        self.entries[key] = entry
+        self.bytes += entry.size
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            oldest = next(iter(self.entries))
+            self._discard(oldest)
+            self.stats['evictions'] += 1
+
+    def _discard(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+            entries = len(self.entries)
+            size = self.bytes
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        return {
+            'enabled': True,
+            'entries': entries,
+            'bytes': size,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'disk_entries': self.disk.count() if self.disk else None,
+            'hit_rate': round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0,
+            **stats,
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """按环境变量创建响应缓存，未启用时返回 None"""
+    if not RESPONSE_CACHE:
+        return None
+    disk = DiskCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DISK_MAX_ENTRIES) \
+        if RESPONSE_CACHE_PATH else None
+    return ResponseCache(disk=disk)
@@ -0,0 +1,99 @@
+"""
+生产环境启动入口
+启动一个共享认证池进程和多个服务进程，认证只采集一次，由所有服务进程共用
+
+用法:
+    python serve.py --workers 4                 # ASGI (uvicorn) 多进程
+    python serve.py --server wsgi --workers 4   # WSGI (gunicorn) 多进程
+    python serve.py --profile-startup           # 输出服务进程的启动耗时
+"""
+
+import os
+import sys
+import secrets
+import argparse
+import logging
+import subprocess
+import multiprocessing
+
+from log_setup import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sophnet OpenAI 兼容 API 服务器（多进程）")
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 8080)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WORKERS', os.cpu_count() or 1)),
+                        help="服务进程数量，默认等于 CPU 核数")
+    parser.add_argument('--server', choices=['asgi', 'wsgi'], default=os.getenv('SERVER_MODE', 'asgi'),
+                        help="asgi 使用 uvicorn，wsgi 使用 gunicorn")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WSGI_THREADS', 32)),
+                        help="wsgi 模式下每个进程的线程数")
+    parser.add_argument('--pool-address', default=os.getenv('AUTH_POOL_ADDRESS', '/tmp/sophnet2api-pool.sock'),
+                        help="共享认证池地址：Unix 套接字路径或 host:port")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="按服务进程的配置启动一次，输出导入和初始化耗时后退出")
+    return parser.parse_args()
+
+
+def start_pool_process(address: str, authkey: str) -> multiprocessing.Process:
+    """启动认证池进程（此时环境变量中还没有 AUTH_POOL_ADDRESS，子进程使用本地认证池）"""
+    from pool_server import run_pool_server
+
+    ctx = multiprocessing.get_context('spawn')
+    process = ctx.Process(target=run_pool_server, args=(address, authkey), name='auth-pool')
+    process.start()
+    return process
+
+
+def main():
+    args = parse_args()
+    authkey = os.getenv('AUTH_POOL_AUTHKEY') or secrets.token_hex(16)
+    os.environ.pop('AUTH_POOL_ADDRESS', None)
+
+    logger.info(f"🚀 启动共享认证池进程: {args.pool_address}")
+    pool_process = start_pool_process(args.pool_address, authkey)
+
+    # 服务进程通过环境变量连接共享认证池
+    os.environ['AUTH_POOL_ADDRESS'] = args.pool_address
+    os.environ['AUTH_POOL_AUTHKEY'] = authkey
+
+    from pool_server import RemoteAuthPool
+    if not RemoteAuthPool(args.pool_address, authkey).wait_until_ready():
+        pool_process.terminate()
+        sys.exit(1)
+
+    try:
+        if args.profile_startup:
+            # 服务进程只连接共享认证池，不应导入 Playwright
+            main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+            subprocess.call([sys.executable, main_path, '--profile-startup'])
+            return
+
+        logger.info(f"🚀 启动 {args.workers} 个 {args.server} 服务进程: http://{args.host}:{args.port}")
+        if args.server == 'asgi':
+            import uvicorn
+            uvicorn.run('asgi_app:app', host=args.host, port=args.port, workers=args.workers)
+        else:
+            subprocess.call([
+                sys.executable, '-m', 'gunicorn',
+                '--workers', str(args.workers),
+                '--worker-class', 'gthread',
+                '--threads', str(args.threads),
+                '--bind', f"{args.host}:{args.port}",
+                '--timeout', '300',
+                'main:app'
+            ])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("🛑 正在停止共享认证池进程...")
+        pool_process.terminate()
+        pool_process.join(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+ASGI 模式端到端测试：模拟上游 + 桩认证获取器 + 真实的 asgi_app 进程（与 benchmarks/load_test.py 相同的组件）
+
+    python -m pytest tests/test_asgi_e2e.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+import http.client
+
+import pytest
+
+pytest.importorskip('httpx')
+pytest.importorskip('starlette')
+pytest.importorskip('uvicorn')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from load_test import STUB_PROXY, free_port, wait_ready
+from mock_upstream import MockConfig, start_mock_upstream
+
+CONTENT_TOKENS = 20
+REASONING_TOKENS = 5
+
+
+@pytest.fixture(scope='module')
+def proxy():
+    mock_server, upstream_url = start_mock_upstream(MockConfig(content_tokens=CONTENT_TOKENS,
+                                                               reasoning_tokens=REASONING_TOKENS))
+    port = free_port()
+    env = dict(os.environ, AUTH_POOL_MIN_SIZE='2', AUTH_POOL_MAX_SIZE='5', RESPONSE_CACHE='1',
+               RESPONSE_CACHE_PATH='')
+    process = subprocess.Popen(
+        [sys.executable, STUB_PROXY, '--upstream', upstream_url, '--server', 'asgi',
+         '--port', str(port), '--fetch-delay', '0'],
+        env=env
+    )
+    try:
+        assert wait_ready(f"http://127.0.0.1:{port}", timeout=30), "代理未就绪"
+        yield port
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        mock_server.shutdown()
+
+
+def post(port: int, body: dict):
+    """发送请求并读完响应体；分块传输被提前断开时 http.client 抛出 IncompleteRead"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('POST', '/v1/chat/completions', body=json.dumps(body).encode(),
+                     headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        return response.status, response.headers, response.read()
+    finally:
+        conn.close()
+
+
+def sse_events(body: bytes):
+    return [line[6:] for line in body.decode('utf-8').split('\n\n') if line.startswith('data: ')]
+
+
+def test_stream_end_to_end(proxy):
+    status, _, body = post(proxy, {'model': 'DeepSeek-V3-Fast', 'stream': True,
+                                   'messages': [{'role': 'user', 'content': '你好'}]})
+    assert status == 200
+    events = sse_events(body)
+    assert events[-1] == '[DONE]'
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert all(chunk['object'] == 'chat.completion.chunk' for chunk in chunks)
+    content = ''.join(chunk['choices'][0]['delta'].get('content') or '' for chunk in chunks)
+    assert content.startswith('<think>') and '</think>' in content
+
+
+def test_stream_cache_miss_then_hit(proxy):
+    body = {'model': 'DeepSeek-V3-Fast', 'stream': True, 'temperature': 0,
+            'messages': [{'role': 'user', 'content': '缓存测试'}]}
+    status, headers, first = post(proxy, body)
+    assert status == 200 and headers.get('X-Cache') == 'MISS'
+    status, headers, second = post(proxy, body)
+    assert status == 200 and headers.get('X-Cache') == 'HIT'
+    assert sse_events(second)[-1] == '[DONE]'
+
+    def content(raw):
+        chunks = [json.loads(event) for event in sse_events(raw)[:-1]]
+        return ''.join(chunk['choices'][0]['delta'].get('content') or '' for chunk in chunks)
+
+    assert content(second) == content(first)
@@ -0,0 +1,400 @@
+"""
+请求追踪：每个 /v1/chat/completions 请求一棵 span 树，按 OTLP JSON 格式写入文件
+
+TRACE_SAMPLE_RATE 大于 0 时启用，按比例采样；带有已采样 traceparent 头的请求总是记录，
+并沿用调用方的 trace id。未采样的请求使用空实现，开销只有几次空方法调用。
+导出文件每行一个 ExportTraceServiceRequest，可直接交给 OpenTelemetry Collector 的 otlpjsonfile 接收器。
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0))  # 0 表示关闭追踪
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', 'traces.jsonl')
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'sophnet2api')
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', 1000))  # 导出队列满时丢弃新的 trace
+
+# OTLP span kind / status code
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """一个计时区间；可作为上下文管理器使用，异常时标记为错误"""
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'events', 'status')
+    recording = True
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: Optional[str],
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.events: List[tuple] = []
+        self.status: Optional[str] = None  # 错误信息，None 表示正常
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def event(self, name: str):
+        self.events.append((time.time_ns(), name))
+
+    def error(self, message: str):
+        self.status = message
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def __enter__(self) -> 'Span':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.error(str(exc))
+        self.end()
+        return False
+
+    def to_otlp(self) -> Dict:
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': STATUS_ERROR, 'message': self.status} if self.status else {'code': STATUS_OK},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.events:
+            span['events'] = [{'timeUnixNano': str(ts), 'name': name} for ts, name in self.events]
+        return span
+
+
+class Trace:
+    """一次请求的 span 树，finish() 后交给导出线程"""
+    sampled = True
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_span_id: Optional[str] = None,
+                 attributes: Optional[Dict] = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.root = Span(self, name, parent_span_id, SPAN_KIND_SERVER, attributes)
+        self.spans: List[Span] = [self.root]
+        self.finished = False
+
+    def span(self, name: str, parent: Optional[Span] = None, attributes: Optional[Dict] = None,
+             kind: int = SPAN_KIND_INTERNAL) -> Span:
+        span = Span(self, name, (parent or self.root).span_id, kind, attributes)
+        self.spans.append(span)
+        return span
+
+    def finish(self):
+        """结束根 span 并导出（重复调用无效）"""
+        if self.finished:
+            return
+        self.finished = True
+        self.root.end()
+        exporter.export(self)
+
+
+class _NoopSpan:
+    """未采样请求使用的空 span"""
+    recording = False
+    span_id = None
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount):
+        pass
+
+    def event(self, name):
+        pass
+
+    def error(self, message):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _NoopTrace:
+    sampled = False
+    trace_id = None
+    root = _NoopSpan()
+
+    def span(self, name, parent=None, attributes=None, kind=SPAN_KIND_INTERNAL):
+        return self.root
+
+    def finish(self):
+        pass
+
+
+NOOP_SPAN = _NoopTrace.root
+NOOP_TRACE = _NoopTrace()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """解析 W3C traceparent 头，返回 (trace_id, parent_span_id, sampled)"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, attributes: Optional[Dict] = None):
+    """开始一次请求追踪；未启用或未采样时返回 NOOP_TRACE"""
+    if TRACE_SAMPLE_RATE <= 0:
+        return NOOP_TRACE
+    parent = parse_traceparent(traceparent)
+    if parent and parent[2]:
+        return Trace(name, parent[0], parent[1], attributes)
+    if random.random() < TRACE_SAMPLE_RATE:
+        return Trace(name, attributes=attributes)
+    return NOOP_TRACE
+
+
+def _elapsed_ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 3)
+
+
+def timed_input(iterable: Iterable, span, started: Optional[float] = None) -> Iterable:
+    """统计从上游读取的耗时和字节数；started（time.perf_counter()）用于计算首字节耗时"""
+    if not span.recording:
+        return iterable
+    return _timed_input(iterable, span, started)
+
+
+def _timed_input(iterable, span, started):
+    iterator = iter(iterable)
+    read_seconds = 0.0
+    received = 0
+    try:
+        while True:
+            t = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                read_seconds += time.perf_counter() - t
+                return
+            read_seconds += time.perf_counter() - t
+            if not received and started is not None:
+                span.set('upstream.ttfb_ms', _elapsed_ms(started))
+            received += len(item) + 1
+            yield item
+    finally:
+        span.set('upstream.read_ms', round(read_seconds * 1000, 3))
+        span.set('upstream.bytes', received)
+
+
+def atimed_input(iterable: AsyncIterator, span, started: Optional[float] = None) -> AsyncIterator:
+    """timed_input 的异步版本"""
+    if not span.recording:
+        return iterable
+    return _atimed_input(iterable, span, started)
+
+
+async def _atimed_input(iterable, span, started):
+    iterator = iterable.__aiter__()
+    read_seconds = 0.0
+    received = 0
+    try:
+        while True:
+            t = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                read_seconds += time.perf_counter() - t
+                return
+            read_seconds += time.perf_counter() - t
+            if not received and started is not None:
+                span.set('upstream.ttfb_ms', _elapsed_ms(started))
+            received += len(item) + 1
+            yield item
+    finally:
+        span.set('upstream.read_ms', round(read_seconds * 1000, 3))
+        span.set('upstream.bytes', received)
+
+
+def trace_stream(generator: Iterable, trace, span) -> Iterable:
+    """包装输出给客户端的生成器：统计写出字节数和等待客户端消费的耗时（背压），结束时导出 trace"""
+    if not span.recording:
+        return generator
+    return _trace_stream(generator, trace, span)
+
+
+def _trace_stream(generator, trace, span):
+    client_seconds = 0.0
+    sent = chunks = 0
+    try:
+        for chunk in generator:
+            sent += len(chunk)
+            chunks += 1
+            t = time.perf_counter()
+            yield chunk
+            client_seconds += time.perf_counter() - t
+    except GeneratorExit:
+        span.error('client disconnected')
+        raise
+    finally:
+        close = getattr(generator, 'close', None)
+        if close:
+            close()
+        _finish_stream(trace, span, sent, chunks, client_seconds)
+
+
+def atrace_stream(generator: AsyncIterator, trace, span) -> AsyncIterator:
+    """trace_stream 的异步版本"""
+    if not span.recording:
+        return generator
+    return _atrace_stream(generator, trace, span)
+
+
+async def _atrace_stream(generator, trace, span):
+    client_seconds = 0.0
+    sent = chunks = 0
+    try:
+        async for chunk in generator:
+            sent += len(chunk)
+            chunks += 1
+            t = time.perf_counter()
+            yield chunk
+            client_seconds += time.perf_counter() - t
+    except GeneratorExit:
+        span.error('client disconnected')
+        raise
+    finally:
+        aclose = getattr(generator, 'aclose', None)
+        if aclose:
+            await aclose()
+        _finish_stream(trace, span, sent, chunks, client_seconds)
+
+
+def _finish_stream(trace, span, sent: int, chunks: int, client_seconds: float):
+    span.set('client.bytes', sent)
+    span.set('client.chunks', chunks)
+    span.set('client.write_ms', round(client_seconds * 1000, 3))
+    span.end()
+    if span.status:
+        trace.root.error(span.status)
+    trace.finish()
+
+
+class FileSpanExporter:
+    """后台线程把完成的 trace 追加写入 JSON Lines 文件"""
+
+    def __init__(self, path: str, service_name: str, max_queue: int = TRACE_QUEUE_SIZE):
+        self.path = path
+        self.service_name = service_name
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.thread: Optional[threading.Thread] = None
+        self.start_lock = threading.Lock()
+        self.stats = {'exported': 0, 'dropped': 0, 'errors': 0}
+
+    def export(self, trace: Trace):
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self.thread.start()
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _encode(self, trace: Trace) -> str:
+        return json.dumps({'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({
+                'service.name': self.service_name,
+                'process.pid': os.getpid(),
+            })},
+            'scopeSpans': [{
+                'scope': {'name': 'sophnet2api.tracing'},
+                'spans': [span.to_otlp() for span in trace.spans],
+            }],
+        }]}, ensure_ascii=False, separators=(',', ':'))
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8') as output:
+            while True:
+                trace = self.queue.get()
+                if trace is None:
+                    break
+                try:
+                    output.write(self._encode(trace) + '\n')
+                    self.stats['exported'] += 1
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.warning(f"导出 trace 失败: {e}")
+                if self.queue.empty():
+                    output.flush()
+
+    def shutdown(self, timeout: float = 5.0):
+        """写完队列中剩余的 trace"""
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+        self.thread = None
+
+    def get_status(self) -> Dict:
+        return {
+            'sample_rate': TRACE_SAMPLE_RATE,
+            'export_path': self.path if TRACE_SAMPLE_RATE > 0 else None,
+            **self.stats,
+        }
+
+
+exporter = FileSpanExporter(TRACE_EXPORT_PATH, TRACE_SERVICE_NAME)
+atexit.register(exporter.shutdown)
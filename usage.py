@@ -0,0 +1,272 @@
+"""
+用量统计：优先使用上游的 usage 帧，没有时用本地分词器对流式 delta 增量计数
+
+分词器（USAGE_TOKENIZER）：
+    estimate    不依赖第三方库的估算：CJK 字符每字 1 个 token，其余每 4 个字符 1 个 token
+    tiktoken    使用 tiktoken，编码由 USAGE_TIKTOKEN_ENCODING 指定（默认 cl100k_base）
+    hf          使用 tokenizers 加载 USAGE_TOKENIZER_PATH 指定的 tokenizer.json
+多轮对话的 prompt 按消息前缀的哈希链缓存累计 token 数，历史消息只分词一次。
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from metrics import Counter
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    from tokenizers import Tokenizer as HFTokenizer
+except ImportError:
+    HFTokenizer = None
+
+logger = logging.getLogger(__name__)
+
+USAGE_TOKENIZER = os.getenv('USAGE_TOKENIZER', 'estimate')
+USAGE_TIKTOKEN_ENCODING = os.getenv('USAGE_TIKTOKEN_ENCODING', 'cl100k_base')
+USAGE_TOKENIZER_PATH = os.getenv('USAGE_TOKENIZER_PATH', '')
+USAGE_PROMPT_CACHE_SIZE = int(os.getenv('USAGE_PROMPT_CACHE_SIZE', 10000))
+
+# 每条消息的格式开销（角色、分隔符）和回复的起始开销，与 OpenAI 的计算方式一致
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+# 增量计数积累到 MIN_FLUSH_CHARS 个字符后在最后一个空白处切分；没有空白的文本（中文等）积累到 MAX_PENDING_CHARS 后直接计数
+MIN_FLUSH_CHARS = 64
+MAX_PENDING_CHARS = 256
+
+USAGE_TOKENS_TOTAL = Counter(
+    'sophnet_usage_tokens_total', '返回给客户端的 usage 中的 token 数', ['model', 'type', 'source']
+)
+
+
+class EstimateTokenizer:
+    """不依赖第三方库的估算"""
+    name = 'estimate'
+
+    _CJK_RE = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cjk = len(self._CJK_RE.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+
+class TiktokenTokenizer:
+    name = 'tiktoken'
+
+    def __init__(self, encoding: str = USAGE_TIKTOKEN_ENCODING):
+        self.encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+class HuggingFaceTokenizer:
+    name = 'hf'
+
+    def __init__(self, path: str = USAGE_TOKENIZER_PATH):
+        self.tokenizer = HFTokenizer.from_file(path)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def create_tokenizer(name: str = USAGE_TOKENIZER):
+    """按名称创建分词器，依赖未安装或加载失败时回退到 estimate"""
+    try:
+        if name == 'tiktoken':
+            if tiktoken is None:
+                logger.warning("未安装 tiktoken，用量统计回退到 estimate")
+            else:
+                return TiktokenTokenizer()
+        elif name == 'hf':
+            if HFTokenizer is None or not USAGE_TOKENIZER_PATH:
+                logger.warning("未安装 tokenizers 或未设置 USAGE_TOKENIZER_PATH，用量统计回退到 estimate")
+            else:
+                return HuggingFaceTokenizer()
+    except Exception as e:
+        logger.warning(f"加载分词器 {name} 失败，用量统计回退到 estimate: {e}")
+    return EstimateTokenizer()
+
+
+def message_text(message: Dict) -> str:
+    """消息中的文本；多模态消息只取 text 部分"""
+    content = message.get('content') or ''
+    if isinstance(content, list):
+        return ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return str(content)
+
+
+class IncrementalCounter:
+    """按空白边界增量分词：只对已经完整的部分计数，末尾可能和下一个 delta 连成一个 token 的部分留到下次"""
+    __slots__ = ('count', 'pending', 'tokens')
+
+    def __init__(self, count: Callable[[str], int]):
+        self.count = count
+        self.pending = ''
+        self.tokens = 0
+
+    def feed(self, text: str):
+        pending = self.pending + text
+        if len(pending) < MIN_FLUSH_CHARS:
+            self.pending = pending
+            return
+        cut = max(pending.rfind(' '), pending.rfind('\n'))
+        if cut > 0:
+            # 空白归入后面的词（BPE 分词器的切分方式）
+            self.tokens += self.count(pending[:cut])
+            pending = pending[cut:]
+        elif len(pending) > MAX_PENDING_CHARS:
+            self.tokens += self.count(pending)
+            pending = ''
+        self.pending = pending
+
+    def total(self) -> int:
+        return self.tokens + self.count(self.pending)
+
+
+class PromptTokenCache:
+    """prompt token 数缓存：key 为消息前缀的哈希链，value 为该前缀的累计 token 数
+
+    多轮对话每次请求都带着完整历史，已经出现过的前缀直接命中，只有新增的消息需要分词。
+    """
+
+    def __init__(self, tokenizer, max_entries: int = USAGE_PROMPT_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[bytes, int]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def message_tokens(self, message: Dict) -> int:
+        tokens = TOKENS_PER_MESSAGE + self.tokenizer.count(message.get('role', ''))
+        tokens += self.tokenizer.count(message_text(message))
+        if message.get('name'):
+            tokens += self.tokenizer.count(message['name']) + 1
+        return tokens
+
+    def count(self, messages: List[Dict]) -> int:
+        total = 0
+        digest = b''
+        for message in messages:
+            key = f"{message.get('role', '')}\x00{message.get('name') or ''}\x00{message_text(message)}"
+            digest = hashlib.blake2b(digest + key.encode('utf-8'), digest_size=16).digest()
+            with self.lock:
+                cached = self.entries.get(digest)
+                if cached is not None:
+                    self.entries.move_to_end(digest)
+                    self.stats['hits'] += 1
+            if cached is None:
+                cached = total + self.message_tokens(message)
+                with self.lock:
+                    self.stats['misses'] += 1
+                    self.entries[digest] = cached
+                    if len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            total = cached
+        return total + TOKENS_PER_REPLY
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {'entries': len(self.entries), **self.stats}
+
+
+class UsageAccountant:
+    """一次响应的用量：收到上游 usage 帧时使用上游的数字，否则使用本地增量计数"""
+
+    def __init__(self, meter: 'UsageMeter', model: str, messages: List[Dict]):
+        self.meter = meter
+        self.model = model
+        self.messages = messages
+        self.content = IncrementalCounter(meter.tokenizer.count)
+        self.reasoning = IncrementalCounter(meter.tokenizer.count)
+        self.upstream: Optional[Dict] = None
+        self._usage: Optional[Dict] = None
+
+    def feed(self, content: str = '', reasoning: str = ''):
+        if content:
+            self.content.feed(content)
+        if reasoning:
+            self.reasoning.feed(reasoning)
+
+    def observe(self, usage: Dict):
+        """记录上游的 usage 帧"""
+        self.upstream = usage
+
+    def result(self) -> Dict:
+        """OpenAI 格式的 usage（第一次调用时计算并计入统计，之后返回同一个结果）"""
+        if self._usage is not None:
+            return self._usage
+        upstream = self.upstream or {}
+        details = upstream.get('completion_tokens_details') or {}
+        source = 'upstream' if upstream.get('completion_tokens') is not None else 'local'
+
+        if source == 'upstream':
+            completion_tokens = upstream['completion_tokens']
+            reasoning_tokens = details.get('reasoning_tokens', 0)
+        else:
+            reasoning_tokens = details.get('reasoning_tokens') or self.reasoning.total()
+            completion_tokens = self.content.total() + reasoning_tokens
+        prompt_tokens = upstream.get('prompt_tokens')
+        if prompt_tokens is None:
+            prompt_tokens = self.meter.prompt_cache.count(self.messages)
+
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        if reasoning_tokens:
+            usage['completion_tokens_details'] = {'reasoning_tokens': reasoning_tokens}
+        self._usage = usage
+        self.meter.record(self.model, usage, source)
+        return usage
+
+
+class UsageMeter:
+    """分词器、prompt 缓存和统计"""
+
+    def __init__(self, tokenizer=None, prompt_cache_size: int = USAGE_PROMPT_CACHE_SIZE):
+        self.tokenizer = tokenizer or create_tokenizer()
+        self.prompt_cache = PromptTokenCache(self.tokenizer, prompt_cache_size)
+        self.lock = threading.Lock()
+        self.stats = {'upstream': 0, 'local': 0}
+
+    def accountant(self, model: str, messages: List[Dict]) -> UsageAccountant:
+        return UsageAccountant(self, model, messages)
+
+    def usage_for_text(self, model: str, messages: List[Dict], content: str, reasoning: str = '',
+                       upstream: Optional[Dict] = None) -> Dict:
+        """已有完整文本时（非流式、缓存命中）计算 usage"""
+        accountant = self.accountant(model, messages)
+        if upstream:
+            accountant.observe(upstream)
+        else:
+            accountant.content.tokens = self.tokenizer.count(content)
+            accountant.reasoning.tokens = self.tokenizer.count(reasoning)
+        return accountant.result()
+
+    def record(self, model: str, usage: Dict, source: str):
+        with self.lock:
+            self.stats[source] += 1
+        USAGE_TOKENS_TOTAL.labels(model, 'prompt', source).inc(usage['prompt_tokens'])
+        USAGE_TOKENS_TOTAL.labels(model, 'completion', source).inc(usage['completion_tokens'])
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        return {'tokenizer': self.tokenizer.name, 'prompt_cache': self.prompt_cache.get_status(), **stats}